@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Check that "sw help" and "sw complete" start quickly. Each command is run
+# with "python3 -X importtime" and fails the check if it imports one of the
+# heavy modules below or if the Site Wrangler imports take longer than the
+# budget. The commands run from a temporary copy of bin so that the settings
+# and caches they create do not end up in this install.
+# Usage: check_startup.py [budget_ms]
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+budget_ms = 50
+
+# modules that are only needed once a command actually runs
+heavy_modules = ['requests', 'urllib3', 'inquirer', 'blessed', 'mysql', 'iptc', 'dateutil', 'psutil']
+
+bin_path = os.path.dirname(os.path.abspath(__file__))
+
+# CLI arguments and the command line bash passes to completions
+scenarios = [
+    [['help'], ''],
+    [['complete', 'sw', '', 'sw'], 'sw '],
+    [['complete', 'sw', '', 'build'], 'sw build '],
+    [['complete', 'sw', 'ru', 'build'], 'sw build ru']
+]
+
+def import_times(script, args, comp_line):
+    """
+    Run sitewrangler.py with import timing and get the cumulative import time
+    of every top level module.
+
+    Args:
+        script - The path to sitewrangler.py
+        args - An array of CLI arguments for sitewrangler.py
+        comp_line - The command line being completed
+    """
+    env = dict(os.environ)
+    env['COMP_LINE'] = comp_line
+    env['COMP_POINT'] = str(len(comp_line))
+    result = subprocess.run([sys.executable, '-X', 'importtime', script] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+    times = {}
+    for line in result.stderr.split('\n'):
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        times[name.strip()] = (int(parts[1]), not name.startswith('  '))
+    return times
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        budget_ms = int(sys.argv[1])
+    failed = False
+    # sitewrangler.py uses the directory above it as the install path
+    install_path = tempfile.mkdtemp(prefix='sw-startup-')
+    shutil.copytree(bin_path, install_path + '/bin', ignore=shutil.ignore_patterns('__pycache__'))
+    script = install_path + '/bin/sitewrangler.py'
+    results = []
+    try:
+        for args, comp_line in scenarios:
+            results.append([args, import_times(script, args, comp_line)])
+    finally:
+        shutil.rmtree(install_path)
+    for args, times in results:
+        own_us = 0
+        for name, (cumulative, top_level) in times.items():
+            if top_level and name.split('.')[0] in ['libsw', 'commands']:
+                own_us += cumulative
+        loaded = [name for name in times if name.split('.')[0] in heavy_modules]
+        label = 'sw ' + ' '.join(args)
+        status = 'ok'
+        if own_us > budget_ms * 1000:
+            status = 'over budget'
+            failed = True
+        if len(loaded) > 0:
+            status = 'imports ' + ', '.join(sorted(set(name.split('.')[0] for name in loaded)))
+            failed = True
+        print(label.ljust(28) + str(round(own_us / 1000, 1)).rjust(7) + 'ms  ' + status)
+    if failed:
+        sys.exit(1)
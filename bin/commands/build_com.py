@@ -6,40 +6,93 @@ def _help():
     print('sw build install [slug_list]  # Enable a software package and rund a build for it')
     print('sw build uninstall [slug_list]  # Remove a software package from the system')
     print('sw build disable [slug_list]  # Disable a software package but do not remove it from the system')
-    print('sw build update [force]  # Update softare sources and build anthing that needs building')
-    print('sw build checkupdate  # Check for updates to software sources and print a list of slugs that need updating')
+    print('sw build update [`force`] [`--jobs N`] [`--offline`]  # Update softare sources and build anthing that needs building, running up to N independent builds at once')
+    print('sw build checkupdate [`--refresh`] [`--offline`]  # Print a list of slugs that need updating as of the last background check, or check now with --refresh')
+    print('sw build refreshstatus [`enable|disable`]  # Check for updates and save the results for checkupdate, or refresh them on a schedule')
     print('sw build list  # List all software slugs enabled on the system')
-    print('sw build run [example]  # Rebuild a given (list of) software slug(s) and other software that depends on it')
+    print('sw build versions [`--json`]  # Print the version of every software package')
+    print('sw build run [example] [`--offline`]  # Rebuild a given (list of) software slug(s) and other software that depends on it')
     print('sw build log [example]  # Show the build log for the given software slug')
     print('sw build freeze [slug]  # Prevent a software package from updating to a newer version')
     print('sw build (unfreeze|thaw) [slug]  # Allow a software package to update to a newer version')
     print('sw build list(freeze|frozen)  # List software set to not update')
     print('sw build shell  # Start a shell with environment variables ready to compile')
     print('sw build configure [slug]  # Print the configure command for a package')
+    print('sw build stats [`slug`]  # Show build time trends for all software or for each build phase of one package')
+    print('sw build reindex  # Regenerate the list of avaliable software packages')
+    print('sw build cache (stats|prune)  # Show build cache usage or remove cached install trees beyond the build_cache_size setting')
+    print('sw build mirror (sync|prune)  # Download the source archives of all enabled software or remove archives that are no longer needed')
+    print('  Add --offline to build commands to only use sources already downloaded to the mirror')
 index = command_index.CategoryIndex('build', _help)
 
-def _update(force):
-    if force:
-        force = force.lower()
-        if force != 'force':
-            force = False
-    from libsw import build_queue, build_index
+def _parse_update_args(first, more):
+    """
+    Split the arguments of the update command into the force flag and the
+    number of concurrent build jobs. The --offline flag is applied directly.
+    Both are False if the number of jobs is invalid.
+
+    Args:
+        first - The first CLI argument (False if absent)
+        more - An array of the remaining CLI arguments (False if absent)
+    """
+    from libsw import settings
+    args = []
+    if first:
+        args.append(first)
+    if more:
+        args.extend(more)
+    force = False
+    jobs = settings.get_num('build_jobs')
+    i = 0
+    while i < len(args):
+        arg = args[i].lower()
+        if arg == 'force':
+            force = True
+        elif arg == '--offline':
+            from libsw import source_mirror
+            source_mirror.set_offline()
+        else:
+            value = False
+            if arg == '--jobs' or arg == '-j':
+                i += 1
+                value = args[i] if i < len(args) else ''
+            elif arg.startswith('--jobs='):
+                value = arg[7:]
+            elif arg.startswith('-j'):
+                value = arg[2:]
+            if value != False:
+                if not value.isdigit():
+                    print('Error: the number of jobs must be a whole number, not "' + value + '"')
+                    print('Usage: sw build update [`force`] [`--jobs N`] [`--offline`]')
+                    return False, False
+                jobs = int(value)
+        i += 1
+    if jobs < 1:
+        jobs = 1
+    return force, jobs
+
+def _update(first, more):
+    force, jobs = _parse_update_args(first, more)
+    if jobs == False:
+        return
+    from libsw import build_queue, build_index, update_status
+    build_index.Index().refresh()
     queue = build_queue.new_queue(force)
     build_index.populate_enabled(queue)
     build_index.populate_dependant_builders(queue)
-    if queue.failed():
-        print("One or more builds failed.")
-    elif queue.run() == 0:
-        print("All software is already up-to-date.")
+    if queue.run(jobs) == 0:
+        if queue.failed():
+            print("One or more builds failed.")
+        else:
+            print("All software is already up-to-date.")
+    else:
+        update_status.forget('build')
+        if queue.failed():
+            print("One or more builds failed.")
 index.register_command('update', _update)
 index.register_command('upgrade', _update) # for yum/dnf habits :)
 
-def _checkupdate():
-    from libsw import build_queue, build_index
-    queue = build_queue.new_queue(False)
-    build_index.populate_enabled(queue)
-    build_index.populate_dependant_builders(queue)
-    update_list = queue.run_check()
+def _print_update_list(update_list):
     if len(update_list) == 0:
         print("All software is already up-to-date.")
     else:
@@ -48,37 +101,109 @@ def _checkupdate():
                 print(slug + ' requires an update')
             elif status == 'depend':
                 print(slug + ' requires a rebuild following updates to dependencies')
-index.register_command('checkupdate', _checkupdate)
-index.register_command('check-update', _checkupdate) # for apt habits :)
+
+def _checkupdate(first, more):
+    from libsw import build_queue, build_index, source_mirror, update_status
+    args = []
+    if first:
+        args.append(first)
+    if more:
+        args.extend(more)
+    flags = [arg.lower() for arg in args]
+    if '--offline' in flags:
+        # offline checks only look at the mirror so they are not saved
+        source_mirror.set_offline()
+        build_index.Index().refresh()
+        queue = build_queue.new_queue(False)
+        build_index.populate_enabled(queue)
+        build_index.populate_dependant_builders(queue)
+        _print_update_list(queue.run_check())
+        return
+    snapshot = update_status.read('build')
+    if '--refresh' in flags or not snapshot:
+        snapshot = update_status.check_builds()
+    else:
+        note = 'Checked ' + update_status.format_age(snapshot)
+        if update_status.is_stale(snapshot):
+            update_status.refresh_in_background()
+            note += ', refreshing in the background'
+        print(note + ' (use --refresh to check now)')
+    update_list = []
+    for entry in snapshot['entries']:
+        if entry['status'] in ['update', 'depend']:
+            update_list.append([entry['slug'], entry['status']])
+    _print_update_list(update_list)
+
+def _checkupdate_autocomplete(args, end_with_space):
+    for flag in ['--refresh', '--offline']:
+        if flag.startswith(args[-1]) and flag not in args[:-1]:
+            print(flag)
+index.register_command('checkupdate', _checkupdate, autocomplete=_checkupdate_autocomplete)
+index.register_command('check-update', _checkupdate, autocomplete=_checkupdate_autocomplete) # for apt habits :)
+
+def _refreshstatus(action):
+    from libsw import update_status, logger
+    if action == 'enable':
+        update_status.enable_refresher(logger.Log())
+    elif action == 'disable':
+        update_status.disable_refresher(logger.Log())
+    elif not update_status.refresh():
+        print('An update status refresh is already running')
+
+def _refreshstatus_autocomplete(args, end_with_space):
+    if len(args) > 1:
+        return
+    for action in ['enable', 'disable']:
+        if action.startswith(args[0].lower()):
+            print(action)
+index.register_command('refreshstatus', _refreshstatus, autocomplete=_refreshstatus_autocomplete)
 
 def _avaliable_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import build_index
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    slug_list = build_index.registered_slugs()
+    slug_list = completion_cache.get('slugs')
     for possible_slug in slug_list:
         if possible_slug[:length] == slug:
             print(possible_slug)
 
+def _run_autocomplete(args, end_with_space):
+    if len(args) == 1 and len(args[0]) == 0:
+        # offer the software with pending updates from the last update check
+        from libsw import update_status
+        pending = update_status.pending_slugs()
+        if len(pending) > 0:
+            for slug in pending:
+                print(slug)
+            return
+    _avaliable_autocomplete(args, end_with_space)
+
 def _run(first, more):
-    from libsw import build_queue, build_index
+    from libsw import build_queue, build_index, source_mirror, update_status
+    args = []
+    if first:
+        args.append(first)
+    if more:
+        args.extend(more)
     slug_list = []
-    if not first:
+    for arg in args:
+        if arg.lower() == '--offline':
+            source_mirror.set_offline()
+        else:
+            slug_list.append(arg)
+    if len(slug_list) == 0:
         slug_list = build_index.select_slugs('Select software to build')
-    else:
-        slug_list.append(first)
-        if more:
-            for slug in more:
-                slug_list.append(slug)
 
     queue = build_queue.TargetedQueue(slug_list)
     build_index.populate_slug_list(queue, slug_list)
     build_index.populate_dependant_builders(queue)
     if queue.run() == 0:
         print("Unable to build " + slug_list[0])
-index.register_command('run', _run, autocomplete=_avaliable_autocomplete)
+    else:
+        update_status.forget('build')
+index.register_command('run', _run, autocomplete=_run_autocomplete)
 
 def _list():
     from libsw import build_index
@@ -90,11 +215,10 @@ index.register_command('list', _list)
 def _installed_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import build_index
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    slug_list = build_index.get_installed()
-    slug_list = build_index.get_list_with_dependants(slug_list)
+    slug_list = completion_cache.get('installed')
     for possible_slug in slug_list:
         if possible_slug[:length] == slug:
             print(possible_slug)
@@ -124,12 +248,11 @@ def _freeze(slug):
 def _freeze_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import builder, build_index
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    slug_list = build_index.get_installed()
-    slug_list = build_index.get_list_with_dependants(slug_list)
-    frozen_list = builder.list_frozen()
+    slug_list = completion_cache.get('installed')
+    frozen_list = completion_cache.get('frozen')
     for possible_slug in slug_list:
         if possible_slug[:length] == slug:
             if possible_slug not in frozen_list:
@@ -148,10 +271,10 @@ def _unfreeze(slug):
 def _unfreeze_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import build_index, builder
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    frozen_list = builder.list_frozen()
+    frozen_list = completion_cache.get('frozen')
     for possible_slug in frozen_list:
         if possible_slug[:length] == slug:
             print(possible_slug)
@@ -180,12 +303,29 @@ def _version(slug):
     print(builder.version_reference())
 index.register_command('version', _version, autocomplete=_installed_autocomplete)
 
+def _versions(flag):
+    import json
+    from libsw import build_index
+    versions = {}
+    index = build_index.Index()
+    for slug in index.slugs():
+        try:
+            versions[slug] = str(index.get(slug).version_reference()).strip()
+        except Exception:
+            versions[slug] = ''
+    if flag == '--json':
+        print(json.dumps(versions, sort_keys=True))
+    else:
+        for slug in sorted(versions):
+            print(slug + ' ' + versions[slug])
+index.register_command('versions', _versions)
+
 def _install_prebuilt(slug, more):
     if not slug:
         print('Please specify slug being installed')
     if not more:
         print('Please specify version being installed')
-    from libsw import build_index, logger
+    from libsw import build_index, logger, install_manifest
     if not slug:
         slug = build_index.select_slug("Select a package to (re)install it")
     slug = slug.lower()
@@ -193,19 +333,44 @@ def _install_prebuilt(slug, more):
     builder.source_version = more[0]
     with open(builder.log_name(), 'w+') as log_output:
         log = logger.Log(log_output)
+        install_manifest.forget(slug)
         builder.install(log)
+        install_manifest.write(slug, builder.manifest_version(), False, builder.installed_files)
 index.register_command('installprebuilt', _install_prebuilt, autocomplete=_avaliable_autocomplete)
 index.register_command('install-prebuilt', _install_prebuilt, autocomplete=_avaliable_autocomplete)
 
+def _install_artifact(slug):
+    import sys
+    from libsw import build_index, logger, artifact, install_manifest
+    if not slug:
+        print('Please specify slug being installed')
+        sys.exit(1)
+    builder = build_index.get_builder(slug)
+    archive = False
+    if builder and builder.deploys_artifact():
+        archive = artifact.verify(slug)
+    if not archive:
+        print('No valid artifact found for "' + slug + '"')
+        sys.exit(1)
+    manifest = artifact.read_manifest(slug)
+    builder.source_version = manifest['version']
+    with open(builder.log_name(), 'w+') as log_output:
+        log = logger.Log(log_output)
+        install_manifest.forget(slug)
+        builder.cached_install = archive
+        builder.install(log)
+        builder.cached_install = False
+        install_manifest.write(slug, manifest['version'], False, builder.installed_files)
+index.register_command('installartifact', _install_artifact, autocomplete=_avaliable_autocomplete)
+
 def _avaliable_new_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import build_index
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    slug_list = build_index.registered_slugs()
-    installed_list = build_index.get_installed()
-    installed_list = build_index.get_list_with_dependants(installed_list)
+    slug_list = completion_cache.get('slugs')
+    installed_list = completion_cache.get('installed')
     for possible_slug in slug_list:
         if possible_slug in installed_list:
             continue
@@ -250,24 +415,24 @@ def _install(slug, more):
         for entry in slug_list:
             needs_rebuild.extend(build_index.get_dependant_upon(entry))
         if len(needs_rebuild) > 0:
+            failed_file = build_queue.default_failed_file()
+            chain = file_filter.FilterChain(failed_file)
             for rebuild in needs_rebuild:
-                file_filter.AppendUnique(build_queue.default_failed_file, rebuild).run()
+                chain.add(file_filter.AppendUnique(failed_file, rebuild))
+            chain.run()
             print('Some packages must now be rebuilt. Run "sw build update" to build them.')
 index.register_command('install', _install, autocomplete=_avaliable_new_autocomplete)
 
 def _uninstall_autocomplete(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import build_index
+    from libsw import completion_cache
     slug = args[0].lower()
     length = len(slug)
-    slug_list = build_index.registered_slugs()
+    slug_list = completion_cache.get('uninstallable')
     for possible_slug in slug_list:
         if possible_slug[:length] == slug:
-            builder = build_index.get_builder(possible_slug)
-            has_uninstall = hasattr(builder, 'uninstall') and callable(builder.uninstall)
-            if has_uninstall:
-                print(possible_slug)
+            print(possible_slug)
 
 def _uninstall(slug, more):
     from libsw import build_index, logger
@@ -307,7 +472,9 @@ def _uninstall(slug, more):
         builder.uninstall(log)
         build_index.disable_slug(builder.slug)
         builder.cleanup_old_versions(log)
-        os.remove(builder.log_name())
+        log_path = logger.find_file(builder.log_name())
+        if log_path:
+            os.remove(log_path)
 index.register_command('uninstall', _uninstall, autocomplete=_uninstall_autocomplete)
 
 def _disable(slug, more):
@@ -364,3 +531,95 @@ def _configure(slug):
             print(' '.join(command))
 index.register_command('configure', _configure)
 index.register_command('conf', _configure)
+
+
+def _reindex():
+    from libsw import build_index
+    manifest = build_index.reindex()
+    print('Indexed ' + str(len(manifest)) + ' software packages')
+index.register_command('reindex', _reindex)
+
+def _cache(action):
+    from libsw import build_cache
+    if action == 'prune':
+        removed = build_cache.prune()
+        print('Removed ' + str(len(removed)) + ' cached install trees')
+    elif action == 'stats' or action == False:
+        stats = build_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = 0
+        if lookups > 0:
+            hit_rate = stats['hits'] * 100 / lookups
+        print('Entries: ' + str(stats['entries']))
+        print('Size: ' + build_cache.format_size(stats['size']) + ' of ' + build_cache.format_size(stats['limit']))
+        print('Hits: ' + str(stats['hits']) + ', Misses: ' + str(stats['misses']) + (' (%.1f%% hit rate)' % hit_rate))
+        for slug in sorted(stats['slugs']):
+            print('  ' + slug + ': ' + str(stats['slugs'][slug]))
+    else:
+        print('Unknown cache action "' + action + '". Use "stats" or "prune".')
+
+def _cache_autocomplete(args, end_with_space):
+    if len(args) > 1:
+        return
+    action = args[0].lower()
+    for possible in ['stats', 'prune']:
+        if possible[:len(action)] == action:
+            print(possible)
+index.register_command('cache', _cache, autocomplete=_cache_autocomplete)
+
+def _mirror(action):
+    from libsw import source_mirror, logger
+    log = logger.Log()
+    if action == 'sync':
+        failed = source_mirror.sync(log)
+        if len(failed) > 0:
+            print('Unable to mirror ' + ', '.join(failed))
+    elif action == 'prune':
+        removed = source_mirror.prune(log)
+        print('Removed ' + str(len(removed)) + ' source archives')
+    else:
+        print('Unknown mirror action "' + str(action) + '". Use "sync" or "prune".')
+
+def _mirror_autocomplete(args, end_with_space):
+    if len(args) > 1:
+        return
+    action = args[0].lower()
+    for possible in ['sync', 'prune']:
+        if possible[:len(action)] == action:
+            print(possible)
+index.register_command('mirror', _mirror, autocomplete=_mirror_autocomplete)
+
+
+def _stats(slug):
+    from libsw import build_stats
+    from tabulate import tabulate
+    fmt = build_stats.format_seconds
+    if slug:
+        records = build_stats.get_history(slug)
+        if len(records) == 0:
+            print('No build history for "' + slug + '"')
+            return
+        table = []
+        for row in build_stats.summarize_phases(records):
+            flag = 'SLOWER' if row['regression'] else ''
+            table.append([row['phase'], fmt(row['last']), fmt(row['median']), fmt(row['p90']), fmt(row['cpu']), str(row['rss'] // 1024) + 'M', flag])
+        print()
+        print(slug + ' (' + str(len(records)) + ' successful builds, last version ' + records[-1]['version'] + ')')
+        print(tabulate(table, ['Phase', 'Last', 'Median', 'P90', 'Last CPU', 'Peak RSS', '']))
+        print()
+    else:
+        by_slug = {}
+        for record in build_stats.get_history():
+            by_slug.setdefault(record['slug'], []).append(record)
+        if len(by_slug) == 0:
+            print('No build history recorded yet')
+            return
+        table = []
+        for build_slug in sorted(by_slug):
+            summary = build_stats.summarize(by_slug[build_slug])
+            flag = 'SLOWER' if summary['regression'] else ''
+            table.append([build_slug, summary['builds'], fmt(summary['last']), fmt(summary['median']), fmt(summary['p90']), flag])
+        print()
+        print(tabulate(table, ['Package', 'Builds', 'Last', 'Median', 'P90', '']))
+        print()
+index.register_command('stats', _stats, autocomplete=_installed_autocomplete)
@@ -4,7 +4,7 @@ from libsw import input_util, command_index
 
 def _help():
     print('sw deploy update [force]  # Install locally built packages on all production servers that do not use the same package version')
-    print('sw deploy checkupdate  # Check locally built packages against all production servers and list those that do not use the same package version')
+    print('sw deploy checkupdate [`--refresh`]  # Show which production servers do not use the same package versions as this server, as of the last background check')
     print('sw deploy (add|create) [ip_addr]  # Register an IP address as a production server (be sure to authenticate SSH keys first)')
     print('sw deploy (delete|remove) [ip_addr]  # Unregister an IP address as a production server')
     print('sw deploy list  # List all servers set for remote package deployment')
@@ -21,11 +21,17 @@ def _update(force):
 index.register_command('update', _update)
 index.register_command('upgrade', _update) # for yum/dnf habits :)
 
-def _checkupdate():
+def _checkupdate(flag):
     from libsw import deploy
-    deploy.check_deploy()
-index.register_command('checkupdate', _checkupdate)
-index.register_command('check-update', _checkupdate) # for apt habits :)
+    deploy.check_deploy(flag == '--refresh')
+
+def _checkupdate_autocomplete(args, end_with_space):
+    if len(args) > 1:
+        return
+    if '--refresh'.startswith(args[0]):
+        print('--refresh')
+index.register_command('checkupdate', _checkupdate, autocomplete=_checkupdate_autocomplete)
+index.register_command('check-update', _checkupdate, autocomplete=_checkupdate_autocomplete) # for apt habits :)
 
 # def _run(first, more):
 #     from libsw import build_queue, build_index
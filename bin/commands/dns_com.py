@@ -22,8 +22,8 @@ def _domain_autocomplete(args, end_with_space):
         return
     domain = args[0]
     length = len(domain)
-    from libsw import bind
-    for full_domain in bind.get_zone_file_slugs():
+    from libsw import completion_cache
+    for full_domain in completion_cache.get('zones'):
         if full_domain[:length] == domain:
             print(full_domain)
 
@@ -34,8 +34,8 @@ def _disabled_domain_autocomplete(args, end_with_space):
         return
     domain = args[0]
     length = len(domain)
-    from libsw import bind
-    for full_domain in bind.get_disabled_zone_file_slugs():
+    from libsw import completion_cache
+    for full_domain in completion_cache.get('disabled_zones'):
         if full_domain[:length] == domain:
             print(full_domain)
 
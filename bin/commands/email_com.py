@@ -25,8 +25,8 @@ def _add_autocomplete(args, end_with_space):
     address = args[0]
     user, domain = address.split('@', 1)
     dom_len = len(domain)
-    from libsw import email
-    for full_domain in email.get_mail_domains():
+    from libsw import completion_cache
+    for full_domain in completion_cache.get('mail_domains'):
         if full_domain[:dom_len] == domain:
             print(user + '@' + full_domain)
 
@@ -58,8 +58,8 @@ def _address_autocomplete(args, end_with_space):
         return
     address = args[0]
     length = len(address)
-    from libsw import email
-    for full_address in email.get_email_addrs():
+    from libsw import completion_cache
+    for full_address in completion_cache.get('email_addrs'):
         if full_address[:length] == address:
             print(full_address)
 
@@ -70,11 +70,11 @@ def _address_or_domain_autocomplete(args, end_with_space):
         return
     argument = args[0]
     length = len(argument)
-    from libsw import email
-    for full_address in email.get_email_addrs():
+    from libsw import completion_cache
+    for full_address in completion_cache.get('email_addrs'):
         if full_address[:length] == argument:
             print(full_address)
-    for full_domain in email.get_mail_domains():
+    for full_domain in completion_cache.get('mail_domains'):
         if full_domain[:length] == argument:
             print(full_domain)
 
@@ -85,8 +85,8 @@ def _domain_autocomplete(args, end_with_space):
         return
     domain = args[0]
     length = len(domain)
-    from libsw import email
-    for full_domain in email.get_mail_domains():
+    from libsw import completion_cache
+    for full_domain in completion_cache.get('mail_domains'):
         if full_domain[:length] == domain:
             print(full_domain)
 
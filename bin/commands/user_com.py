@@ -23,10 +23,10 @@ index.register_command('create', _add)
 def _autocomplete_remove(args, end_with_space):
     if len(args) > 1:
         return
-    from libsw import user
+    from libsw import completion_cache
     user_part = args[0].lower()
     length = len(user_part)
-    for username in user.get_user_list():
+    for username in completion_cache.get('users'):
         if username[:length] == user_part:
             print(username)
 
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import threading
+from libsw import settings, install_tree
+
+# changed whenever artifacts are packaged differently. Artifacts from before
+# installs were staged also hold the build server's logs and pid files.
+manifest_format = 2
+
+# archive path -> [sha256, size, modification time] of the archives verify()
+# has already hashed, so deploying to several servers hashes each one once
+_verified = {}
+_verified_lock = threading.Lock()
+
+def artifact_dir():
+    """The directory that holds install tree artifacts for deployment."""
+    return settings.get('install_path') + 'var/cache/artifacts/'
+
+def manifest_path(slug):
+    """
+    The path of the manifest that describes the current artifact of a package.
+
+    Args:
+        slug - The slug name of the package
+    """
+    return artifact_dir() + slug + '.json'
+
+def _read_manifest_file(slug):
+    path = manifest_path(slug)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except ValueError:
+        return False
+
+def read_manifest(slug):
+    """
+    Get the manifest of the current artifact of a package, or False if there
+    is none or it is from an older manifest_format. The manifest is a
+    dictionary with the keys format, slug, version, archive, sha256, size,
+    created and files.
+
+    Args:
+        slug - The slug name of the package
+    """
+    manifest = _read_manifest_file(slug)
+    if not manifest or manifest.get('format') != manifest_format:
+        return False
+    return manifest
+
+def create(slug, source_version, file_list, log):
+    """
+    Package the files installed by a build into a compressed artifact that can
+    be deployed to other servers. Artifacts of older versions are removed.
+
+    Args:
+        slug - The slug name of the package
+        source_version - The version that was installed
+        file_list - The array of installed files
+        log - An open log file
+
+    Return:
+        The manifest dictionary or False if there was nothing to package
+    """
+    from libsw import source_mirror
+    if len(file_list) == 0:
+        return False
+    ext = '.tar.zst' if install_tree.zstd_available() else '.tar.gz'
+    archive = slug + '-' + str(source_version) + ext
+    size = install_tree.write_archive(file_list, artifact_dir() + archive)
+    manifest = {
+        'format': manifest_format,
+        'slug': slug,
+        'version': str(source_version),
+        'archive': archive,
+        'sha256': source_mirror.hash_file(artifact_dir() + archive),
+        'size': size,
+        'created': int(time.time()),
+        'files': file_list
+    }
+    previous = _read_manifest_file(slug)
+    path = manifest_path(slug)
+    with open(path + '.part', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(path + '.part', path)
+    if previous and previous['archive'] != archive and os.path.exists(artifact_dir() + previous['archive']):
+        os.remove(artifact_dir() + previous['archive'])
+    log.log('Packaged ' + str(len(file_list)) + ' installed files as ' + archive)
+    return manifest
+
+def verify(slug):
+    """
+    Get the path of a package's artifact if it exists and matches the
+    checksum in it's manifest, otherwise False. An archive is only hashed again
+    if it changed since it was last verified.
+
+    Args:
+        slug - The slug name of the package
+    """
+    from libsw import source_mirror
+    manifest = read_manifest(slug)
+    if not manifest:
+        return False
+    path = artifact_dir() + manifest['archive']
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    key = [manifest['sha256'], stat.st_size, stat.st_mtime_ns]
+    with _verified_lock:
+        if _verified.get(path) == key:
+            return path
+        if source_mirror.hash_file(path) != manifest['sha256']:
+            return False
+        _verified[path] = key
+    return path
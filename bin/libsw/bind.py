@@ -4,10 +4,8 @@ import subprocess
 import re
 import datetime
 import glob
-import dateutil.parser
-import inquirer
 import os
-from libsw import file_filter, email, settings, input_util, service
+from libsw import file_filter, email, settings, input_util, service, completion_cache
 
 zone_folder = '/etc/bind/zones/'
 
@@ -79,6 +77,7 @@ def select_disabled_zone(query_message):
         query_message - The message to display to the user when asking for the
                     zone.
     """
+    import inquirer
     questions = [
         inquirer.List('f',
                     message=query_message,
@@ -97,6 +96,7 @@ def select_main_domain(query_message):
         query_message - The message to display to the user when asking for the
                     zone.
     """
+    import inquirer
     questions = [
         inquirer.List('f',
                     message=query_message,
@@ -258,6 +258,7 @@ def make_zone(domain):
             line = line.replace('PUBLIC_IPP', ip, 10000)
             line = line.replace('IPV66', ip6, 10000)
             zone.write(line)
+    completion_cache.invalidate('zones')
 
 def enable_zone(domain):
     """
@@ -269,6 +270,7 @@ def enable_zone(domain):
     target = zone_filename(domain)
     source = target + '.disabled'
     os.rename(source, target)
+    completion_cache.invalidate('zones', 'disabled_zones')
     rebuild_zone_index()
     return True
 
@@ -283,6 +285,7 @@ def disable_zone(domain):
     source = zone_filename(domain)
     target = source + '.disabled'
     os.rename(source, target)
+    completion_cache.invalidate('zones', 'disabled_zones')
     rebuild_zone_index()
     return True
 
@@ -304,6 +307,7 @@ def remove_zone(domain):
         os.remove(disabled_path)
         removed = True
     if removed:
+        completion_cache.invalidate('zones', 'disabled_zones')
         rebuild_zone_index()
     return removed
 
@@ -332,6 +336,7 @@ def check_expiration(email_admin=False):
     Args:
         email_admin - A boolean flag to dictate wether or not to send an email to the system administrator of any domains that are expired or about to expire
     """
+    import dateutil.parser
     domains = get_zone_file_slugs()
     now = datetime.datetime.now(datetime.timezone.utc)
     output = ''
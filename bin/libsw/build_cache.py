@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from libsw import settings
+
+# changed whenever cached install trees are recorded differently. Entries
+# from before installs were staged also hold logs and pid files.
+key_format = 2
+
+# environment variables that change the output of a build
+key_env_vars = [
+    'CC',
+    'CXX',
+    'CFLAGS',
+    'CXXFLAGS',
+    'CPPFLAGS',
+    'LDFLAGS',
+    'LD_LIBRARY_PATH',
+    'PKG_CONFIG_PATH',
+    'MODSECURITY_LIB',
+    'MODSECURITY_INC'
+]
+
+def cache_dir():
+    """The directory that holds cached install trees."""
+    return settings.get('install_path') + 'var/cache/build/'
+
+def _index_file():
+    return cache_dir() + 'index.json'
+
+@contextmanager
+def _locked_index():
+    """
+    Open the cache index for modification. A lock is held while the index is
+    open so that concurrent builds do not lose each other's entries.
+    """
+    os.makedirs(cache_dir(), exist_ok=True)
+    with open(cache_dir() + 'index.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = _read_index()
+        yield index
+        temp_file = _index_file() + '.part'
+        with open(temp_file, 'w') as out:
+            json.dump(index, out)
+        os.replace(temp_file, _index_file())
+
+def _read_index():
+    index = {}
+    if os.path.exists(_index_file()):
+        with open(_index_file()) as index_file:
+            index = json.load(index_file)
+    index.setdefault('entries', {})
+    index.setdefault('current', {})
+    index.setdefault('hits', 0)
+    index.setdefault('misses', 0)
+    return index
+
+def parse_size(size):
+    """
+    Convert a size string such as "4G" or "500M" into a number of bytes.
+
+    Args:
+        size - The size string
+    """
+    size = str(size).strip().upper()
+    if size.endswith('B'):
+        size = size[:-1]
+    multiplier = 1
+    for suffix, value in [['K', 1024], ['M', 1024 ** 2], ['G', 1024 ** 3], ['T', 1024 ** 4]]:
+        if size.endswith(suffix):
+            multiplier = value
+            size = size[:-1]
+            break
+    return int(float(size) * multiplier)
+
+def format_size(size):
+    """
+    Convert a number of bytes into a human readable string.
+
+    Args:
+        size - The number of bytes
+    """
+    for suffix in ['B', 'K', 'M', 'G']:
+        if size < 1024:
+            return ('%.1f' % size) + suffix
+        size /= 1024
+    return ('%.1f' % size) + 'T'
+
+def _hash_file(hasher, path):
+    if os.path.isfile(path):
+        with open(path, 'rb') as data:
+            for chunk in iter(lambda: data.read(65536), b''):
+                hasher.update(chunk)
+    else:
+        hasher.update(b'missing')
+
+def get_key(builder, command, log):
+    """
+    Calculate the cache key for a build. The key covers the source version,
+    the resolved configure command, the applied patches, the build environment
+    and the cache keys of the builder's dependencies.
+
+    Args:
+        builder - The builder being built
+        command - The configure command array with all variables applied
+        log - An open log to write to
+    """
+    hasher = hashlib.sha256()
+    hasher.update(('format:' + str(key_format) + '\n').encode())
+    hasher.update(('slug:' + builder.slug + '\n').encode())
+    hasher.update(('source:' + str(builder.source_fingerprint()) + '\n').encode())
+    hasher.update(('configure:' + '\0'.join(command) + '\n').encode())
+    patch_dir = settings.get('install_path') + 'var/cache/patches/' + builder.slug + '/'
+    for name, url in builder.get_patches(log):
+        hasher.update(('patch:' + name + ' ' + url + '\n').encode())
+        _hash_file(hasher, patch_dir + name)
+    env = builder.get_build_env()
+    for name in key_env_vars:
+        if name in env:
+            value = env[name]
+            # compiling through ccache does not change the build output
+            if value.split(' ')[0].endswith('ccache'):
+                value = value.split(' ', 1)[1]
+            hasher.update(('env:' + name + '=' + value + '\n').encode())
+    current = _read_index()['current']
+    for slug in sorted(builder.dependencies()):
+        dep_key = current.get(slug, '')
+        hasher.update(('dependency:' + slug + '=' + dep_key + '\n').encode())
+    return hasher.hexdigest()
+
+def lookup(key):
+    """
+    Get the path to the cached install tree for a key, or False if the key is
+    not cached. Hits and misses are counted for "sw build cache stats".
+
+    Args:
+        key - A key from get_key()
+    """
+    with _locked_index() as index:
+        entry = index['entries'].get(key)
+        path = cache_dir() + key + '.tar.gz'
+        if entry and os.path.exists(path):
+            entry['used'] = time.time()
+            index['hits'] += 1
+            return path
+        if entry:
+            del index['entries'][key]
+        index['misses'] += 1
+    return False
+
+def store(slug, key, file_list, log):
+    """
+    Store the files installed by a build in the cache and prune the cache if it
+    has grown past the build_cache_size setting.
+
+    Args:
+        slug - The slug name of the software that was built
+        key - A key from get_key()
+        file_list - The array of installed files
+        log - An open log to write to
+    """
+    from libsw import install_tree
+    if len(file_list) == 0:
+        return False
+    path = cache_dir() + key + '.tar.gz'
+    size = install_tree.write_archive(file_list, path)
+    now = time.time()
+    with _locked_index() as index:
+        index['entries'][key] = {'slug': slug, 'size': size, 'created': now, 'used': now}
+    log.log('Stored ' + str(len(file_list)) + ' installed files in the build cache (' + format_size(size) + ')')
+    prune()
+    return True
+
+def set_current_key(slug, key):
+    """
+    Record the cache key of the last successful build of a slug so that
+    dependent software can include it in their own keys.
+
+    Args:
+        slug - The slug name of the software that was built
+        key - A key from get_key()
+    """
+    with _locked_index() as index:
+        index['current'][slug] = key
+
+def prune(max_size=False):
+    """
+    Remove the least recently used install trees until the cache fits within
+    the given size.
+
+    Args:
+        max_size - (optional) The size limit in bytes, defaults to the
+            build_cache_size setting
+    """
+    if max_size == False:
+        max_size = parse_size(settings.get('build_cache_size'))
+    removed = []
+    with _locked_index() as index:
+        entries = index['entries']
+        total = 0
+        for key in entries:
+            total += entries[key]['size']
+        for key in sorted(entries, key=lambda k: entries[k]['used']):
+            if total <= max_size:
+                break
+            total -= entries[key]['size']
+            path = cache_dir() + key + '.tar.gz'
+            if os.path.exists(path):
+                os.remove(path)
+            removed.append(key)
+        for key in removed:
+            del entries[key]
+    return removed
+
+def stats():
+    """
+    Get a dictionary describing the current state of the build cache with the
+    keys: entries, size, limit, hits, misses, slugs
+    """
+    index = _read_index()
+    size = 0
+    slugs = {}
+    for key, entry in index['entries'].items():
+        size += entry['size']
+        slugs[entry['slug']] = slugs.get(entry['slug'], 0) + 1
+    return {
+        'entries': len(index['entries']),
+        'size': size,
+        'limit': parse_size(settings.get('build_cache_size')),
+        'hits': index['hits'],
+        'misses': index['misses'],
+        'slugs': slugs
+    }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+class BuildGraph():
+    """
+    A dependency graph of builders. Each builder's dependencies() is only
+    called once, when the graph is created. Transitive lookups are cached.
+    """
+    def __init__(self, builders):
+        """
+        Create a dependency graph.
+
+        Args:
+            builders - An iterable of builders to include in the graph
+        """
+        # slug -> builder
+        self.nodes = {}
+        # slug -> slugs of the software it depends on
+        self.forward = {}
+        # slug -> slugs of the software that depends on it
+        self.reverse = {}
+        self._dependency_closure = {}
+        self._dependant_closure = {}
+        for builder in builders:
+            if builder.slug not in self.nodes:
+                self.nodes[builder.slug] = builder
+                self.forward[builder.slug] = list(builder.dependencies())
+                self.reverse[builder.slug] = []
+        for slug, deps in self.forward.items():
+            for dep in deps:
+                if dep in self.reverse:
+                    self.reverse[dep].append(slug)
+
+    def missing(self):
+        """
+        Get an array of [slug, dependency] pairs where the dependency is not
+        part of the graph.
+        """
+        missing = []
+        for slug, deps in self.forward.items():
+            for dep in deps:
+                if dep not in self.nodes:
+                    missing.append([slug, dep])
+        return missing
+
+    def topological_order(self):
+        """
+        Get the slugs in the graph ordered so that all software is preceded by
+        it's dependencies. Software keeps it's original order where possible.
+        Returns False if the order can not be resolved; see find_loop() and
+        missing() for the reason.
+        """
+        remaining = {}
+        for slug, deps in self.forward.items():
+            remaining[slug] = len(deps)
+        ready = deque()
+        for slug in self.nodes:
+            if remaining[slug] == 0:
+                ready.append(slug)
+        order = []
+        while len(ready) > 0:
+            slug = ready.popleft()
+            order.append(slug)
+            for dependant in self.reverse[slug]:
+                remaining[dependant] -= 1
+                if remaining[dependant] == 0:
+                    ready.append(dependant)
+        if len(order) != len(self.nodes):
+            return False
+        return order
+
+    def find_loop(self):
+        """
+        Find a dependency loop in the graph. Returns an array of slugs that
+        starts and ends with the same slug or False if there is no loop.
+        """
+        state = {}
+        for start in self.nodes:
+            if start in state:
+                continue
+            path = [start]
+            stack = [iter(self.forward[start])]
+            state[start] = 'open'
+            while len(stack) > 0:
+                dep = next(stack[-1], None)
+                if dep == None:
+                    state[path.pop()] = 'closed'
+                    stack.pop()
+                    continue
+                if dep not in self.nodes:
+                    continue
+                if state.get(dep) == 'open':
+                    return path[path.index(dep):] + [dep]
+                if dep not in state:
+                    state[dep] = 'open'
+                    path.append(dep)
+                    stack.append(iter(self.forward[dep]))
+        return False
+
+    def describe_problem(self):
+        """
+        Get a message explaining why topological_order() failed.
+        """
+        loop = self.find_loop()
+        if loop:
+            return 'Dependency loop detected: ' + ' -> '.join(loop)
+        messages = []
+        for slug, dep in self.missing():
+            messages.append('"' + slug + '" needs missing package "' + dep + '"')
+        return 'Unresolved dependencies: ' + ', '.join(messages)
+
+    def dependencies_of(self, slug):
+        """
+        Get the slugs of all software a package depends upon, directly or
+        indirectly. Dependencies that are not in the graph are included but not
+        expanded.
+
+        Args:
+            slug - The slug name of the package
+        """
+        if slug not in self._dependency_closure:
+            self._dependency_closure[slug] = self._walk(slug, self.forward)
+        return self._dependency_closure[slug]
+
+    def dependants_of(self, slug):
+        """
+        Get the slugs of all software that depends upon a package, directly or
+        indirectly.
+
+        Args:
+            slug - The slug name of the package
+        """
+        if slug not in self._dependant_closure:
+            self._dependant_closure[slug] = self._walk(slug, self.reverse)
+        return self._dependant_closure[slug]
+
+    def _walk(self, slug, edges):
+        """
+        Collect every slug reachable from a slug by following the given edges.
+        """
+        found = []
+        seen = set([slug])
+        pending = deque(edges.get(slug, []))
+        while len(pending) > 0:
+            next_slug = pending.popleft()
+            if next_slug in seen:
+                continue
+            seen.add(next_slug)
+            found.append(next_slug)
+            pending.extend(edges.get(next_slug, []))
+        return found
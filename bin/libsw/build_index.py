@@ -1,53 +1,190 @@
 #!/usr/bin/env python3
 
+import sys
+import glob
+import os
+import json
+import time
+import importlib
+import subprocess
+from libsw import file_filter, input_util
+
+class ManifestEntry():
+    """
+    A stand-in for a builder that only knows what the builder manifest records
+    about it. It can be used anywhere a builder's slug and dependencies are
+    needed without importing the builder's module.
+    """
+    def __init__(self, slug, dependencies):
+        self.slug = slug
+        self._dependencies = dependencies
+
+    def dependencies(self):
+        return self._dependencies
+
 class Index():
     """
     A class for tracking all builders avaliable to Site Wrangler. Each builder
     should have a corresponding file in bin/builders. In said file, it should
     import this class and call register_builder on itself.
+
+    The builder files are only imported by reindex(), which records every
+    registered builder in a manifest. Other lookups read the manifest and only
+    import the module of a builder when that builder is needed.
     """
     index = []
+    # slug -> builder for every builder in index
+    registry = {}
+    graph = False
+    # slug -> manifest entry, in registration order
+    manifest = False
 
     def register_builder(self, builder):
         """
         Register a builder within Site Wrangler.
         """
-        for i in Index.index:
-            if builder.slug == i.slug:
-                return
+        if builder.slug in Index.registry:
+            return
         Index.index.append(builder)
+        Index.registry[builder.slug] = builder
+
+    def get_manifest(self):
+        """
+        Get the builder manifest, generating it first if it does not exist.
+        """
+        if Index.manifest == False:
+            path = _get_manifest_file()
+            if not os.path.exists(path):
+                return self.reindex()
+            with open(path) as manifest_file:
+                Index.manifest = {}
+                for entry in json.load(manifest_file)['builders']:
+                    Index.manifest[entry['slug']] = entry
+        return Index.manifest
+
+    def reindex(self):
+        """
+        Import every builder file in bin/builders and write the slug, class and
+        dependencies of each registered builder to the manifest.
+        """
+        import builders
+        from libsw import completion_cache
+        # builders that are no longer registered must not stay in the manifest
+        Index.index = []
+        Index.registry = {}
+        for name in sorted(builders.__all__):
+            module_name = 'builders.' + name
+            if module_name in sys.modules:
+                importlib.reload(sys.modules[module_name])
+            else:
+                importlib.import_module(module_name)
+        entries = []
+        Index.manifest = {}
+        for builder in Index.index:
+            entry = {
+                'slug': builder.slug,
+                'module': type(builder).__module__,
+                'class': type(builder).__name__,
+                'args': builder.manifest_args(),
+                'dependencies': list(builder.dependencies())
+            }
+            entries.append(entry)
+            Index.manifest[builder.slug] = entry
+        Index.graph = False
+        path = _get_manifest_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'w') as manifest_file:
+            json.dump({'generated': time.time(), 'builders': entries}, manifest_file, indent=1)
+        os.replace(path + '.part', path)
+        completion_cache.invalidate('slugs', 'installed', 'uninstallable')
+        return Index.manifest
+
+    def refresh(self):
+        """
+        Regenerate the manifest if it is older than the build_cache_age setting.
+        This picks up newly released PHP versions.
+        """
+        from libsw import settings
+        path = _get_manifest_file()
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > settings.get_num('build_cache_age'):
+            self.reindex()
+
+    def slugs(self):
+        """
+        Get the slugs of all registered builders in registration order.
+        """
+        return list(self.get_manifest().keys())
+
+    def get(self, slug):
+        """
+        Get a registered builder by it's slug or False if it is not registered.
+        The builder's module is imported the first time it is requested.
+
+        Args:
+            slug - The slug name of the builder
+        """
+        if slug in Index.registry:
+            return Index.registry[slug]
+        entry = self.get_manifest().get(slug)
+        if entry == None:
+            return False
+        module = importlib.import_module(entry['module'])
+        builder = getattr(module, entry['class'])(*entry['args'])
+        self.register_builder(builder)
+        return builder
+
+    def all(self):
+        """
+        Get an array of all registered builders, importing any that have not
+        been loaded yet.
+        """
+        builders = []
+        for slug in self.slugs():
+            builder = self.get(slug)
+            if builder != False:
+                builders.append(builder)
+        return builders
+
+    def get_graph(self):
+        """
+        Get the dependency graph of all registered builders as recorded in the
+        manifest.
+        """
+        if Index.graph == False:
+            from libsw import build_graph
+            entries = []
+            for slug, entry in self.get_manifest().items():
+                entries.append(ManifestEntry(slug, entry['dependencies']))
+            Index.graph = build_graph.BuildGraph(entries)
+        return Index.graph
 
     def populate_builders(self, build_queue):
         """
         Add all registered builders to a given BuildQueue.
         """
-        for b in Index.index:
+        for b in self.all():
             build_queue.append_missing(b)
         build_queue.optimize()
 
+def _get_manifest_file():
+    """The file path to the builder manifest."""
+    from libsw import settings
+    return settings.get('install_path') + 'var/cache/builder-manifest.json'
 
-# Since the builders we are importing import this file,
-# this import line needs to be after the declaration
-# for Index()
-from builders import *
-
-import glob
-import os
-import inquirer
-import subprocess
-from libsw import file_filter, input_util
+def reindex():
+    """
+    Regenerate the builder manifest.
+    """
+    return Index().reindex()
 
 
 def registered_slugs():
     """
     Get a list of all registered software slugs.
     """
-    slug_list = []
-    for builder in Index().index:
-        slug_list.append(builder.slug)
-    return slug_list
+    return Index().slugs()
 
-def select_slugs(query_message, slug_list=registered_slugs()):
+def select_slugs(query_message, slug_list=False):
     """
     Have the user select multiple software slugs from software avaliable in Site
     Wrangler.
@@ -56,9 +193,11 @@ def select_slugs(query_message, slug_list=registered_slugs()):
         query_message - A query message to display to the user when selecting
         options (optional) - The software slugs to select from
     """
+    if slug_list == False:
+        slug_list = registered_slugs()
     return input_util.select_multiple_from(query_message, slug_list)
 
-def select_slug(query_message, slug_list=registered_slugs()):
+def select_slug(query_message, slug_list=False):
     """
     Have the user select a software slug from software installed by Site
     Wrangler.
@@ -67,6 +206,8 @@ def select_slug(query_message, slug_list=registered_slugs()):
         query_message - A query message to display to the user when selecting
         options (optional) - The software slugs to select from
     """
+    if slug_list == False:
+        slug_list = registered_slugs()
     return input_util.select_from(query_message, slug_list)
 
 def get_builder(slug):
@@ -76,10 +217,7 @@ def get_builder(slug):
     Args:
         slug - The slug name of the installable software
     """
-    for builder in Index().index:
-        if builder.slug == slug:
-            return builder
-    return False
+    return Index().get(slug)
 
 def view_log(builder):
     """
@@ -88,10 +226,14 @@ def view_log(builder):
     Args:
         builder - Display the log from this builder
     """
+    from libsw import logger
     if type(builder) is str:
         builder = get_builder(builder)
-    path = builder.log_name()
-    if os.path.exists(path):
+    path = logger.find_file(builder.log_name())
+    if path and path.endswith('.zst'):
+        subprocess.run(['sh', '-c', 'zstd -q -d -c "$0" | less -R', path])
+        return True
+    if path:
         subprocess.run(['less', '-R', path])
         return True
     return False
@@ -103,18 +245,15 @@ def get_list_with_dependants(slug_array):
     Args:
         slug_array -  A list of software slugs
     """
+    graph = Index().get_graph()
     new_slug_array = []
     new_slug_array += slug_array
+    found = set(slug_array)
     for slug in slug_array:
-        if slug not in new_slug_array:
-            new_slug_array.append(slug)
-        builder = get_builder(slug)
-        for dependant in builder.dependencies():
-            if dependant not in new_slug_array:
-                added_slugs = get_list_with_dependants([dependant])
-                for new_slug in added_slugs:
-                    if new_slug not in slug_array:
-                        new_slug_array.append(new_slug)
+        for dependant in graph.dependencies_of(slug):
+            if dependant not in found:
+                found.add(dependant)
+                new_slug_array.append(dependant)
     return new_slug_array
 
 def populate_slug(build_queue, slug):
@@ -197,12 +336,7 @@ def get_dependant_upon(slug):
     """
     Get software that depends upon the given software slug.
     """
-    dependant_slugs = [];
-    for dex in Index.index:
-        if slug in dex.dependencies():
-            dependant_slugs.append(dex.slug)
-            dependant_slugs.extend(get_dependant_upon(dex.slug))
-    return dependant_slugs
+    return list(Index().get_graph().dependants_of(slug))
 
 def get_installed(excluded_array=False):
     """
@@ -237,7 +371,11 @@ def enable_slug(slug):
     """
     slug = slug.lower()
     save_file = _get_enabled_slugs_file()
-    return file_filter.AppendUnique(save_file, slug, ignore_trim=True, ignore_case=True).run()
+    changed = file_filter.AppendUnique(save_file, slug, ignore_trim=True, ignore_case=True).run()
+    if changed:
+        # dependencies of some builders depend on the enabled packages
+        reindex()
+    return changed
 
 def disable_slug(slug):
     """
@@ -247,7 +385,10 @@ def disable_slug(slug):
         slug - The slug name the represents the package
     """
     save_file = _get_enabled_slugs_file()
-    return file_filter.RemoveExact(save_file, slug, ignore_trim=True, ignore_case=True).run()
+    changed = file_filter.RemoveExact(save_file, slug, ignore_trim=True, ignore_case=True).run()
+    if changed:
+        reindex()
+    return changed
 
 def enabled_slugs():
     """
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import threading
+import multiprocessing
+from multiprocessing import connection
+from concurrent.futures import ThreadPoolExecutor
 
-from libsw import settings, builder
+from libsw import settings, builder, build_graph, make_jobs
 
-default_failed_file = settings.get('install_path') + 'etc/build-failures'
-debug = settings.get('debug_build_queue')
+def default_failed_file():
+    """The file that lists software whose last build failed."""
+    return settings.get('install_path') + 'etc/build-failures'
 
 class BuildQueue():
     """
@@ -13,10 +19,18 @@ class BuildQueue():
     depenencies of listed software is also listed. The build queue, when
     run, will only build missing and outdated software.
     """
-    def __init__(self, failed_file=default_failed_file):
+    def __init__(self, failed_file=False):
+        if not failed_file:
+            failed_file = default_failed_file()
         self.queue = []
+        # slug -> position of the builder in self.queue
+        self.positions = {}
         self.failed_file = failed_file
         self.failure_cache = False
+        # results of update_needed() and live_status() for the current run
+        self.update_cache = {}
+        self.status_cache = {}
+        self.graph = False
 
     def set_failed_file(self, failed_file):
         self.failed_file = failed_file
@@ -32,7 +46,10 @@ class BuildQueue():
             builder - The builder to add
         """
         status = ''
+        if builder.slug not in self.positions:
+            self.positions[builder.slug] = len(self.queue)
         self.queue.append([builder, status])
+        self.graph = False
 
     def append_missing(self, builder):
         """
@@ -41,19 +58,29 @@ class BuildQueue():
         Args:
             builder - The builder to add
         """
-        for b,status in self.queue:
-            if b.slug == builder.slug:
-                return False
+        if builder.slug in self.positions:
+            return False
         self.append(builder)
         return True
 
+    def get_graph(self):
+        """
+        Get the dependency graph of the builders in the queue. The graph is
+        rebuilt only after builders are added to the queue.
+        """
+        if self.graph == False:
+            builders = []
+            for builder, status in self.queue:
+                builders.append(builder)
+            self.graph = build_graph.BuildGraph(builders)
+        return self.graph
+
     def populate_dependancy_tree(self):
+        graph = self.get_graph()
         for builder, status in self.queue:
-            builder.dependants = []
-        for builder, status in self.queue:
-            for test_builder, test_status in self.queue:
-                if builder.slug in test_builder.dependencies():
-                    builder.dependants.append(test_builder)
+            builder.dependents = []
+            for slug in graph.reverse[builder.slug]:
+                builder.dependents.append(graph.nodes[slug])
 
     def in_failed_state(self, slug):
         """
@@ -84,51 +111,76 @@ class BuildQueue():
                 for slug in self.failure_cache:
                     fail_list.write(slug + '\n')
 
-    # def get_ordered_builders(self):
     def optimize(self):
         """
         Get an array of builders ordered so that all packages are preceded by their
         dependencies.
         """
-        source_list = []
-        target_list = []
-        # for builder_tuple in self.queue:
-        #     source_list.append(builder_tuple)
-        source_list.extend(self.queue)
-        old_length = 0
-        current_length = len(source_list)
-        # print('Len: ' + str(current_length))
-        while len(source_list) > 0 and len(source_list) != old_length:
-            old_length = current_length
-            for build_tuple in source_list:
-                deps = build_tuple[0].dependencies()
-                satisfied = True
-                for dep in deps:
-                    found_dep = False
-                    for builder, status in target_list:
-                        if builder.slug == dep:
-                            found_dep = True
-                            break
-                    if not found_dep:
-                        satisfied = False
-                if satisfied:
-                    target_list.append(build_tuple)
-            for build_tuple in target_list:
-                if build_tuple in source_list:
-                    source_list.remove(build_tuple)
-            current_length = len(source_list)
-        if len(source_list) > 0:
-            print('Error: Dependency loop detected.')
+        graph = self.get_graph()
+        order = graph.topological_order()
+        if order == False:
+            print('Error: ' + graph.describe_problem())
             return False
+        entries = {}
+        for build_tuple in self.queue:
+            if build_tuple[0].slug not in entries:
+                entries[build_tuple[0].slug] = build_tuple
+        target_list = []
+        for slug in order:
+            target_list.append(entries[slug])
         self.queue = target_list
+        self.positions = {}
+        for i in range(len(target_list)):
+            self.positions[target_list[i][0].slug] = i
         return target_list
 
+    def check_updates(self):
+        """
+        Run the update check for every builder in the queue that needs one.
+        Checks run in a pool of threads with a limited number of concurrent
+        checks against any one host. Each builder is only checked once per run.
+        """
+        to_check = []
+        for builder, status in self.queue:
+            if status == '' and builder.slug not in self.update_cache:
+                to_check.append(builder)
+        if len(to_check) == 0:
+            return
+        host_limit = settings.get_num('update_check_host_limit')
+        host_locks = {}
+        for builder in to_check:
+            host = builder.update_check_host()
+            if host not in host_locks:
+                host_locks[host] = threading.Semaphore(host_limit)
+        def check(builder):
+            with host_locks[builder.update_check_host()]:
+                return builder.update_needed()
+        futures = []
+        with ThreadPoolExecutor(max_workers=settings.get_num('update_check_threads')) as pool:
+            for builder in to_check:
+                futures.append([builder.slug, pool.submit(check, builder)])
+        for slug, future in futures:
+            self.update_cache[slug] = future.result()
+
+    def update_needed(self, builder):
+        """
+        Returns the cached result of builder.update_needed(), checking the
+        builder first if it has not been checked during this run.
+
+        Args:
+            builder - The builder to check
+        """
+        if builder.slug not in self.update_cache:
+            self.update_cache[builder.slug] = builder.update_needed()
+        return self.update_cache[builder.slug]
+
     def run_check(self):
         """
         Check for updates for all installable software and print the results but
         do not install anthing.
         """
         self.reset_statuses()
+        self.check_updates()
         rebuild_list = []
         for i in range(len(self.queue)):
             builder, status = self.queue[i]
@@ -141,13 +193,21 @@ class BuildQueue():
                 rebuild_list.append([builder.slug, 'depend'])
         return rebuild_list
 
-    def run(self):
+    def run(self, jobs=1):
         """
         Check for updates for all installable software and install any missing
         sowftware along with any software with an avaliable update.
+
+        Args:
+            jobs - (optional) The number of builders that may run at the same
+                time. Builders only run together when they do not depend on
+                each other.
         """
+        if jobs > 1:
+            return self.run_parallel(jobs)
         self.count = 0
         self.reset_statuses()
+        self.check_updates()
         # for i in range(len(self.queue)):
         #     builder, status = self.queue[i]
         #     status = self.live_status(builder)
@@ -177,8 +237,124 @@ class BuildQueue():
                     else:
                         status = 'failed'
             self.queue[i] = builder, status
+            self.status_cache = {}
         return self.count
 
+    def run_parallel(self, jobs):
+        """
+        Same as run(), but builders whose dependencies are all satisfied are
+        started right away in their own process, up to the given number of jobs
+        at a time. New builds are not started while the system load is above
+        the max_build_load setting. Each builder still writes to it's own log.
+
+        Args:
+            jobs - The maximum number of builders to run at the same time
+        """
+        self.count = 0
+        self.reset_statuses()
+        self.check_updates()
+        pending = []
+        for i in range(len(self.queue)):
+            builder, status = self.queue[i]
+            status = self.live_status(builder)
+            self.queue[i] = builder, status
+            if status == 'ready' or status == 'waiting':
+                pending.append(builder.slug)
+        running = {}
+        context = multiprocessing.get_context('fork')
+        # every make started by the forked builds shares one set of job slots
+        make_jobs.start_jobserver(jobs)
+        try:
+            self._run_pending(pending, running, jobs, context)
+        finally:
+            make_jobs.stop_jobserver()
+        return self.count
+
+    def _run_pending(self, pending, running, jobs, context):
+        """
+        The scheduling loop of run_parallel().
+
+        Args:
+            pending - An array of slugs that still need to be built
+            running - A dictionary of process sentinels to [slug, process]
+            jobs - The maximum number of builders to run at the same time
+            context - The multiprocessing context used to start builds
+        """
+        while len(pending) > 0 or len(running) > 0:
+            for slug in list(pending):
+                if len(running) >= jobs:
+                    break
+                builder, status = self.entry(slug)
+                dep_state = self._dependency_state(builder)
+                if dep_state == 'failed':
+                    print('Skipping ' + slug + ' due to a failed dependency')
+                    pending.remove(slug)
+                    self._set_status(slug, 'failed')
+                    continue
+                if dep_state == 'waiting':
+                    continue
+                if len(running) > 0 and not _load_allows_build():
+                    break
+                # mark the build as failed until it completes (see run())
+                if not self.in_failed_state(slug):
+                    self.failure_cache.append(slug)
+                    self._write_failed_file()
+                process = context.Process(target=_build_in_child, args=(builder,))
+                process.start()
+                running[process.sentinel] = [slug, process]
+                pending.remove(slug)
+                self._set_status(slug, 'building')
+                print('Started ' + slug + ' (log: ' + builder.log_name() + ')', flush=True)
+            if len(running) == 0:
+                if len(pending) > 0:
+                    print('Error: Unable to start ' + ', '.join(pending))
+                    for slug in pending:
+                        self._set_status(slug, 'failed')
+                break
+            finished = connection.wait(list(running.keys()), timeout=10)
+            for sentinel in finished:
+                slug, process = running.pop(sentinel)
+                process.join()
+                if process.exitcode == 0:
+                    print('Finished ' + slug, flush=True)
+                    self.count += 1
+                    self._set_status(slug, 'done')
+                    self.failure_cache.remove(slug)
+                    self._write_failed_file()
+                else:
+                    print('Build failed for ' + slug + ' (exit code ' + str(process.exitcode) + ')', flush=True)
+                    self._set_status(slug, 'failed')
+
+    def _dependency_state(self, builder):
+        """
+        Summarize the build statuses of a builder's dependencies.
+
+        Return:
+            'failed' if any dependency failed or is missing, 'waiting' if any
+            dependency has yet to be built and 'ready' otherwise
+        """
+        state = 'ready'
+        for slug in self.get_graph().forward[builder.slug]:
+            dep_builder, dep_status = self.entry(slug)
+            if dep_status == False or dep_status == 'failed' or dep_status == 'missing':
+                return 'failed'
+            if dep_status != 'pass' and dep_status != 'done':
+                state = 'waiting'
+        return state
+
+    def _set_status(self, slug, status):
+        """
+        Set the build status of a builder in the queue.
+
+        Args:
+            slug - The slug name of the builder to update
+            status - The new build status
+        """
+        if slug in self.positions:
+            i = self.positions[slug]
+            self.queue[i] = self.queue[i][0], status
+        self.status_cache = {}
+
     def find(self, slug):
         """
         Fetch a builder from the queue.
@@ -186,9 +362,8 @@ class BuildQueue():
         Args:
             slug - The slug name of the builder to return
         """
-        for builder, status in self.queue:
-            if builder.slug == slug:
-                return builder
+        if slug in self.positions:
+            return self.queue[self.positions[slug]][0]
         return False
 
     def entry(self, slug):
@@ -198,9 +373,9 @@ class BuildQueue():
         Args:
             slug - The slug name of the builder to return
         """
-        for builder, status in self.queue:
-            if builder.slug == slug:
-                return builder, status
+        if slug in self.positions:
+            builder, status = self.queue[self.positions[slug]]
+            return builder, status
         return False, False
 
     def mark_dependents_failed(self, builder):
@@ -212,29 +387,12 @@ class BuildQueue():
                 failed
         """
         write = False
-        if not self.in_failed_state(builder.slug):
-            self.failure_cache.append(builder.slug)
-            write = True
-        #TODO fix this so that it correctly walks the dependency tree
-        # builder.dependencies()
-
-        for other_builder in self.dependents:
-            child_wrote = self.mark_dependents_failed(other_builder)
-            if child_wrote:
-                write = False
-
-        # for other_builder in self.queue:
-        #     if builder.slug in other_builder.dependencies():
-        #         child_wrote = self.mark_dependents_failed(other_builder)
-        #         if child_wrote:
-        #             write = False
-
-        # for dep in dependencies:
-        #     dep_builder = self.find(dep)
-        #     if dep_builder:
-        #         child_wrote = self.mark_dependents_failed(dep_builder)
-        #         if child_wrote:
-        #             write = False
+        slug_list = [builder.slug]
+        slug_list.extend(self.get_graph().dependants_of(builder.slug))
+        for slug in slug_list:
+            if not self.in_failed_state(slug):
+                self.failure_cache.append(slug)
+                write = True
         if write:
             self._write_failed_file()
         return write
@@ -270,10 +428,12 @@ class BuildQueue():
                 print('Marking ' + builder.slug + ' for build due to previous action.')
                 status = 'waiting'
             self.queue[i] = builder, status
+        self.status_cache = {}
 
     def live_status(self, builder, level=0):
         """
-        Recalculate the status of a builder by checking it's dependencies.
+        Recalculate the status of a builder by checking it's dependencies. The
+        result is cached until a status in the queue changes.
 
         Args:
             builder - The builder to check
@@ -283,19 +443,37 @@ class BuildQueue():
         for i in range(level):
             dmsg += ' '
         dmsg += builder.slug + ': '
-        if debug or level == 0:
+        if settings.get_bool('debug_build_queue') or level == 0:
             print(dmsg, end='', flush=True)
 
+        if builder.slug in self.status_cache:
+            status = self.status_cache[builder.slug]
+        else:
+            status = self._calculate_status(builder, level)
+            self.status_cache[builder.slug] = status
+
+        if settings.get_bool('debug_build_queue') or level == 0:
+            print(status, flush=True)
+        return status
+
+    def _calculate_status(self, builder, level):
+        """
+        Calculate the status of a builder for live_status().
+
+        Args:
+            builder - The builder to check
+            level - The recursive depth level the status check is in
+        """
         status = 'missing'
-        for b, s in self.queue:
-            if b is builder:
-                status = s
+        queued_builder, queued_status = self.entry(builder.slug)
+        if queued_builder is builder:
+            status = queued_status
         if status == '' or status == 'waiting':
-            if status == '' and not builder.update_needed():
+            if status == '' and not self.update_needed(builder):
                 status = 'pass'
             else:
                 status = 'ready'
-            deps = builder.dependencies()
+            deps = self.get_graph().forward[builder.slug]
             if len(deps) > 0:
                 for slug in deps:
                     dep_builder, dep_status = self.entry(slug)
@@ -310,9 +488,6 @@ class BuildQueue():
                     elif dep_status == 'done':
                         if status != 'waiting':
                             status = 'ready'
-
-        if debug or level == 0:
-            print(status, flush=True)
         return status
 
 class RebuildQueue(BuildQueue):
@@ -323,6 +498,7 @@ class RebuildQueue(BuildQueue):
         for i in range(len(self.queue)):
             builder, status = self.queue[i]
             self.queue[i] = builder, 'waiting'
+        self.status_cache = {}
 
 class TargetedQueue(BuildQueue):
     """
@@ -341,19 +517,42 @@ class TargetedQueue(BuildQueue):
             else:
                 self.queue[i] = builder, 'pass'
         self.run_backwards_depenencies()
+        self.status_cache = {}
 
     def run_backwards_depenencies(self):
-        count = 1
-        while count > 0:
-            count = 0
-            for queue_item in self.queue:
-                if queue_item[1] == 'waiting':
-                    for i in range(len(self.queue)):
-                        builder, status = self.queue[i]
-                        dependencies = builder.dependencies()
-                        if status != 'waiting' and queue_item[0].slug in dependencies:
-                            count += 1
-                            self.queue[i] = builder, 'waiting'
+        """
+        Mark all software that depends on a waiting builder as waiting.
+        """
+        graph = self.get_graph()
+        rebuild = set()
+        for builder, status in self.queue:
+            if status == 'waiting':
+                rebuild.update(graph.dependants_of(builder.slug))
+        for i in range(len(self.queue)):
+            builder, status = self.queue[i]
+            if builder.slug in rebuild:
+                self.queue[i] = builder, 'waiting'
+
+def _build_in_child(builder):
+    """
+    Run a build inside of a forked process. Screen output is discarded since it
+    is already written to the builder's log file and would otherwise be mixed
+    with the output of builds running at the same time.
+
+    Args:
+        builder - The builder to build
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    success, log = builder.build()
+    sys.exit(0 if success else 1)
+
+def _load_allows_build():
+    """
+    Returns True if the system load is low enough to start another build.
+    """
+    return os.getloadavg()[0] < float(settings.get('max_build_load'))
 
 def new_queue(force=False):
     """
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+from libsw import settings, logger
+
+# the build phases in the order they run
+phase_names = [
+    'fetch_source',
+    'apply_patches',
+    'run_pre_config',
+    'configure',
+    'make',
+    'install',
+    'cleanup_old_versions'
+]
+
+def history_file():
+    """The file path to the build timing history."""
+    return settings.get('install_path') + 'var/log/build/stats.jsonl'
+
+class BuildTimer():
+    """
+    Record the wall clock time, CPU time and peak memory use of each phase of a
+    build. The CPU and memory numbers are taken from the child processes the
+    build runs, such as configure scripts and compilers. Peak memory is only
+    measured for commands run with logger.Log.run().
+    """
+    def __init__(self, slug, version):
+        self.slug = slug
+        self.version = version
+        self.started = time.time()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of code as a build phase.
+
+        Args:
+            name - The name of the phase (see phase_names)
+        """
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        logger.reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.phases[name] = {
+                'wall': round(wall, 3),
+                'user': round(after.ru_utime - before.ru_utime, 3),
+                'sys': round(after.ru_stime - before.ru_stime, 3),
+                # the largest command of this phase, in kilobytes
+                'rss': logger.peak_rss()
+            }
+
+    def save(self, success):
+        """
+        Append the recorded phases to the build history.
+
+        Args:
+            success - True if the build succeeded
+        """
+        record = {
+            'slug': self.slug,
+            'version': str(self.version),
+            'time': int(self.started),
+            'success': success,
+            'phases': self.phases
+        }
+        path = history_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as history:
+            history.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+def get_history(slug=False, successful_only=True):
+    """
+    Get an array of recorded builds, oldest first.
+
+    Args:
+        slug - (optional) Only return builds of this slug
+        successful_only - (optional) Skip failed builds
+    """
+    records = []
+    path = history_file()
+    if not os.path.exists(path):
+        return records
+    with open(path) as history:
+        for line in history:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if slug and record['slug'] != slug:
+                continue
+            if successful_only and not record['success']:
+                continue
+            records.append(record)
+    return records
+
+def total_wall(record):
+    """Get the total wall clock time of a recorded build."""
+    total = 0
+    for name, phase in record['phases'].items():
+        total += phase['wall']
+    return total
+
+def percentile(values, percent):
+    """
+    Get a percentile from an array of numbers using linear interpolation.
+
+    Args:
+        values - An array of numbers
+        percent - The percentile to calculate (0 - 100)
+    """
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def is_regression(latest, previous, threshold=1.25, minimum=30):
+    """
+    Returns True if the latest value is noticeably slower than the median of
+    the previous values.
+
+    Args:
+        latest - The newest measurement in seconds
+        previous - An array of older measurements in seconds
+        threshold - (optional) How many times slower than the median counts
+        minimum - (optional) Ignore slowdowns smaller than this many seconds
+    """
+    if len(previous) < 3:
+        return False
+    median = percentile(previous, 50)
+    return latest > median * threshold and latest - median > minimum
+
+def summarize(records):
+    """
+    Summarize an array of recorded builds of one slug.
+
+    Return:
+        A dictionary with the keys builds, last, median, p90 and regression
+        for the total build time
+    """
+    totals = []
+    for record in records:
+        totals.append(total_wall(record))
+    return {
+        'builds': len(totals),
+        'last': totals[-1] if len(totals) > 0 else 0,
+        'median': percentile(totals, 50),
+        'p90': percentile(totals, 90),
+        'regression': len(totals) > 0 and is_regression(totals[-1], totals[:-1])
+    }
+
+def summarize_phases(records):
+    """
+    Summarize each phase of an array of recorded builds of one slug.
+
+    Return:
+        An array of dictionaries with the keys phase, last, median, p90, cpu,
+        rss and regression
+    """
+    rows = []
+    for name in phase_names:
+        walls = []
+        cpu = []
+        rss = []
+        for record in records:
+            if name in record['phases']:
+                phase = record['phases'][name]
+                walls.append(phase['wall'])
+                cpu.append(phase['user'] + phase['sys'])
+                rss.append(phase['rss'])
+        if len(walls) == 0:
+            continue
+        rows.append({
+            'phase': name,
+            'last': walls[-1],
+            'median': percentile(walls, 50),
+            'p90': percentile(walls, 90),
+            'cpu': cpu[-1],
+            'rss': max(rss),
+            'regression': is_regression(walls[-1], walls[:-1])
+        })
+    return rows
+
+def format_seconds(seconds):
+    """Format a number of seconds as h:mm:ss."""
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
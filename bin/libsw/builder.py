@@ -1,25 +1,45 @@
 #!/usr/bin/env python3
 
 import os
-import tarfile
-import requests
+import json
+import time
+import hashlib
+import threading
 import datetime
 import subprocess
 import glob
 import re
 import shutil
 import platform
-from libsw import logger, version, email, settings, file_filter, system
+from urllib.parse import urlparse
+from libsw import logger, version, email, settings, file_filter, system, build_cache, install_tree, build_stats, make_jobs, configure_cache, source_mirror, artifact, remote, install_manifest
 from abc import ABC, abstractmethod
 
 debug = True
-build_path = settings.get('build_path')
-ld_path = build_path + 'lib64:' + build_path + 'lib'
-ld_flags = '-L' + build_path + 'lib64/ -L' + build_path + 'lib/'
-cpp_flags = '-I' + build_path + 'include/'
-pkg_config_path = build_path + 'lib64/pkgconfig/:' + build_path + 'lib/pkgconfig/'
-build_env = dict(os.environ, LD_LIBRARY_PATH=ld_path, LDFLAGS=ld_flags, CPPFLAGS=cpp_flags, PKG_CONFIG_PATH=pkg_config_path)
-set_sh_ld = 'LD_LIBRARY_PATH=' + ld_path + ' '
+
+def build_path():
+    """The directory that built software is installed to."""
+    return settings.get('build_path')
+
+def ld_path():
+    """The library search path for running built software."""
+    return build_path() + 'lib64:' + build_path() + 'lib'
+
+def pkg_config_path():
+    """The pkg-config search path for libraries of built software."""
+    return build_path() + 'lib64/pkgconfig/:' + build_path() + 'lib/pkgconfig/'
+
+def build_env():
+    """
+    Get the environment variables to compile against and run built software.
+    """
+    ld_flags = '-L' + build_path() + 'lib64/ -L' + build_path() + 'lib/'
+    cpp_flags = '-I' + build_path() + 'include/'
+    return dict(os.environ, LD_LIBRARY_PATH=ld_path(), LDFLAGS=ld_flags, CPPFLAGS=cpp_flags, PKG_CONFIG_PATH=pkg_config_path())
+
+def set_sh_ld():
+    """A shell command prefix to run built software with it's libraries."""
+    return 'LD_LIBRARY_PATH=' + ld_path() + ' '
 
 def is_frozen(slug):
     """
@@ -38,7 +58,9 @@ def freeze(slug):
     Prevent a builder from updating it's source code to a newer version.
     The software will still be re-built if it's dependants are upated.
     """
+    from libsw import completion_cache
     freeze_file = settings.get('install_path') + 'etc/build-freeze'
+    completion_cache.invalidate('frozen')
     return file_filter.AppendUnique(freeze_file, slug).run()
 
 def unfreeze(slug):
@@ -46,7 +68,9 @@ def unfreeze(slug):
     Allow a builder to update it's source code to a newer version. This
     will not start a build.
     """
+    from libsw import completion_cache
     freeze_file = settings.get('install_path') + 'etc/build-freeze'
+    completion_cache.invalidate('frozen')
     return file_filter.RemoveExact(freeze_file, slug).run()
 
 def list_frozen():
@@ -95,10 +119,174 @@ def populate_patch_file(file_path, patch_array, log):
                     patch_array.append([name, url])
     return patch_array
 
+def ccache_binary():
+    """
+    Returns the path to the ccache binary if compiler caching is enabled and
+    ccache is installed, otherwise False. The ccache setting can be set to
+    "auto" to use ccache whenever it is found.
+    """
+    setting = str(settings.get('ccache')).strip().lower()
+    if setting in ['false', '0', 'off', 'no']:
+        return False
+    binary = shutil.which('ccache')
+    if binary == None:
+        return False
+    return binary
+
+def ccache_dir():
+    """
+    Returns the directory ccache stores compiled objects in.
+    """
+    directory = settings.get('ccache_dir')
+    if not directory:
+        directory = settings.get('install_path') + 'var/cache/ccache/'
+    return directory
+
+def apply_ccache(env):
+    """
+    Get a copy of a build environment that compiles through ccache. The
+    original environment is returned if ccache is not in use.
+
+    Args:
+        env - The build environment dictionary
+    """
+    binary = ccache_binary()
+    if not binary:
+        return env
+    env = dict(env)
+    env['CC'] = binary + ' ' + env.get('CC', 'cc')
+    env['CXX'] = binary + ' ' + env.get('CXX', 'c++')
+    env['CCACHE_DIR'] = ccache_dir()
+    env['CCACHE_MAXSIZE'] = settings.get('ccache_size')
+    # hash relative paths so different versions of the same source tree share
+    # objects whenever the preprocessed code is identical
+    env['CCACHE_BASEDIR'] = build_path() + 'src/'
+    env['CCACHE_NOHASHDIR'] = '1'
+    return env
+
+def get_ccache_stats():
+    """
+    Returns a dictionary with the hit and miss counters from ccache or False if
+    ccache is not in use.
+    """
+    binary = ccache_binary()
+    if not binary:
+        return False
+    env = dict(os.environ, CCACHE_DIR=ccache_dir())
+    output = subprocess.run([binary, '--print-stats'], capture_output=True, text=True, env=env).stdout
+    stats = {'hits': 0, 'misses': 0}
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) != 2 or not parts[1].strip().isdigit():
+            continue
+        if parts[0] in ['direct_cache_hit', 'preprocessed_cache_hit']:
+            stats['hits'] += int(parts[1])
+        elif parts[0] == 'cache_miss':
+            stats['misses'] += int(parts[1])
+    return stats
+
+def log_ccache_stats(before, log):
+    """
+    Write the ccache hit rate since a previous call to get_ccache_stats() to a
+    log. Builds running at the same time share the ccache counters.
+
+    Args:
+        before - The result of get_ccache_stats() from before the build
+        log - An open log to write to
+    """
+    after = get_ccache_stats()
+    if not before or not after:
+        return
+    hits = after['hits'] - before['hits']
+    misses = after['misses'] - before['misses']
+    total = hits + misses
+    if total == 0:
+        return
+    log.log('ccache: ' + str(hits) + ' hits, ' + str(misses) + ' misses (' + ('%.1f' % (hits * 100 / total)) + '% hit rate)')
+
+# remote git refs already looked up by this process, keyed by repository URL
+_remote_refs = {}
+_remote_refs_locks = {}
+_remote_refs_lock = threading.Lock()
+
+def _remote_refs_cache_file(url):
+    name = hashlib.sha1(url.encode()).hexdigest()
+    return settings.get('install_path') + 'var/cache/git-refs/' + name + '.json'
+
+def get_remote_refs(url, max_age=0):
+    """
+    List the branches and tags of a remote git repository without fetching
+    any objects. Each repository is only queried once per process, even when
+    several threads ask for it at the same time, unless the query fails.
+
+    Args:
+        url - The URL of the git repository
+        max_age - (optional) Reuse refs saved to disk by an earlier run if
+            they are younger than this many seconds
+
+    Return:
+        A dictionary with the keys 'heads' and 'tags', each a dictionary of
+        names to commit hashes, or False if the repository could not be read
+    """
+    with _remote_refs_lock:
+        url_lock = _remote_refs_locks.setdefault(url, threading.Lock())
+    with url_lock:
+        if url in _remote_refs:
+            return _remote_refs[url]
+        cache_file = _remote_refs_cache_file(url)
+        if max_age > 0 and os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < max_age:
+            try:
+                with open(cache_file) as cached:
+                    _remote_refs[url] = json.load(cached)
+                return _remote_refs[url]
+            except ValueError:
+                pass
+        refs = _query_remote_refs(url)
+        if refs:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file + '.part', 'w') as cached:
+                json.dump(refs, cached)
+            os.replace(cache_file + '.part', cache_file)
+            # a failed lookup is retried by the next builder that needs it
+            _remote_refs[url] = refs
+        return refs
+
+def _query_remote_refs(url):
+    result = subprocess.run(['git', 'ls-remote', '--heads', '--tags', url], capture_output=True, text=True)
+    if result.returncode != 0:
+        return False
+    refs = {'heads': {}, 'tags': {}}
+    for line in result.stdout.splitlines():
+        parts = line.split('\t')
+        if len(parts) != 2:
+            continue
+        commit, ref = parts
+        if ref.startswith('refs/heads/'):
+            refs['heads'][ref[11:]] = commit
+        elif ref.startswith('refs/tags/'):
+            name = ref[10:]
+            # annotated tags are listed twice, the "^{}" entry is the commit
+            if name.endswith('^{}'):
+                refs['tags'][name[:-3]] = commit
+            elif name not in refs['tags']:
+                refs['tags'][name] = commit
+    return refs
+
+def get_clone_depth_args():
+    """
+    Get the git arguments that limit how much history is downloaded, based on
+    the git_clone_depth setting. A depth of 0 makes a partial clone that
+    fetches file contents only as they are checked out.
+    """
+    depth = int(settings.get('git_clone_depth'))
+    if depth > 0:
+        return ['--depth', str(depth)]
+    return ['--filter=blob:none']
+
 def apply_config_arg_variables(dirty_args=[]):
     clean_args = []
     variables = [
-        ['SW_BUILD_PATH', build_path],
+        ['SW_BUILD_PATH', build_path()],
         ['SW_INSTALL_PATH', settings.get('install_path')]
     ]
     for arg in dirty_args:
@@ -111,19 +299,27 @@ class AbstractBuilder(ABC):
     """
     An abstract class to build source packages downloaded from tar files.
     """
-    def __init__(self, slug, build_dir=build_path + 'src/', source_version=False):
+    def __init__(self, slug, build_dir=False, source_version=False):
+        if not build_dir:
+            build_dir = build_path() + 'src/'
         self.slug = slug
         self.source_version = source_version
         self.build_dir = build_dir
         # a dynamic list of builder objects that are dependant upon this software
         # this shold only be populated by a BuildQueue or similar
         self.dependents = []
+        # a cached install tree that install() restores instead of running make
+        self.cached_install = False
+        # the files written by the last install
+        self.installed_files = []
+        # the newest version found by the last update_needed() call, if known
+        self.available_version = False
 
     def get_build_env(self):
         """
         Return the runtime environment variables used to compilethis package
         """
-        return build_env
+        return apply_ccache(build_env())
 
     @abstractmethod
     def get_source_url(self) -> str:
@@ -148,6 +344,13 @@ class AbstractBuilder(ABC):
         """
         pass
 
+    def manifest_version(self):
+        """
+        The version reference to record in the install manifest after a
+        successful install (see install_manifest.write).
+        """
+        return self.version_reference()
+
     @abstractmethod
     def cleanup_old_versions(self, log):
         """
@@ -165,6 +368,27 @@ class AbstractBuilder(ABC):
         """
         return []
 
+    def source_fingerprint(self):
+        """
+        Returns a string that identifies the exact source code being built.
+        """
+        return self.source_version
+
+    def manifest_args(self):
+        """
+        Returns the arguments to pass to this builder's constructor when it is
+        recreated from the builder manifest (see build_index.Index.reindex).
+        """
+        return []
+
+    def update_check_host(self):
+        """
+        Returns the name of the host contacted by update_needed(). Update checks
+        against the same host are limited by the update_check_host_limit
+        setting. Builders that share a host should return the same name.
+        """
+        return self.slug
+
     def source_dir(self, version=False):
         """
         Returns the path of the source code directory following a download.
@@ -217,9 +441,8 @@ class AbstractBuilder(ABC):
         for name, url in patch_array:
             local_file = local_dir + name
             if not os.path.exists(local_file):
-                response = requests.get(url)
-                with open(local_file, "w") as f:
-                    f.write(response.text)
+                if not source_mirror.fetch_file(self.slug, url, local_file, log):
+                    continue
             log.log('Applying patch ' + name)
             patch_command = ['patch', '-ruN', '-p1', '-d', self.source_dir(), '-i', local_file]
             retval = log.run(patch_command)
@@ -289,23 +512,71 @@ class AbstractBuilder(ABC):
 
     def install(self, log):
         """
-        Install the software to the system.
+        Install the software to the system. "make install" installs to a
+        staging directory first and the staged files are then moved into place,
+        which gives the exact list of files the package installs.
 
         Args:
             log - An open log file or null
         """
-        old_pwd = os.getcwd()
-        target_dir = self.source_dir()
-        if os.path.exists(target_dir):
-            os.chdir(target_dir)
-            log.run(['make', 'install'], env=self.get_build_env())
-            if not settings.get_bool('build_server'):
-                self.clean(log)
-        os.chdir(old_pwd)
+        if self.cached_install:
+            log.log('Restoring installed files from ' + self.cached_install)
+            self.installed_files = install_tree.extract_archive(self.cached_install, staging_parent=build_path())
+        else:
+            old_pwd = os.getcwd()
+            target_dir = self.source_dir()
+            if os.path.exists(target_dir):
+                os.chdir(target_dir)
+                with install_tree.staging_dir(build_path()) as staging:
+                    # PHP names the staging directory INSTALL_ROOT
+                    if self.run_make(log, ['install', 'DESTDIR=' + staging, 'INSTALL_ROOT=' + staging]) == 0:
+                        self.installed_files = install_tree.move_staged(staging, preserved=self.preserved_files())
+                    else:
+                        log.log('make install failed for ' + self.slug + ', leaving the installed files unchanged')
+                if not settings.get_bool('build_server'):
+                    self.clean(log)
+            os.chdir(old_pwd)
+        if settings.get_bool('build_server') and self.deploys_artifact():
+            artifact.create(self.slug, self.manifest_version(), self.installed_files, log)
+
+    def preserved_files(self):
+        """
+        Get the files that "make install" only creates when they are missing,
+        such as configuration files. Existing copies are left alone when a
+        staged install is moved into place. Paths ending with "/" cover
+        everything below them.
+        """
+        return []
+
+    def deploys_artifact(self):
+        """
+        Check if this package is deployed by unpacking an artifact of it's
+        installed files. Builders with an install() that needs the source tree,
+        such as to run additional make targets, return False to have their
+        source tree copied and installed remotely instead.
+        """
+        return True
 
     def make_args(self):
         return []
 
+    def run_make(self, log, args=False):
+        """
+        Run make in the current directory. The number of jobs is chosen by
+        make_jobs.plan_jobs() or, when several builds run at once, by the shared
+        make jobserver.
+
+        Args:
+            log - An open log file or null
+            args - (optional) An array of extra arguments such as targets
+        """
+        make = ['make', '-l', settings.get('max_build_load')]
+        make.extend(make_jobs.job_args(self.slug))
+        if args:
+            make.extend(args)
+        env = make_jobs.apply_jobserver(self.get_build_env())
+        return log.run(make, env=env, pass_fds=make_jobs.jobserver_fds())
+
     def make(self, log):
         """
         Build the software.
@@ -319,9 +590,7 @@ class AbstractBuilder(ABC):
         if os.path.exists(target_dir):
             os.chdir(target_dir)
             #TODO add nice -19
-            make = ['make', '-l', settings.get('max_build_load')]
-            make.extend(self.make_args())
-            retval = log.run(make, env=self.get_build_env())
+            retval = self.run_make(log, self.make_args())
         os.chdir(old_pwd)
         return retval
 
@@ -355,7 +624,7 @@ class AbstractBuilder(ABC):
         target_dir = self.source_dir()
         if os.path.exists(target_dir):
             os.chdir(target_dir)
-            log.run(['make', 'clean', '-l', settings.get('max_build_load')], env=self.get_build_env())
+            self.run_make(log, ['clean'])
         os.chdir(old_pwd)
 
     def check_build(self):
@@ -375,47 +644,101 @@ class AbstractBuilder(ABC):
         logdir = os.path.dirname(logfile)
         if not os.path.exists(logdir):
             os.makedirs(logdir)
+        timer = build_stats.BuildTimer(self.slug, self.source_version)
         with open(logfile, 'w+') as open_log:
             log = logger.Log(open_log)
             log.log("Build started for " + self.slug + " at " + str(datetime.datetime.now()))
             if is_frozen(self.slug):
                 log.log("Note: Running rebuild of frozen package")
             source_url = self.get_source_url()
-            if not is_frozen(self.slug):
+            fetched = True
+            if source_mirror.is_offline() and isinstance(self, AbstractGitBuilder):
+                log.log('Offline mode, building the existing checkout of ' + self.slug)
+            elif not is_frozen(self.slug):
                 log.log('Fetching ' + source_url)
-                self.fetch_source(source_url, log)
-                self.apply_patches(log)
+                with timer.phase('fetch_source'):
+                    fetched = self.fetch_source(source_url, log) != False
+                if fetched:
+                    with timer.phase('apply_patches'):
+                        self.apply_patches(log)
+            if not fetched or not os.path.isdir(self.source_dir()):
+                log.log('Unable to fetch the source code for ' + self.slug + '. Exiting.')
+                os.chdir(old_pwd)
+                email.send_admin_logfile('Build failed for  ' + self.slug, logfile)
+                return False, logfile
             os.chdir(self.source_dir())
             log.log("Running pre-config")
-            self.run_pre_config(log)
+            with timer.phase('run_pre_config'):
+                self.run_pre_config(log)
             log.log("Getting config arguments")
             command = self.populate_config_args(log)
             command = apply_config_arg_variables(command)
+            cache_key = build_cache.get_key(self, command, log)
+            self.cached_install = build_cache.lookup(cache_key)
             config_ret_val = 0
+            ccache_stats = get_ccache_stats()
+            configure_fingerprint = False
             if len(command) > 0:
-                log.log("Running configuration")
-                if debug:
-                    log.log('CONFIG: ' + ' '.join(command))
-                config_ret_val = log.run(command, env=self.get_build_env())
-            log.log("Running make")
-            if config_ret_val != 0:
-                log.log(self.slug + ' configure command failed. (exit code ' + str(config_ret_val) + ') Exiting.')
-            else:
-                make_ret_val = self.make(log)
-                if make_ret_val != 0: # if not success
-                    log.log(self.slug + ' make command failed. (exit code ' + str(make_ret_val) + ') Exiting.')
-                else:
-                    log.log("Installing")
+                configure_fingerprint = configure_cache.get_fingerprint(self, command)
+            if self.cached_install:
+                log.log("Found build cache entry " + cache_key + ", skipping configure and make")
+                install_manifest.forget(self.slug)
+                with timer.phase('install'):
                     self.install(log)
-                    log.log("Build completed for " + self.slug + " at " + str(datetime.datetime.now()))
-                    success = self.check_build()
+                self.cached_install = False
+                log.log("Build completed for " + self.slug + " at " + str(datetime.datetime.now()))
+                success = self.check_build()
+                with timer.phase('cleanup_old_versions'):
                     self.cleanup_old_versions(log)
+            else:
+                if configure_fingerprint and configure_cache.is_configured(self, configure_fingerprint):
+                    log.log("Configuration is unchanged since the last build, skipping configure")
+                elif len(command) > 0:
+                    log.log("Running configuration")
+                    if debug:
+                        log.log('CONFIG: ' + ' '.join(command))
+                    configure_cache.forget(self.slug)
+                    with timer.phase('configure'):
+                        config_ret_val = log.run(command, env=self.get_build_env())
+                    if config_ret_val == 0 and configure_fingerprint:
+                        configure_cache.mark_configured(self, configure_fingerprint)
+                log.log("Running make")
+                if config_ret_val != 0:
+                    log.log(self.slug + ' configure command failed. (exit code ' + str(config_ret_val) + ') Exiting.')
+                else:
+                    with timer.phase('make'):
+                        make_ret_val = self.make(log)
+                    log_ccache_stats(ccache_stats, log)
+                    if make_ret_val != 0: # if not success
+                        log.log(self.slug + ' make command failed. (exit code ' + str(make_ret_val) + ') Exiting.')
+                    else:
+                        log.log("Installing")
+                        self.installed_files = []
+                        install_manifest.forget(self.slug)
+                        with timer.phase('install'):
+                            self.install(log)
+                        log.log("Build completed for " + self.slug + " at " + str(datetime.datetime.now()))
+                        success = self.check_build()
+                        if success:
+                            build_cache.store(self.slug, cache_key, self.installed_files, log)
+                            if configure_fingerprint:
+                                configure_cache.save(self.slug, configure_fingerprint)
+                        with timer.phase('cleanup_old_versions'):
+                            self.cleanup_old_versions(log)
+            if success:
+                build_cache.set_current_key(self.slug, cache_key)
+                install_manifest.write(self.slug, self.manifest_version(), configure_fingerprint, self.installed_files)
+            for name in build_stats.phase_names:
+                if name in timer.phases:
+                    log.log('Timing: ' + name + ' took ' + build_stats.format_seconds(timer.phases[name]['wall']), False)
+        timer.save(success)
 
         os.chdir(old_pwd)
         if not success:
             email.send_admin_logfile('Build failed for  ' + self.slug, logfile)
         elif settings.get_bool('email_admin_on_build_success'):
             email.send_admin_log_clip('Build succeeded for ' + self.slug, logfile)
+        logfile = logger.finish_file(logfile)
         return success, logfile
 
     def update_if_needed(self):
@@ -426,17 +749,41 @@ class AbstractBuilder(ABC):
 
     def deploy(self, remote_address, log):
         """
-        Push a built package from a buid server to a production server.
+        Push a built package from a buid server to a production server. The
+        install tree artifact made during the build is copied over and
+        unpacked, falling back to copying the source tree and running the
+        install remotely for packages without an artifact.
         """
         log.log('Starting remote install of ' + self.slug + ' to ' + remote_address)
-        dir = self.source_dir()
-        if dir[-1:] != '/':
-            dir += '/'
-        subprocess.getoutput('ssh root@' + remote_address + ' -t "mkdir -p \'' + dir + '\'"')
-        subprocess.getoutput("rsync -a --delete '" + dir + "' root@'" + remote_address + "':'" + dir + "'")
-        subprocess.getoutput('ssh root@' + remote_address + ' -t "sw build installprebuilt ' + self.slug + '" + "' + self.source_version + '"')
+        archive = False
+        if self.deploys_artifact():
+            archive = artifact.verify(self.slug)
+        manifest = artifact.read_manifest(self.slug)
+        if archive:
+            remote_dir = artifact.artifact_dir()
+            log.log('Sending ' + manifest['archive'] + ' (' + build_cache.format_size(manifest['size']) + ')')
+            remote.run(remote_address, "mkdir -p '" + remote_dir + "'")
+            result = remote.rsync(remote_address, [archive, artifact.manifest_path(self.slug)], remote_dir)
+            if result.returncode != 0:
+                log.log('Unable to send ' + manifest['archive'] + ' to ' + remote_address + ': ' + result.stderr.strip())
+                return False
+            result = remote.run(remote_address, 'sw build installartifact ' + self.slug)
+        else:
+            dir = self.source_dir()
+            if dir[-1:] != '/':
+                dir += '/'
+            remote.run(remote_address, "mkdir -p '" + dir + "'")
+            result = remote.rsync(remote_address, [dir], dir, ['--delete'])
+            if result.returncode != 0:
+                log.log('Unable to send ' + dir + ' to ' + remote_address + ': ' + result.stderr.strip())
+                return False
+            result = remote.run(remote_address, 'sw build installprebuilt ' + self.slug + " '" + str(self.source_version) + "'")
+        if len(result.stdout) > 0:
+            log.log(result.stdout.rstrip(), False)
+        if result.returncode != 0:
+            log.log('Remote install of ' + self.slug + ' failed on ' + remote_address)
+            return False
         log.log('Completed remote install of ' + self.slug + ' to ' + remote_address)
-        #TODO return success
         return True
 
     def needs_deploy(self, remote_address, log, force=False):
@@ -448,7 +795,11 @@ class AbstractBuilder(ABC):
             # Force can be ignored in overriding implementations.  This is the case with PHP as
             # the version of PHP may not be enabled on the target server.
         local_ver = str(self.version_reference()).strip()
-        remote_ver = subprocess.getoutput('ssh root@' + remote_address + ' -t "sw build version ' + self.slug + '" 2>/dev/null').strip()
+        inventory = remote.get_inventory(remote_address)
+        if inventory != False:
+            remote_ver = str(inventory.get(self.slug, '')).strip()
+        else:
+            remote_ver = remote.run(remote_address, 'sw build version ' + self.slug + ' 2>/dev/null').stdout.strip()
         # print('L: "' + local_ver + '", R: "' + remote_ver + '"')
         return local_ver != remote_ver
 
@@ -478,20 +829,58 @@ def find_old_build_elements(pre_ver_text, post_ver_text):
                 elements.append(entry)
     return elements
 
+def find_old_build_logs(pre_ver_text):
+    """
+    Locate log files from outdated versions, whether or not they have been
+    compressed by logger.finish_file().
+
+    Args:
+        pre_ver_text - The path of the logs up to the version number
+    """
+    logs = {}
+    for post_ver_text in ['.log', '.log.zst']:
+        for entry in glob.glob(pre_ver_text + '*' + post_ver_text):
+            this_version = entry[len(pre_ver_text):0 - len(post_ver_text)]
+            logs.setdefault(this_version, []).append(entry)
+    current_version = False
+    for this_version in logs:
+        if not current_version or version.first_is_higher(this_version, current_version):
+            current_version = this_version
+    elements = []
+    for this_version, entries in logs.items():
+        if this_version != current_version:
+            elements += entries
+    return elements
+
 class AbstractArchiveBuilder(AbstractBuilder):
     """Abstract class to build source packages downloaded from tar files."""
 
     @abstractmethod
-    def get_installed_version(self):
+    def probe_installed_version(self):
         """
         Get the version of the software installed on the system or the number 0
-        if missing.
+        if missing by inspecting the installed files. This is only used for
+        packages without an install manifest.
         """
         pass
 
+    def get_installed_version(self):
+        """
+        Get the version of the software installed on the system or the number 0
+        if missing. The version is read from the install manifest when there is
+        one.
+        """
+        installed = install_manifest.get_version(self.slug)
+        if installed:
+            return installed
+        return self.probe_installed_version()
+
     def version_reference(self):
         return self.get_installed_version()
 
+    def manifest_version(self):
+        return self.source_version
+
     @abstractmethod
     def get_updated_version(self):
         """
@@ -502,6 +891,11 @@ class AbstractArchiveBuilder(AbstractBuilder):
     def updated_version_reference(self):
         if is_frozen(self.slug):
             return self.version_reference()
+        if source_mirror.is_offline():
+            mirrored = source_mirror.latest_version(self.slug)
+            if mirrored:
+                return mirrored
+            return self.version_reference()
         return self.get_updated_version()
 
     def cleanup_old_versions(self, log):
@@ -513,7 +907,7 @@ class AbstractArchiveBuilder(AbstractBuilder):
         """
         found = False
         found_version = False
-        for log_file in find_old_build_elements(settings.get('install_path') + 'var/log/build/' + self.slug + '-', '.log'):
+        for log_file in find_old_build_logs(settings.get('install_path') + 'var/log/build/' + self.slug + '-'):
             os.remove(log_file)
             log.log("Removed old log file " + log_file)
         search = self.source_dir('VERSION')
@@ -530,6 +924,7 @@ class AbstractArchiveBuilder(AbstractBuilder):
         if old == False or len(old) == 0:
             return True
         new = self.updated_version_reference()
+        self.available_version = new
         return version.first_is_higher(new, old)
 
     def log_name(self):
@@ -541,32 +936,29 @@ class AbstractArchiveBuilder(AbstractBuilder):
         name += '.log'
         return name
 
+    def get_source_checksum(self):
+        """
+        Get the published checksum of the source archive, either as
+        "algorithm:hex" or as a sha256 hex digest, or False if there is none.
+        """
+        return False
+
     def fetch_source(self, source, log):
         """
-        Fetch the source tar file and extract it
-        """
-        ext = ''
-        type = ''
-        if source [-7:] == '.tar.gz':
-            ext = '.tar.gz'
-            type = 'r:gz'
-        elif source [-8:] == '.tar.bz2':
-            ext = '.tar.bz2'
-            type = 'r:bz2'
-        elif source [-4:] == '.tgz':
-            ext = '.tgz'
-            type = 'r:gz'
-        tarname = self.build_dir + self.slug + '-' + self.source_version + ext
-        if not os.path.exists(self.build_dir):
-            os.makedirs(self.build_dir)
-        response = requests.get(source)
-        with open(tarname, "wb") as f:
-            f.write(response.content)
-        print('')
-        with tarfile.open(tarname, type) as tar:
-            tar.extractall(self.build_dir)
-        os.remove(tarname)
-        #print(tarname)
+        Extract the source tar file from the source mirror, downloading it
+        first if needed
+        """
+        def checksum():
+            value = self.get_source_checksum()
+            if not value:
+                log.log('No checksum published for ' + source + ', only the download size will be verified')
+            return value
+        if not source_mirror.fetch_archive(self.slug, self.source_version, source, self.build_dir, log, checksum):
+            # never build from a tree that was extracted from a bad download
+            if os.path.isdir(self.source_dir()):
+                shutil.rmtree(self.source_dir())
+            return False
+        return True
 
     def build(self):
         if not self.source_version:
@@ -575,26 +967,60 @@ class AbstractArchiveBuilder(AbstractBuilder):
 
 class AbstractGitBuilder(AbstractBuilder):
     "Abstract class to build packages from a git repository."
-    def __init__(self, slug, build_dir=build_path + 'src/', source_version=False, branch='master'):
+    def __init__(self, slug, build_dir=False, source_version=False, branch='master'):
         self.branch = branch
         super().__init__(slug, build_dir, source_version)
 
     def cleanup_old_versions(self, log):
         pass
 
+    def update_check_host(self):
+        return urlparse(self.get_source_url()).hostname
+
     def update_needed(self):
         if is_frozen(self.slug):
             return False
         if not os.path.exists(self.source_dir()):
             return True
-        old_pwd = os.getcwd()
-        os.chdir(self.source_dir())
-        output = subprocess.getoutput("git remote show origin | grep '(up to date)'")
-        up_to_date = len(output) > 0
-        os.chdir(old_pwd)
-        return not up_to_date
+        if source_mirror.is_offline():
+            return False # the existing checkout is all there is to build
+        refs = get_remote_refs(self.get_source_url())
+        if not refs:
+            return False # the remote could not be read, so no update is known
+        if self.branch not in refs['heads']:
+            return True
+        self.available_version = refs['heads'][self.branch][:12]
+        return refs['heads'][self.branch] != self.source_fingerprint()
+
+    def get_remote_tags(self):
+        """
+        Get an array of the tag names in the remote repository. Tags are cached
+        on disk for the build_cache_age setting since releases are infrequent.
+        If the remote can not be read, the tags already fetched into the local
+        checkout are used instead.
+        """
+        refs = get_remote_refs(self.get_source_url(), settings.get_num('build_cache_age'))
+        if not refs:
+            result = subprocess.run(['git', '-C', self.source_dir(), 'tag', '-l'], capture_output=True, text=True)
+            if result.returncode != 0:
+                return []
+            return result.stdout.splitlines()
+        return list(refs['tags'])
 
     def version_reference(self):
+        installed = install_manifest.get_version(self.slug)
+        if installed:
+            return installed
+        return self.probe_version_reference()
+
+    def manifest_version(self):
+        return self.probe_version_reference()
+
+    def probe_version_reference(self):
+        """
+        Get the version reference from the source code or installed program.
+        This is only used for packages without an install manifest.
+        """
         #TODO get a version number from the installed program instead of the source code
         bash = 'date -d "$(git -C "' + self.source_dir() + '" log -1 | grep -i "date" | head -1 | awk \'{print $2" "$3" "$4" "$6" "$5$7}\')" +%s'
         commit_date = subprocess.getoutput(bash)
@@ -603,6 +1029,9 @@ class AbstractGitBuilder(AbstractBuilder):
     def source_dir(self):
         return self.build_dir + self.slug + '/'
 
+    def source_fingerprint(self):
+        return subprocess.getoutput('git -C "' + self.source_dir() + '" rev-parse HEAD')
+
     def get_clone_args(self):
         return []
 
@@ -613,9 +1042,8 @@ class AbstractGitBuilder(AbstractBuilder):
         Args:
             log (optional) - a Logger object to run commands through
         """
-        old_pwd = os.getcwd()
-        os.chdir(self.build_dir)
-        run_command = ['git', 'clone', self.get_source_url()]
+        run_command = ['git', '-C', self.build_dir, 'clone', self.get_source_url()]
+        run_command.extend(get_clone_depth_args())
         run_command.extend(self.get_clone_args())
         if self.branch:
             run_command.extend(['--branch', self.branch])
@@ -623,7 +1051,6 @@ class AbstractGitBuilder(AbstractBuilder):
             subprocess.run(run_command)
         else:
             log.run(run_command)
-        os.chdir(old_pwd)
 
     def fetch_source(self, source, log):
         old_pwd = os.getcwd()
@@ -638,6 +1065,24 @@ class AbstractGitBuilder(AbstractBuilder):
             self.git_init(log)
         os.chdir(old_pwd)
 
+    def fetch_tag(self, tag, log=False):
+        """
+        Fetch a single tag from the remote repository so that it can be
+        checked out, without downloading any other tags or branches.
+
+        Args:
+            tag - The name of the tag
+            log (optional) - a Logger object to run commands through
+        """
+        run_command = ['git', '-C', self.source_dir(), 'fetch', '--no-tags']
+        depth = int(settings.get('git_clone_depth'))
+        if depth > 0:
+            run_command.extend(['--depth', str(depth)])
+        run_command.extend(['origin', 'tag', tag])
+        if log == False:
+            return subprocess.run(run_command).returncode
+        return log.run(run_command)
+
     def fetch_submodules(self, source, log):
         old_pwd = os.getcwd()
         target_dir = self.source_dir()
@@ -670,7 +1115,7 @@ class AbstractGitBuilder(AbstractBuilder):
 
 class AbstractTagBuilder(AbstractGitBuilder):
     "Abstract class to build packages from a git repository using the latest tag."
-    def __init__(self, slug, build_dir=build_path + 'src/', source_version=False, branch=False):
+    def __init__(self, slug, build_dir=False, source_version=False, branch=False):
         super().__init__(slug, build_dir, source_version, branch)
 
     def update_needed(self):
@@ -678,37 +1123,45 @@ class AbstractTagBuilder(AbstractGitBuilder):
             return False
         if not os.path.exists(self.source_dir()):
             return True
-        return self.latest_tag() != self.version_reference()
+        if source_mirror.is_offline():
+            return False
+        self.available_version = self.latest_tag()
+        if not self.available_version:
+            return False # no tags could be read, so no update is known
+        return self.available_version != self.version_reference()
 
-    def version_reference(self):
+    def probe_version_reference(self):
         #TODO get a version number from the installed program instead of the source code
-        checkout_tag = subprocess.getoutput('git describe --exact-match --tags')
+        checkout_tag = subprocess.getoutput('git -C "' + self.source_dir() + '" describe --exact-match --tags')
         #print('Current tag: ' + checkout_tag);
         return checkout_tag
 
     def latest_tag(self):
-        old_pwd = os.getcwd()
-        os.chdir(self.source_dir())
-        subprocess.run(['git', 'fetch'])
-        tag_list = subprocess.getoutput('git tag -l')
         block_list = self.tag_blocklist()
-        latest_tag: (str | bool) = False
-        for tag in tag_list.splitlines():
+        tags = []
+        for tag in self.get_remote_tags():
             if tag not in block_list and self.tag_is_okay(tag):
-                if not latest_tag or version.first_is_higher(tag, latest_tag):
-                    latest_tag = tag
+                tags.append(tag)
+        if len(tags) == 0:
+            return False
+        latest_tag = max(tags, key=version.sort_key)
         #print('Latest tag: ' + latest_tag);
         return latest_tag
 
     def fetch_source(self, source, log):
         old_pwd = os.getcwd()
         target_dir = self.source_dir()
+        if not self.branch: self.branch = self.latest_tag()
         if os.path.exists(target_dir):
             os.chdir(target_dir)
             self.clean(log)
-            if not self.branch: self.branch = self.latest_tag()
-            log.log('Checking out branch ' + self.branch)
-            log.run(['git', 'checkout', self.branch])
+            if self.branch:
+                log.log('Checking out branch ' + self.branch)
+                if self.branch in self.get_remote_tags():
+                    self.fetch_tag(self.branch, log)
+                log.run(['git', 'checkout', self.branch])
+            else:
+                log.log('Unable to find the latest tag of ' + self.slug + ', keeping the current checkout')
             self.fetch_submodules(source, log)
         else:
             self.git_init(log)
@@ -740,11 +1193,11 @@ def get_systemd_config_path():
     return possibilities[0]
 
 def get_pkg_config_var(package_name, variable):
-    command = 'PKG_CONFIG_PATH="' + pkg_config_path + '" pkg-config "--variable=' + variable + '" "' + package_name + '"'
+    command = 'PKG_CONFIG_PATH="' + pkg_config_path() + '" pkg-config "--variable=' + variable + '" "' + package_name + '"'
     return subprocess.getoutput(command)
 
 def start_build_shell(target=False):
-    shell_env = build_env
+    shell_env = build_env()
     if(target):
         shell_env = target.get_build_env()
     init_file = settings.get('install_path') + 'etc/bashrc'
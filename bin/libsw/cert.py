@@ -2,7 +2,6 @@
 
 import os
 import glob
-import inquirer
 import subprocess
 import re
 from pwd import getpwnam
@@ -13,8 +12,14 @@ from libsw import email, nginx, settings, logger, file_filter, user
 le_directory = '/etc/letsencrypt/'
 source_cert_dir = le_directory + 'live'
 source_key_dir = le_directory + 'live'
-target_cert_dir = settings.get('exim_folder') + 'ssl/certs'
-target_key_dir = settings.get('exim_folder') + 'ssl/private'
+
+def target_cert_dir():
+    """The directory Exim reads certificates from."""
+    return settings.get('exim_folder') + 'ssl/certs'
+
+def target_key_dir():
+    """The directory Exim reads private keys from."""
+    return settings.get('exim_folder') + 'ssl/private'
 
 def get_mail_domain_list(domain):
     """
@@ -87,6 +92,7 @@ def select_domain(query_message):
     Args:
         query_message - The message to display in the prompt
     """
+    import inquirer
     files = []
     for filename in glob.glob(source_cert_dir + '/*/cert.pem'):
         domain = filename[ len(source_cert_dir)+1 : -9 ]
@@ -212,7 +218,7 @@ def deploy_exim_cert(source_domain, target_domain, log=logger.Log(False)):
 
     # Public Certificate
     source = source_cert_dir + '/' + source_domain + '/fullchain.pem'
-    target = target_cert_dir + '/' + target_domain + '.pem'
+    target = target_cert_dir() + '/' + target_domain + '.pem'
     if not os.path.exists(source):
         log.log('Warning: no certificate found at ' + source)
     else:
@@ -220,7 +226,7 @@ def deploy_exim_cert(source_domain, target_domain, log=logger.Log(False)):
 
     # Private Key
     source = source_key_dir + '/' + source_domain + '/privkey.pem'
-    target = target_key_dir + '/' + target_domain + '.pem'
+    target = target_key_dir() + '/' + target_domain + '.pem'
     if not os.path.exists(source):
         log.log('Warning: no private key found at ' + source)
     else:
@@ -253,11 +259,11 @@ def remove_exim_domain(domain):
     deleted = False
     #TODO - read covered domains instead of using a set list
     for sub in get_mail_domain_list(domain):
-        cert = target_cert_dir + '/' + sub + '.pem'
+        cert = target_cert_dir() + '/' + sub + '.pem'
         if os.path.exists(cert):
             os.remove(cert)
             deleted = True
-        key = target_key_dir + '/' + sub + '.pem'
+        key = target_key_dir() + '/' + sub + '.pem'
         if os.path.exists(key):
             os.remove(key)
             deleted = True
@@ -272,10 +278,10 @@ def has_exim_certs(domain):
         domain - The primary domain to check
     """
     for sub in get_mail_domain_list(domain):
-        cert = target_cert_dir + '/' + sub + '.pem'
+        cert = target_cert_dir() + '/' + sub + '.pem'
         if os.path.exists(cert):
             return True
-        key = target_key_dir + '/' + sub + '.pem'
+        key = target_key_dir() + '/' + sub + '.pem'
         if os.path.exists(key):
             return True
     return False
@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 
-import inquirer
-import inspect
 import os
+import importlib
+
+_commands_loaded = False
+
+def load_commands():
+    """
+    Import every module in bin/commands so that all commands are registered.
+    Completions only import the module of the command being completed.
+    """
+    global _commands_loaded
+    if _commands_loaded:
+        return
+    _commands_loaded = True
+    import commands
+    for name in sorted(commands.__all__):
+        importlib.import_module('commands.' + name)
 
 def sorted_category_list():
     """
     Compile a list of all command categories from all registered commands.
     """
+    load_commands()
     slug_list = []
     for command in Index.help_index:
         cat = command[0]
@@ -72,6 +87,7 @@ class Index():
         if category == 'complete':
             self.autocomplete()
             return True
+        load_commands()
         category = category.strip().lower()
         command = command.strip().lower()
         for com in Index.index:
@@ -81,6 +97,7 @@ class Index():
                 if rootonly and os.getuid() != 0:
                     print('"' + command + ' ' + category + '" can only be run as root')
                     return False
+                import inspect
                 sig = inspect.signature(function)
                 params = len(sig.parameters)
                 if params == 0:
@@ -121,13 +138,13 @@ class Index():
         self.autocomplete_args(args[0], args[1], args[2:], end_with_space)
 
     def autocomplete_category(self, category):
+        from libsw import completion_cache
         category = category.lower()
         length = len(category)
         possible_categories = []
         if category == 'help'[:length]:
             possible_categories.append('help')
-        for com in Index.index:
-            test_category = com[0]
+        for test_category in completion_cache.get('commands'):
             if test_category[:length] == category:
                 if test_category not in possible_categories:
                     possible_categories.append(test_category)
@@ -135,25 +152,26 @@ class Index():
             print(possible + '\n')
 
     def autocomplete_command(self, category, command):
+        from libsw import completion_cache
         category = category.lower()
         command = command.lower()
         length = len(command)
-        possible_commands = []
         if category == 'help':
             self.autocomplete_category(command)
-        for com in Index.index:
-            test_category = com[0]
-            test_command = com[1]
-            if test_category == category:
-                if test_command[:length] == command:
-                    if test_category not in possible_commands:
-                        possible_commands.append(test_command)
-        for possible in possible_commands:
-            print(possible + '\n')
+        commands = completion_cache.get('commands').get(category, {})
+        for test_command in commands:
+            if test_command[:length] == command:
+                print(test_command + '\n')
 
     def autocomplete_args(self, category, command, arg_array, end_with_space):
+        from libsw import completion_cache
         category = category.lower()
         command = command.lower()
+        module = completion_cache.get('commands').get(category, {}).get(command, False)
+        if module == False:
+            return
+        # only the module with the autocomplete function needs to be imported
+        importlib.import_module(module)
         for com in Index.index:
             test_category = com[0]
             test_command = com[1]
@@ -169,6 +187,7 @@ class Index():
         Args:
             category - Print help for this category (False for all categories)
         """
+        load_commands()
         extra_help = True
         from libsw import settings
         if settings.get_bool('compact_help') and category:
@@ -213,6 +232,7 @@ class Index():
         Args:
             category - Check this category name
         """
+        load_commands()
         category = category.strip().lower()
         for com in Index.index:
             if com[0] == category:
@@ -247,8 +267,3 @@ class CategoryIndex(Index):
                 an array.
         """
         return super().register_command(self.category, command, function, rootonly, autocomplete)
-
-# Since the commands we are importing import this file,
-# this import line needs to be after the declaration
-# for Index()
-from commands import *
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from libsw import settings
+
+# the cache file contents, read once per process
+_cache = False
+
+def cache_path():
+    """The file that holds the completion cache."""
+    return settings.get('install_path') + 'var/cache/completion.json'
+
+def _commands_paths():
+    import commands
+    directory = os.path.dirname(os.path.realpath(commands.__file__)) + '/'
+    return [directory] + [directory + name + '.py' for name in commands.__all__]
+
+def _commands():
+    from libsw import command_index
+    command_index.load_commands()
+    categories = {}
+    for com in command_index.Index.index:
+        module = False
+        if com[4] != False:
+            module = com[4].__module__
+        categories.setdefault(com[0], {})[com[1]] = module
+    return categories
+
+def _slugs_paths():
+    from libsw import build_index
+    return [build_index._get_manifest_file()]
+
+def _slugs():
+    from libsw import build_index
+    return build_index.registered_slugs()
+
+def _installed_paths():
+    from libsw import build_index
+    return [build_index._get_manifest_file(), build_index._get_enabled_slugs_file()]
+
+def _installed():
+    from libsw import build_index
+    return build_index.get_list_with_dependants(build_index.get_installed())
+
+def _uninstallable():
+    from libsw import build_index
+    slug_list = []
+    for slug in build_index.registered_slugs():
+        builder = build_index.get_builder(slug)
+        if hasattr(builder, 'uninstall') and callable(builder.uninstall):
+            slug_list.append(slug)
+    return slug_list
+
+def _frozen_paths():
+    return [settings.get('install_path') + 'etc/build-freeze']
+
+def _frozen():
+    from libsw import builder
+    if not os.path.exists(_frozen_paths()[0]):
+        return []
+    return builder.list_frozen()
+
+def _zone_paths():
+    from libsw import bind
+    return [bind.zone_folder]
+
+def _zones():
+    from libsw import bind
+    return bind.get_zone_file_slugs()
+
+def _disabled_zones():
+    from libsw import bind
+    return bind.get_disabled_zone_file_slugs()
+
+def _mail_domains():
+    from libsw import email
+    return email.get_mail_domains()
+
+def _email_addrs():
+    from libsw import email
+    return email.get_email_addrs()
+
+def _users():
+    from libsw import user
+    return user.get_user_list()
+
+# source name -> [function returning the paths to watch, function returning the values]
+sources = {
+    'commands': [_commands_paths, _commands],
+    'slugs': [_slugs_paths, _slugs],
+    'installed': [_installed_paths, _installed],
+    'uninstallable': [_slugs_paths, _uninstallable],
+    'frozen': [_frozen_paths, _frozen],
+    'zones': [_zone_paths, _zones],
+    'disabled_zones': [_zone_paths, _disabled_zones],
+    'mail_domains': [lambda: [settings.get('mail_domain_file')], _mail_domains],
+    'email_addrs': [lambda: [settings.get('mail_shadow_file')], _email_addrs],
+    'users': [lambda: ['/etc/passwd', '/home'], _users]
+}
+
+def _mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+def _read():
+    global _cache
+    if _cache == False:
+        try:
+            with open(cache_path()) as cache_file:
+                _cache = json.load(cache_file)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+def _save():
+    path = cache_path()
+    temp_path = path + '.' + str(os.getpid()) + '.part'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # email addresses are cached, keep them private
+        descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(_cache, cache_file)
+        os.replace(temp_path, path)
+    except OSError:
+        # users without write access still get completions, just uncached
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def get(name):
+    """
+    Get the completion values of a source, such as the installed slugs or the
+    email addresses. Cached values are used until one of the files they were
+    read from is modified or the source is invalidated.
+
+    Args:
+        name - The name of an entry in sources
+
+    Return:
+        An array of values, or for the "commands" source a dictionary of
+        categories to dictionaries of command names to the module name of
+        their autocomplete function (False if they have none)
+    """
+    cache = _read()
+    entry = cache.get(name)
+    if entry and _mtimes(entry['mtimes'].keys()) == entry['mtimes']:
+        return entry['values']
+    paths_function, values_function = sources[name]
+    # take the modification times first so that changes made while the
+    # values are read are caught by the next lookup
+    mtimes = _mtimes(paths_function())
+    values = values_function()
+    cache[name] = {'mtimes': mtimes, 'values': values}
+    _save()
+    return values
+
+def invalidate(*names):
+    """
+    Drop cached completion values after a command changed what they were read
+    from. Changes made outside of Site Wrangler are detected by get().
+
+    Args:
+        names - The source names to drop, drops everything when omitted
+    """
+    global _cache
+    if len(names) == 0:
+        _cache = {}
+        if os.path.exists(cache_path()):
+            try:
+                os.remove(cache_path())
+            except OSError:
+                pass
+        return
+    cache = _read()
+    changed = False
+    for name in names:
+        if cache.pop(name, None) != None:
+            changed = True
+    if changed:
+        _save()
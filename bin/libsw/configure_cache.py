@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+from libsw import settings, build_cache
+
+# written to the source tree once configure succeeds, since a Makefile can
+# also come with the source or be edited in place by the configure step
+stamp_name = '.sw-configured'
+
+def _fingerprint_file(slug):
+    return settings.get('install_path') + 'var/cache/configure/' + slug
+
+def _stamp_file(builder):
+    return os.path.join(builder.source_dir(), stamp_name)
+
+def _read(path):
+    if not os.path.exists(path):
+        return False
+    with open(path) as stored:
+        return stored.read().strip()
+
+def _file_list(file_path_list):
+    if type(file_path_list) is str:
+        return [file_path_list]
+    return list(file_path_list)
+
+def get_fingerprint(builder, command):
+    """
+    Calculate a fingerprint of everything that affects the output of a
+    configure command: the expanded command line, the build environment, the
+    config argument files, the configure script and the source version.
+
+    Args:
+        builder - The builder being built
+        command - The configure command array with all variables applied
+    """
+    hasher = hashlib.sha256()
+    hasher.update(('command:' + '\0'.join(command) + '\n').encode())
+    hasher.update(('source:' + str(builder.source_fingerprint()) + '\n').encode())
+    env = builder.get_build_env()
+    for name in build_cache.key_env_vars + ['PATH']:
+        hasher.update(('env:' + name + '=' + env.get(name, '') + '\n').encode())
+    for path in _file_list(builder.get_config_arg_file()):
+        hasher.update(('config:' + path + '\n').encode())
+        build_cache._hash_file(hasher, path)
+    # any edit of a user config file forces a reconfigure, even a touch
+    for path in _file_list(builder.get_user_config_arg_file()):
+        hasher.update(('user config:' + path + '\n').encode())
+        if os.path.exists(path):
+            hasher.update(str(os.stat(path).st_mtime_ns).encode())
+        build_cache._hash_file(hasher, path)
+    hasher.update(b'script:')
+    build_cache._hash_file(hasher, os.path.join(builder.source_dir(), command[0]))
+    return hasher.hexdigest()
+
+def is_configured(builder, fingerprint):
+    """
+    Returns True if the source tree was configured by the last successful
+    build with the same fingerprint and has not been replaced or cleaned since.
+
+    Args:
+        builder - The builder being built
+        fingerprint - A fingerprint from get_fingerprint()
+    """
+    if _read(_stamp_file(builder)) != fingerprint:
+        return False
+    return _read(_fingerprint_file(builder.slug)) == fingerprint
+
+def mark_configured(builder, fingerprint):
+    """
+    Record in the source tree that configure succeeded with a fingerprint.
+
+    Args:
+        builder - The builder that was configured
+        fingerprint - A fingerprint from get_fingerprint()
+    """
+    with open(_stamp_file(builder), 'w') as stamp:
+        stamp.write(fingerprint + '\n')
+
+def save(slug, fingerprint):
+    """
+    Record the fingerprint of a successful build.
+
+    Args:
+        slug - The slug name of the software that was built
+        fingerprint - A fingerprint from get_fingerprint()
+    """
+    path = _fingerprint_file(slug)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as stored:
+        stored.write(fingerprint + '\n')
+
+def forget(slug):
+    """
+    Remove the stored fingerprint so that the next build runs configure.
+
+    Args:
+        slug - The slug name of the software
+    """
+    path = _fingerprint_file(slug)
+    if os.path.exists(path):
+        os.remove(path)
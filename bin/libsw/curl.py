@@ -2,13 +2,13 @@
 
 import os
 import re
-import requests
 import glob
 import subprocess
 from libsw import logger, version, builder, settings, file_filter
 
-build_path = settings.get('build_path')
-binary_path = build_path + 'bin/curl'
+def binary_path():
+    """The path of the curl binary."""
+    return builder.build_path() + 'bin/curl'
 
 class CurlBuilder(builder.AbstractArchiveBuilder):
     """
@@ -17,8 +17,8 @@ class CurlBuilder(builder.AbstractArchiveBuilder):
     def __init__(self):
         super().__init__('curl')
 
-    def get_installed_version(self):
-        about_text = subprocess.getoutput(builder.set_sh_ld + binary_path + ' -V')
+    def probe_installed_version(self):
+        about_text = subprocess.getoutput(builder.set_sh_ld() + binary_path() + ' -V')
         match = re.match(r'curl ([0-9\.]*)', about_text)
         if match == None:
             return '0'
@@ -26,10 +26,11 @@ class CurlBuilder(builder.AbstractArchiveBuilder):
         return version
 
     def get_updated_version(self):
-        request = requests.get('https://curl.haxx.se/download.html')
+        from libsw import http_client
+        page = http_client.get_text('https://curl.haxx.se/download.html')
         regex = re.compile(r'\.tar\.gz')
         link_line = False
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             match = regex.search(line)
             if match == None:
                 continue
@@ -42,13 +43,16 @@ class CurlBuilder(builder.AbstractArchiveBuilder):
     def get_source_url(self):
         return 'https://curl.haxx.se/download/curl-' + self.source_version + '.tar.gz'
 
+    def update_check_host(self):
+        return 'curl.haxx.se'
+
     def dependencies(self):
         return ['openssl']
 
 def libs_path():
     path = settings.get('curl_libs')
     if path == 'unset':
-        paths = builder.ld_path.split(':')
+        paths = builder.ld_path().split(':')
         at = -1
         while path == 'unset' or not os.path.exists(path + '/libcurl.so'):
             at += 1
@@ -62,7 +66,7 @@ def get_curl_path():
   """
   Get the path the current curl source directory.
   """
-  dirs = glob.glob(build_path + 'src/curl-*/')
+  dirs = glob.glob(builder.build_path() + 'src/curl-*/')
   dir = False
   for d in dirs:
       if not dir:
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import inquirer
 from mysql import connector
 from getpass import getpass
 from libsw import settings
@@ -238,6 +237,7 @@ def select_database(query_message, mydb):
         query_message - The messages to display in the prompt
         mydb - A connected MySQL connection
     """
+    import inquirer
     questions = [
         inquirer.List('d',
                     message=query_message,
@@ -254,6 +254,7 @@ def select_user(query_message, mydb):
         query_message - The messages to display in the prompt
         mydb - A connected MySQL connection
     """
+    import inquirer
     questions = [
         inquirer.List('u',
                     message=query_message,
@@ -3,7 +3,7 @@
 import subprocess
 import os
 
-from libsw import file_filter, settings, build_queue, build_index, logger
+from libsw import file_filter, settings, build_queue, build_index, logger, remote, update_status
 
 def register_ip(ip):
     path = settings.get('install_path') +  'etc/remote-deploy'
@@ -25,80 +25,205 @@ def get_registered_ips():
                 ip_list.append(line)
     return ip_list
 
+def _failed_file(ip):
+    return settings.get('install_path') + 'etc/deploy-failures/' + ip
+
+class HostDeployment():
+    """
+    The deployment state of one production server. Each server keeps it's own
+    package statuses so that servers can be deployed to at the same time.
+    """
+    def __init__(self, ip, queue, force, log):
+        """
+        Args:
+            ip - The address of the production server
+            queue - A build queue holding every builder to deploy
+            force - Deploy packages even if the server has the same version
+            log - An open log for progress messages
+        """
+        self.ip = ip
+        self.queue = queue
+        self.force = force
+        self.log = log
+        self.failures = []
+        if os.path.exists(_failed_file(ip)):
+            self.failures = file_filter.get_trimmed_file_as_array(_failed_file(ip))
+        self.statuses = {}
+        self.status_cache = {}
+        for builder, status in queue.queue:
+            if builder.slug in self.failures:
+                self.statuses[builder.slug] = 'waiting'
+            else:
+                self.statuses[builder.slug] = ''
+
+    def message(self, line):
+        """Log a line prefixed with the server address."""
+        self.log.log('[' + self.ip + '] ' + line)
+
+    def live_status(self, builder, level=0):
+        """
+        Recalculate the status of a builder deployment by checking it's
+        dependencies. The result is cached until a status changes.
+
+        Args:
+            builder - The builder to check
+            level - The recursive depth level the status check is in
+        """
+        if builder.slug not in self.status_cache:
+            self.status_cache[builder.slug] = self._calculate_status(builder, level)
+        return self.status_cache[builder.slug]
+
+    def _calculate_status(self, builder, level):
+        status = self.statuses.get(builder.slug, 'missing')
+        if status == '' or status == 'waiting':
+            if status == '' and not builder.needs_deploy(self.ip, self.log, self.force):
+                status = 'pass'
+            else:
+                status = 'ready'
+            deps = builder.dependencies()
+            if len(deps) > 0:
+                for slug in deps:
+                    dep_builder, dep_status = self.queue.entry(slug)
+                    if dep_status == False:
+                        self.message('Unable to find package "' + slug + '" needed for "' + builder.slug + '"')
+                        return 'failed'
+                    dep_status = self.live_status(dep_builder, level + 1)
+                    if dep_status == 'failed' or dep_status == 'missing':
+                        return 'failed'
+                    elif dep_status == 'waiting' or dep_status == 'ready':
+                        status = 'waiting'
+                    elif dep_status == 'done':
+                        if status != 'waiting':
+                            status = 'ready'
+
+        if debug:
+            dmsg = 'Checking:'
+            for i in range(level):
+                dmsg += ' '
+            dmsg += builder.slug + ' ' + status
+            print(dmsg)
+        return status
+
+    def status_list(self):
+        """
+        Get the deployment status of every package without deploying anything,
+        as an array of dictionaries with the keys host, slug and status.
+        """
+        statuses = []
+        for builder, status in self.queue.queue:
+            statuses.append({'host': self.ip, 'slug': builder.slug, 'status': self.live_status(builder)})
+        return statuses
+
+    def check(self):
+        """
+        Log the deployment status of every package without deploying anything.
+        """
+        for entry in self.status_list():
+            self.message(entry['slug'] + ' ' + entry['status'])
+
+    def run(self):
+        """
+        Deploy every package that the server needs. The output of each package
+        deployment goes to the builder's deploy log.
+
+        Return:
+            The number of packages that failed to deploy
+        """
+        for builder, status in self.queue.queue:
+            status = self.live_status(builder)
+            self.message(builder.slug + ' ' + status)
+            if status != 'ready':
+                continue
+            log_name = builder.deploy_log_name(self.ip)
+            os.makedirs(os.path.dirname(log_name), exist_ok=True)
+            with open(log_name, 'w+') as log_file:
+                success = builder.deploy(self.ip, logger.Log(log_file))
+            log_name = logger.finish_file(log_name)
+            self.status_cache = {}
+            if success:
+                self.statuses[builder.slug] = 'done'
+                if builder.slug in self.failures:
+                    self.failures.remove(builder.slug)
+            else:
+                self.statuses[builder.slug] = 'failed'
+                if builder.slug not in self.failures:
+                    self.failures.append(builder.slug)
+                self.message('Deploy of ' + builder.slug + ' failed, see ' + log_name)
+        os.makedirs(os.path.dirname(_failed_file(self.ip)), exist_ok=True)
+        with open(_failed_file(self.ip), 'w') as fail_list:
+            for slug in self.failures:
+                fail_list.write(slug + '\n')
+        return len(self.failures)
+
+def _for_each_host(task):
+    """
+    Run a function for every registered production server, several servers at
+    a time as allowed by the deploy_concurrency setting.
+
+    Args:
+        task - A function that takes a server address
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    ip_list = get_registered_ips()
+    if len(ip_list) == 0:
+        return []
+    workers = max(1, min(settings.get_num('deploy_concurrency'), len(ip_list)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(task, ip_list))
+    for ip in ip_list:
+        remote.close(ip)
+    return results
+
 def deploy(force):
     log_path = settings.get('install_path') +  'var/log/remote-deploy'
     with open(log_path, 'a+') as log_file:
         log = logger.Log(log_file)
+        build_index.Index().refresh()
         queue = build_queue.new_queue(force)
         build_index.Index().populate_builders(queue)
         queue.run()
         if queue.failed():
             log.log('Error: Unable to deploy. Build failed.')
         else:
-            for ip in get_registered_ips():
-                log.log('')
-                log.log('Checking deployment for ' + ip)
-                queue.set_failed_file(settings.get('install_path') + 'etc/deploy-failures/' + ip)
-                for builder, status in queue.queue:
-                    status = get_deploy_live_status(ip, log, force, queue, builder)
-                    log.log(builder.slug + ' ' + status)
-                    if status == 'ready':
-                        builder.deploy(ip, log)
-
-def check_deploy():
-    log = logger.Log()
-    queue = build_queue.new_queue()
-    build_index.Index().populate_builders(queue)
-    update_list = queue.run_check()
-    if len(update_list) > 0:
-        log.log("Error: Software must be updated locally first.")
-    else:
-        for ip in get_registered_ips():
-            log.log('')
-            log.log('Checking deployment for ' + ip)
-            queue.set_failed_file(settings.get('install_path') + 'etc/deploy-failures/' + ip)
-            for builder, status in queue.queue:
-                status = get_deploy_live_status(ip, log, False, queue, builder)
-                log.log(builder.slug + ' ' + status)
+            def deploy_host(ip):
+                host = HostDeployment(ip, queue, force, log)
+                host.message('Checking deployment')
+                failures = host.run()
+                if failures > 0:
+                    host.message(str(failures) + ' package(s) failed to deploy')
+                else:
+                    host.message('Deployment complete')
+                return failures
+            if sum(_for_each_host(deploy_host)) > 0:
+                log.log('Error: One or more deployments failed.')
+            update_status.forget('deploy')
+        if queue.count > 0:
+            update_status.forget('build')
 
-debug = False
-def get_deploy_live_status(ip, log, force, queue, builder, level=0):
+def check_deploy(refresh=False):
     """
-    Recalculate the status of a builder deployment by checking it's dependencies.
+    Print the deployment status of every package on every production server
+    from the last update status snapshot (see update_status.py). The servers
+    are only contacted if there is no snapshot or refresh is set. A stale
+    snapshot is printed while a new one is taken in the background.
 
     Args:
-        builder - The builder to check
-        level - The recursive depth level the status check is in
+        refresh - (optional) Check the servers now instead of using the snapshot
     """
-    status = 'missing'
-    for b, s in queue.queue:
-        if b is builder:
-            status = s
-    if status == '' or status == 'waiting':
-        if status == '' and not builder.needs_deploy(ip, log, force):
-            status = 'pass'
-        else:
-            status = 'ready'
-        deps = builder.dependencies()
-        if len(deps) > 0:
-            for slug in deps:
-                dep_builder, dep_status = queue.entry(slug)
-                if dep_status == False:
-                    log.log('Unable to find package "' + slug + '" needed for "' + builder.slug + '"')
-                    return 'failed'
-                dep_status = get_deploy_live_status(ip, log, force, queue, dep_builder, level + 1)
-                if dep_status == 'failed' or dep_status == 'missing':
-                    return 'failed'
-                elif dep_status == 'waiting' or dep_status == 'ready':
-                    status = 'waiting'
-                elif dep_status == 'done':
-                    if status != 'waiting':
-                        status = 'ready'
-
-    if debug:
-        dmsg = 'Checking:'
-        for i in range(level):
-            dmsg += ' '
-        dmsg += builder.slug + ' ' + status
-        print(dmsg)
-    return status
\ No newline at end of file
+    log = logger.Log()
+    snapshot = update_status.read('deploy')
+    if refresh or not snapshot:
+        snapshot = update_status.check_deploys()
+    else:
+        note = 'Checked ' + update_status.format_age(snapshot)
+        if update_status.is_stale(snapshot):
+            update_status.refresh_in_background()
+            note += ', refreshing in the background'
+        log.log(note + ' (use --refresh to check now)')
+    if snapshot.get('local_updates'):
+        log.log("Error: Software must be updated locally first.")
+        return
+    for entry in snapshot['entries']:
+        log.log('[' + entry['host'] + '] ' + entry['slug'] + ' ' + entry['status'])
+
+debug = False
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import hashlib
+import tarfile
+import subprocess
+
+chunk_size = 1024 * 1024
+
+# multithreaded decompressors in order of preference, by archive extension
+decompressors = {
+    '.gz': [['pigz'], ['gzip']],
+    '.tgz': [['pigz'], ['gzip']],
+    '.bz2': [['lbzip2'], ['pbzip2'], ['bzip2']],
+    '.xz': [['xz', '-T0'], ['xz']],
+    '.zst': [['zstd', '-T0'], ['zstd']]
+}
+
+# tarfile stream modes used when no decompressor binary is installed
+tarfile_modes = {
+    '.gz': 'r|gz',
+    '.tgz': 'r|gz',
+    '.bz2': 'r|bz2',
+    '.xz': 'r|xz'
+}
+
+def archive_extension(url):
+    """
+    Get the compression extension of an archive URL, such as ".gz" or ".bz2".
+
+    Args:
+        url - The URL or file name of the archive
+    """
+    name = url.split('?')[0]
+    for ext in decompressors:
+        if name.endswith(ext):
+            return ext
+    return ''
+
+def find_decompressor(ext):
+    """
+    Get the decompression command for an archive extension, preferring ones
+    that use every processor, or False if none is installed.
+
+    Args:
+        ext - An extension from archive_extension()
+    """
+    for command in decompressors.get(ext, []):
+        if shutil.which(command[0]) != None:
+            return command
+    return False
+
+def parse_checksum(checksum):
+    """
+    Split a checksum into an algorithm name and hex digest. Checksums may be
+    given as "sha256:<hex>" or as a bare sha256 hex digest. The contents of a
+    published checksum file, such as "<hex>  file.tar.gz", are also accepted.
+
+    Args:
+        checksum - The checksum string
+    """
+    checksum = checksum.strip()
+    algorithm = 'sha256'
+    if ':' in checksum.split()[0]:
+        algorithm, checksum = checksum.split(':', 1)
+    return algorithm, checksum.split()[0].lower()
+
+class StreamError(Exception):
+    """Raised when a download or archive can not be read to the end."""
+    pass
+
+class VerifiedStream():
+    """
+    Read the body of an HTTP response in chunks while counting its size and
+    calculating its checksum. Call verify() once the stream is exhausted.
+    """
+    def __init__(self, response, checksum=False):
+        from libsw import http_client
+        self.read_errors = http_client.StreamException
+        # read the raw body so the size and checksum match the published file
+        self.chunks = response.raw.stream(chunk_size, decode_content=False)
+        self.expected_size = response.headers.get('Content-Length')
+        self.checksum = False
+        self.hasher = hashlib.sha256()
+        if checksum:
+            algorithm, self.checksum = parse_checksum(checksum)
+            self.hasher = hashlib.new(algorithm)
+        self.size = 0
+        self.buffer = b''
+        self.copy_to = False
+
+    def chunk(self):
+        """
+        Get the next chunk of the download or b'' at the end. Raises a
+        StreamError if the connection breaks.
+        """
+        try:
+            data = next(self.chunks, b'')
+        except self.read_errors as err:
+            raise StreamError(str(err)) from err
+        self.size += len(data)
+        self.hasher.update(data)
+        if self.copy_to:
+            self.copy_to.write(data)
+        return data
+
+    def read(self, size=-1):
+        """A file-like read() so the stream can be passed to tarfile."""
+        while size < 0 or len(self.buffer) < size:
+            data = self.chunk()
+            if len(data) == 0:
+                break
+            self.buffer += data
+        if size < 0:
+            size = len(self.buffer)
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+    def drain(self):
+        """Read any data left in the response."""
+        while len(self.chunk()) > 0:
+            pass
+
+    def verify(self):
+        """
+        Return an error message if the downloaded size or checksum is wrong,
+        otherwise False.
+        """
+        if self.expected_size != None and int(self.expected_size) != self.size:
+            return 'expected ' + str(self.expected_size) + ' bytes but received ' + str(self.size)
+        if self.checksum and self.hasher.hexdigest() != self.checksum:
+            return 'checksum mismatch, expected ' + self.checksum + ' but got ' + self.hasher.hexdigest()
+        return False
+
+class FileStream(VerifiedStream):
+    """A VerifiedStream that reads an archive that is already on disk."""
+    def __init__(self, open_file):
+        self.chunks = iter(lambda: open_file.read(chunk_size), b'')
+        self.read_errors = OSError
+        self.expected_size = None
+        self.checksum = False
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.buffer = b''
+        self.copy_to = False
+
+def _get(url):
+    from libsw import http_client
+    response = http_client.get(url, timeout=60, stream=True)
+    response.raise_for_status()
+    return response
+
+def fetch_archive(url, target_dir, log, checksum=False, keep_path=False):
+    """
+    Download a tar archive and extract it while it downloads, without holding
+    the archive in memory. Extraction uses tar with a multithreaded
+    decompressor when one is installed and Python's tarfile module otherwise.
+
+    Args:
+        url - The URL of the archive
+        target_dir - The directory to extract into
+        log - An open log file
+        checksum - (optional) The expected checksum of the archive, see
+            parse_checksum()
+        keep_path - (optional) Also save the archive to this path once it has
+            been verified
+
+    Return:
+        True on success, otherwise False
+    """
+    from libsw import http_client
+    os.makedirs(target_dir, exist_ok=True)
+    ext = archive_extension(url)
+    try:
+        stream = VerifiedStream(_get(url), checksum)
+    except http_client.RequestException as err:
+        log.log('Error: Unable to download ' + url + ': ' + str(err))
+        return False
+    if keep_path:
+        os.makedirs(os.path.dirname(keep_path), exist_ok=True)
+        stream.copy_to = open(keep_path + '.part', 'wb')
+    try:
+        extracted = _extract_stream(stream, ext, target_dir, log)
+    finally:
+        if keep_path:
+            stream.copy_to.close()
+    if not extracted:
+        problem = 'unable to extract the archive'
+    else:
+        problem = stream.verify()
+    if problem:
+        log.log('Error: Download of ' + url + ' failed: ' + problem)
+        if keep_path:
+            os.remove(keep_path + '.part')
+        return False
+    if keep_path:
+        os.replace(keep_path + '.part', keep_path)
+    return True
+
+def extract_archive(path, target_dir, log):
+    """
+    Extract a tar archive from disk the same way fetch_archive() does.
+
+    Args:
+        path - The path of the archive
+        target_dir - The directory to extract into
+        log - An open log file
+
+    Return:
+        True on success, otherwise False
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    with open(path, 'rb') as archive:
+        if not _extract_stream(FileStream(archive), archive_extension(path), target_dir, log):
+            log.log('Error: Unable to extract ' + path)
+            return False
+    return True
+
+def _extract_stream(stream, ext, target_dir, log):
+    decompressor = find_decompressor(ext)
+    if decompressor:
+        log.log('Extracting with ' + decompressor[0])
+        tar = subprocess.Popen(['tar', '-x', '-C', target_dir, '-I', ' '.join(decompressor)], stdin=subprocess.PIPE)
+        try:
+            try:
+                while True:
+                    data = stream.chunk()
+                    if len(data) == 0:
+                        break
+                    tar.stdin.write(data)
+            except BrokenPipeError:
+                stream.drain()
+        except StreamError as err:
+            log.log('Error: The download stopped: ' + str(err))
+            tar.kill()
+            try:
+                tar.stdin.close()
+            except BrokenPipeError:
+                pass
+            tar.wait()
+            return False
+        tar.stdin.close()
+        return tar.wait() == 0
+    mode = tarfile_modes.get(ext, 'r|*')
+    try:
+        with tarfile.open(fileobj=stream, mode=mode) as archive:
+            if hasattr(tarfile, 'data_filter'):
+                # refuse absolute paths, links out of target_dir and devices
+                archive.extractall(target_dir, filter='data')
+            else:
+                archive.extractall(target_dir)
+        stream.drain()
+    except tarfile.TarError:
+        return False
+    except StreamError as err:
+        log.log('Error: The download stopped: ' + str(err))
+        return False
+    return True
+
+def fetch_file(url, path, log, checksum=False):
+    """
+    Download a file to disk in chunks. The file only appears at the given path
+    once it has been completely downloaded and verified.
+
+    Args:
+        url - The URL of the file
+        path - The path to save the file to
+        log - An open log file
+        checksum - (optional) The expected checksum of the file, see
+            parse_checksum()
+
+    Return:
+        True on success, otherwise False
+    """
+    from libsw import http_client
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.part'
+    try:
+        stream = VerifiedStream(_get(url), checksum)
+        with open(temp_path, 'wb') as out:
+            while True:
+                data = stream.chunk()
+                if len(data) == 0:
+                    break
+                out.write(data)
+    except (http_client.RequestException, StreamError) as err:
+        log.log('Error: Unable to download ' + url + ': ' + str(err))
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    problem = stream.verify()
+    if problem:
+        log.log('Error: Download of ' + url + ' failed verification: ' + problem)
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+def fetch_checksum(url):
+    """
+    Download a published checksum file such as "<archive>.sha256" and return
+    it's contents, or False if it is not available.
+
+    Args:
+        url - The URL of the checksum file
+    """
+    from libsw import http_client
+    try:
+        text = http_client.get_text(url)
+    except http_client.RequestException:
+        return False
+    if len(text.strip()) == 0:
+        return False
+    return text.strip()
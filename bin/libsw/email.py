@@ -2,30 +2,16 @@
 
 import re
 import os
-import inquirer
 import subprocess
 import platform
 import pwd
 import grp
 import shutil
 from email.mime.text import MIMEText
-from libsw import file_filter, user, bind, service, settings
+from libsw import file_filter, user, bind, service, settings, completion_cache
 
 def get_detected_exim_user():
-    user = 'Mail'
-    group = 'Mail'
-
-    test_group = subprocess.getoutput("sed -n '/^[^:]*[Ee]xim/ s/:.*//gp' /etc/group")
-    test_user = subprocess.getoutput("sed -n '/^[^:]*[Ee]xim/ s/:.*//gp' /etc/passwd")
-    if len(test_group) > 0:
-        group = test_group
-    if len(test_user) > 0:
-        user = test_user
-
-    return user, group
-
-# functions that autodetect settings must come before importing settings
-from libsw import settings
+    return settings.detect_exim_user()
 
 class SetPassword(file_filter.FileFilter):
     """Update the password for an email account."""
@@ -78,6 +64,7 @@ def select_email():
     Have the user select from a list of all email addresses in the system sorted
     alphabetically.
     """
+    import inquirer
     versions = get_email_addrs()
     questions = [
         inquirer.List('addr',
@@ -280,6 +267,7 @@ def select_domain():
     Prompt the user to select a domain from a list of all domains registered in
     the mail system.
     """
+    import inquirer
     versions = get_mail_domains()
     questions = [
         inquirer.List('dom',
@@ -357,6 +345,7 @@ def create_account(email_user, domain):
     shadow_line += 'userdb_mail=maildir:~/mail/%Ld/%Ln\n'
     with open(settings.get('mail_shadow_file'), 'a+') as shadow:
         shadow.write(shadow_line)
+    completion_cache.invalidate('email_addrs')
     user.make_user_dir(configuration_directory(domain, email_user, sys_user), pwd_user.pw_uid, pwd_user.pw_gid) # for filters
     user.make_user_dir(mail_directory(domain, email_user, sys_user), pwd_user.pw_uid, pwd_user.pw_gid) # for maildir
 
@@ -372,6 +361,7 @@ def remove_account(account, delete_files=False):
     """
     user, domain = account.lower().split('@')
     RemoveMailAccount(account).run()
+    completion_cache.invalidate('email_addrs')
     if delete_files:
         sys_user = get_account_from_domain(domain)
         shutil.rmtree(configuration_directory(domain, user, sys_user)) # for filters
@@ -410,10 +400,12 @@ class RemoveMailAccount(file_filter.FileFilter):
 
 def add_mail_domain(domain: str, nix_account: str):
     SetMailDomain(domain, nix_account).run()
+    completion_cache.invalidate('mail_domains')
     update_dc_hostnames()
 
 def remove_mail_domain(domain: str):
     RemoveMailDomain(domain).run()
+    completion_cache.invalidate('mail_domains')
     update_dc_hostnames()
 
 class SetMailDomain(file_filter.AppendUnique):
@@ -1,15 +1,77 @@
 #!/usr/bin/env python3
 
 import os
+import io
+import stat
+import fcntl
 from tempfile import NamedTemporaryFile
 from abc import ABC, abstractmethod
 
+# files up to this many bytes are filtered in memory instead of streamed
+small_file_size = 1024 * 1024
+
+def _open_locked(path):
+	"""
+	Open a file for reading while holding an exclusive advisory lock on it,
+	creating the file if it does not exist. The lock is released when the file
+	is closed.
+
+	Args:
+		path - The path of the file
+	"""
+	while True:
+		if not os.path.exists(path):
+			with open(path, 'w+'):
+				pass
+		source = open(path)
+		fcntl.flock(source, fcntl.LOCK_EX)
+		# another process may have replaced the file while we waited
+		try:
+			if os.stat(path).st_ino == os.fstat(source.fileno()).st_ino:
+				return source
+		except FileNotFoundError:
+			pass
+		source.close()
+
+class _Replacement():
+	"""
+	A temporary file in the same directory as a target file that atomically
+	replaces the target when the with block ends. The mode and ownership of the
+	target are copied to it. Set keep to False to throw the temporary file away
+	instead.
+	"""
+	def __init__(self, path, target_stat):
+		self.path = path
+		self.target_stat = target_stat
+		self.keep = True
+		self.file = NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.' + os.path.basename(path) + '.', delete=False)
+
+	def __enter__(self):
+		return self.file
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type != None or not self.keep:
+			self.file.close()
+			os.remove(self.file.name)
+			return False
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.file.close()
+		os.chmod(self.file.name, stat.S_IMODE(self.target_stat.st_mode))
+		try:
+			os.chown(self.file.name, self.target_stat.st_uid, self.target_stat.st_gid)
+		except PermissionError:
+			# only root can give files away, the file is ours anyway
+			pass
+		os.replace(self.file.name, self.path)
+		return False
+
 class FileFilter(ABC):
 	"""
 	An abstract class that filters the content of a file. It works by passing an
 	input and output stream to an abstract function. If the abstract function
-	return true, the output of the output stream is then copied into the
-	origional file.
+	returns true and the output differs from the original content, the output
+	atomically replaces the original file.
 	"""
 	def __init__(self, filename, makefile=False):
 		self.filename = filename
@@ -23,19 +85,71 @@ class FileFilter(ABC):
 		pass
 
 	def run(self):
-		dirpath = os.path.dirname(self.filename)
-		change = False
-		if not os.path.exists(self.filename):
-			with open(self.filename, 'w+') as f:
-				pass
-		with open(self.filename) as source, NamedTemporaryFile('w', dir=dirpath, delete=False) as outfile:
-			change = self.filter_stream(source, outfile)
-		if change != False:
-			with open(outfile.name) as inflow, open(self.filename, 'w+') as outflow:
-				for line in inflow:
-					outflow.write(line)
-		os.remove(outfile.name)
-		return change != False
+		"""
+		Filter the file. Symlinks are followed so that the link itself is kept.
+		The file is locked while it is filtered so that concurrent Site
+		Wrangler processes do not overwrite each other's changes.
+
+		Return:
+			True if the file was changed, otherwise False
+		"""
+		path = os.path.realpath(self.filename)
+		with _open_locked(path) as source:
+			source_stat = os.fstat(source.fileno())
+			if source_stat.st_size > small_file_size:
+				replacement = _Replacement(path, source_stat)
+				with replacement as outfile:
+					change = self.filter_stream(source, outfile)
+					replacement.keep = change != False
+				return change != False
+			content = source.read()
+			out_stream = io.StringIO()
+			change = self.filter_stream(io.StringIO(content), out_stream)
+			new_content = out_stream.getvalue()
+			if change == False or new_content == content:
+				return False
+			with _Replacement(path, source_stat) as outfile:
+				outfile.write(new_content)
+		return True
+
+class FilterChain(FileFilter):
+	"""
+	A FileFilter that runs several FileFilters on the same file with a single
+	read and a single write. The filters run in the order they were added, each
+	on the output of the one before it. After run(), changed holds the filters
+	that changed the content. Use this syntax:
+	FilterChain(filename).add(RemoveExact(filename, 'old')).add(AppendUnique(filename, 'new')).run()
+	"""
+	def __init__(self, filename, filters=False, makefile=False):
+		self.filters = []
+		self.changed = []
+		if filters:
+			for file_filter in filters:
+				self.add(file_filter)
+		super().__init__(filename, makefile)
+
+	def add(self, file_filter):
+		"""
+		Add a filter to the end of the chain.
+
+		Args:
+			file_filter - A FileFilter for the same file
+		"""
+		self.filters.append(file_filter)
+		return self
+
+	def filter_stream(self, in_stream, out_stream):
+		self.changed = []
+		content = in_stream.read()
+		for file_filter in self.filters:
+			filtered = io.StringIO()
+			change = file_filter.filter_stream(io.StringIO(content), filtered)
+			# like run(), output is dropped when a filter reports no change
+			if change != False and filtered.getvalue() != content:
+				content = filtered.getvalue()
+				self.changed.append(file_filter)
+		out_stream.write(content)
+		return len(self.changed) > 0
 
 class UpdateSection(FileFilter):
 	"""
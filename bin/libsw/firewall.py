@@ -197,8 +197,8 @@ cmd:spamd child
 exe:/usr/bin/freshclam
 exe:/usr/sbin/clamd
 """
-    ignore += 'exe:' + nginx.binary_file + '\n'
-    ignore += 'exe:' + nginx.binary_file + '.old\n'
+    ignore += 'exe:' + nginx.binary_file() + '\n'
+    ignore += 'exe:' + nginx.binary_file() + '.old\n'
 
     for ver in php.get_versions():
         ver = version.get_tree(ver)['sub']
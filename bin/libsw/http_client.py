@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib3
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from libsw import settings
+
+# raised for connection problems, timeouts and HTTP error statuses
+RequestException = requests.RequestException
+
+# raised when the connection breaks while a streamed response body is read
+StreamException = (requests.RequestException, urllib3.exceptions.HTTPError, OSError)
+
+# one pooled session per host, shared by every thread
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def _retry_policy():
+    return Retry(
+        total=settings.get_num('http_retries'),
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET', 'HEAD'],
+        raise_on_status=False
+    )
+
+def session(url):
+    """
+    Get the shared session for the host of a URL. Sessions keep connections
+    open between requests and retry failed requests with a backoff.
+
+    Args:
+        url - Any URL on the host
+    """
+    parsed = urlparse(url)
+    host = parsed.scheme + '://' + parsed.netloc
+    with _sessions_lock:
+        if host not in _sessions:
+            new_session = requests.Session()
+            new_session.headers['User-Agent'] = 'sitewrangler'
+            adapter = HTTPAdapter(max_retries=_retry_policy(), pool_maxsize=settings.get_num('update_check_threads'))
+            new_session.mount('http://', adapter)
+            new_session.mount('https://', adapter)
+            _sessions[host] = new_session
+        return _sessions[host]
+
+def get(url, timeout=False, **kwargs):
+    """
+    Send a GET request through the shared session of the URL's host. This
+    takes the same arguments as requests.get().
+
+    Args:
+        url - The URL to request
+        timeout - (optional) Seconds to wait for the server, defaults to the
+            http_timeout setting
+    """
+    if not timeout:
+        timeout = settings.get_num('http_timeout')
+    return session(url).get(url, timeout=timeout, **kwargs)
+
+def cache_dir():
+    """The directory that holds cached responses."""
+    return settings.get('install_path') + 'var/cache/http/'
+
+def _cache_files(url):
+    name = cache_dir() + hashlib.sha1(url.encode()).hexdigest()
+    return name + '.json', name + '.body'
+
+def _read_cache(url):
+    meta_file, body_file = _cache_files(url)
+    if not os.path.exists(meta_file) or not os.path.exists(body_file):
+        return False, False
+    try:
+        with open(meta_file) as meta_input:
+            meta = json.load(meta_input)
+        with open(body_file, encoding='utf-8') as body_input:
+            return meta, body_input.read()
+    except (ValueError, OSError):
+        return False, False
+
+def _write_cache(url, response):
+    meta_file, body_file = _cache_files(url)
+    os.makedirs(cache_dir(), exist_ok=True)
+    meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'time': int(time.time())
+    }
+    with open(body_file + '.part', 'w', encoding='utf-8') as body_output:
+        body_output.write(response.text)
+    os.replace(body_file + '.part', body_file)
+    with open(meta_file + '.part', 'w') as meta_output:
+        json.dump(meta, meta_output)
+    os.replace(meta_file + '.part', meta_file)
+
+def _touch_cache(url, meta):
+    meta_file, body_file = _cache_files(url)
+    meta['time'] = int(time.time())
+    with open(meta_file + '.part', 'w') as meta_output:
+        json.dump(meta, meta_output)
+    os.replace(meta_file + '.part', meta_file)
+
+def get_text(url, max_age=0, validate=False):
+    """
+    Get the body of a web page, such as a download listing, through an on-disk
+    cache. Cached pages are revalidated with the ETag and Last-Modified headers
+    the server sent, so unchanged pages are not downloaded again. If the server
+    can not be reached the cached page is used and a warning is printed.
+
+    Args:
+        url - The URL of the page
+        max_age - (optional) Use a cached page younger than this many seconds
+            without contacting the server
+        validate - (optional) A function that returns True if a page has the
+            expected content. Pages it rejects, such as an error message
+            served with a 200 status, are returned but never cached.
+
+    Return:
+        The page text, or an empty string if the server responded with an error
+    """
+    meta, body = _read_cache(url)
+    if meta and validate and not validate(body):
+        meta, body = False, False
+    if meta and max_age > 0 and time.time() - meta['time'] < max_age:
+        return body
+    headers = {}
+    if meta and meta['etag']:
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta['last_modified']:
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = get(url, headers=headers)
+    except requests.RequestException as err:
+        if meta:
+            age = int((time.time() - meta['time']) / 3600)
+            print('Warning: unable to get ' + url + ' (' + str(err) + '), using the copy cached ' + str(age) + ' hours ago')
+            return body
+        raise
+    if response.status_code == 304 and meta:
+        _touch_cache(url, meta)
+        return body
+    if response.status_code != 200:
+        return ''
+    if validate and not validate(response.text):
+        return response.text
+    if response.headers.get('ETag') or response.headers.get('Last-Modified') or max_age > 0:
+        _write_cache(url, response)
+    return response.text
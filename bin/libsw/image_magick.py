@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
 import os, subprocess
-from libsw import builder, version, settings
+from libsw import builder, version, source_mirror
 
-build_path = settings.get('build_path')
-binary_path = build_path + 'bin/magick'
+def binary_path():
+    """The path of the ImageMagick magick binary."""
+    return builder.build_path() + 'bin/magick'
 
 class ImageMagickBuilder(builder.AbstractGitBuilder):
-    def __init__(self, build_dir=build_path + 'src/', source_version=False):
+    def __init__(self, build_dir=False, source_version=False):
         super().__init__('image-magick', build_dir, source_version, branch="main")
 
     def get_source_url(self):
@@ -25,52 +26,44 @@ class ImageMagickBuilder(builder.AbstractGitBuilder):
             return False
         if not os.path.exists(self.source_dir()):
             return True
+        if source_mirror.is_offline():
+            return False
         latest = self._get_latest_tag()
+        if not latest:
+            return False # no tags could be read, so no update is known
+        self.available_version = latest
         current = self.version_reference()
         return not latest == current
 
     def _get_latest_tag(self):
-        old_pwd = os.getcwd()
-        source_dir = self.source_dir()
-        if not os.path.exists(source_dir):
-            self.git_init()
-        os.chdir(source_dir)
-        subprocess.getoutput('git fetch origin')
-        output = subprocess.getoutput("git tag")
-        latest_ver = '0'
-        latest_patch = 0
-        for line in output.split('\n'):
+        tags = []
+        for line in self.get_remote_tags():
             if line == 'master' or line == 'continuous':
                 continue
             subline = line.split('-')
-            if len(subline) != 2:
+            if len(subline) != 2 or not subline[1].isdigit():
                 continue
-            line_ver = subline[0]
-            line_patch = int(subline[1])
-            if version.first_is_higher(line_ver, latest_ver) or (line_ver == latest_ver and line_patch > latest_patch):
-                latest_ver = line_ver;
-                latest_patch = line_patch;
-        os.chdir(old_pwd)
-        if latest_ver == '0' and latest_patch == 0:
+            tags.append([version.sort_key(subline[0]), int(subline[1]), line])
+        if len(tags) == 0:
             return ''
-        return latest_ver + '-' + str(latest_patch)
+        latest = max(tags, key=lambda tag: tag[:2])
+        return latest[2]
 
-    def version_reference(self):
-        return subprocess.getoutput(builder.set_sh_ld + binary_path + ' --version | grep "^Version" | sed "s~.*ImageMagick\s\+\([0-9\\.\\-]\\+\\)\\s\\+.*~\\1~"')
+    def probe_version_reference(self):
+        return subprocess.getoutput(builder.set_sh_ld() + binary_path() + ' --version | grep "^Version" | sed "s~.*ImageMagick\s\+\([0-9\\.\\-]\\+\\)\\s\\+.*~\\1~"')
 
     def fetch_source(self, source, log):
-        self.branch = self._get_latest_tag()
-        return super().fetch_source(source, log)
-
-    def git_init(self, log=False):
-        super().git_init(log)
-        old_pwd = os.getcwd()
-        os.chdir(self.source_dir())
         tag = self._get_latest_tag()
-        print('Hard resetting to latest tag: ' + tag)
-        run_command = ['git', 'reset', '--hard', tag]
-        if log == False:
-            subprocess.run(run_command)
-        else:
-            log.run(run_command)
-        os.chdir(old_pwd)
+        if not os.path.exists(self.source_dir()):
+            self.branch = tag
+            self.git_init(log)
+            return
+        self.clean(log)
+        if not tag:
+            log.log('Unable to find the latest tag of ' + self.slug + ', keeping the current checkout')
+            self.fetch_submodules(source, log)
+            return
+        self.fetch_tag(tag, log)
+        log.log('Hard resetting to latest tag: ' + tag)
+        log.run(['git', '-C', self.source_dir(), 'reset', '--hard', tag])
+        self.fetch_submodules(source, log)
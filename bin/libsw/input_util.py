@@ -1,11 +1,7 @@
 #!/usr/bin/env python3
 
-import inquirer
-import subprocess
 import os
-import random
 import re
-import string
 
 def input_domain():
     """
@@ -82,6 +78,7 @@ def confirm(text, default=True):
         text - The text to use in the prompt
         default - (optional) The value to use if nothing is given
     """
+    import inquirer
     questions = [
         inquirer.Confirm('confirm', message=text, default=True),
     ]
@@ -96,6 +93,7 @@ def edit_file(path):
     Args:
         path - The full path to the file to edit
     """
+    import subprocess
     editor = subprocess.getoutput('echo "$EDITOR"')
     if len(editor) == 0:
         find_nano = subprocess.getoutput("whereis nano | egrep ': /'")
@@ -125,6 +123,8 @@ def random_string(string_length=20, punctuation=True):
         punctuation - (optional) True if the generated characters should include
             punctuation
     """
+    import random
+    import string
     chars = string.ascii_letters + string.digits
     if punctuation:
         chars += string.punctuation
@@ -135,6 +135,7 @@ def prompt_value(key, value):
     #new_value = input('Enter ' + key + ' [' + value + ']: ')
     #if len(new_value) == 0:
     #    return value
+    import inquirer
     questions = [
         inquirer.Text('query', message='Enter ' + key, default=value),
     ]
@@ -148,6 +149,7 @@ def select_from(query_message, options):
         query_message - A query message to display to the user when selecting
         options - The options to select from
     """
+    import inquirer
     questions = [
         inquirer.List('s',
                     message=query_message,
@@ -164,6 +166,7 @@ def select_multiple_from(query_message, options):
         query_message - A query message to display to the user when selecting
         options - The options to select from
     """
+    import inquirer
     exit = ' ** Done ** '
     selected = []
     while True:
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+from libsw import settings
+
+# manifests already read by this process, keyed by slug, with the modification
+# time they were read at since builds run in child processes
+_manifests = {}
+
+def manifest_dir():
+    """The directory that holds a manifest for every installed package."""
+    return settings.get('install_path') + 'var/lib/installed/'
+
+def manifest_path(slug):
+    """
+    The path of the install manifest of a package.
+
+    Args:
+        slug - The slug name of the package
+    """
+    return manifest_dir() + slug + '.json'
+
+def read(slug):
+    """
+    Get the manifest written by the last successful install of a package, or
+    False if there is none. The manifest is a dictionary with the keys slug,
+    version, configure, installed and files.
+
+    Args:
+        slug - The slug name of the package
+    """
+    path = manifest_path(slug)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if slug in _manifests and _manifests[slug][0] == mtime:
+        return _manifests[slug][1]
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except ValueError:
+        manifest = False
+    _manifests[slug] = (mtime, manifest)
+    return manifest
+
+def get_version(slug):
+    """
+    Get the installed version recorded in a package's manifest or False if
+    there is no manifest.
+
+    Args:
+        slug - The slug name of the package
+    """
+    manifest = read(slug)
+    if not manifest:
+        return False
+    return manifest['version']
+
+def write(slug, installed_version, configure_fingerprint=False, file_list=False):
+    """
+    Record a successful install of a package.
+
+    Args:
+        slug - The slug name of the package
+        installed_version - The version reference of the installed software
+        configure_fingerprint - (optional) The fingerprint from
+            configure_cache.get_fingerprint() the package was built with
+        file_list - (optional) The array of installed files
+    """
+    manifest = {
+        'slug': slug,
+        'version': str(installed_version),
+        'configure': configure_fingerprint,
+        'installed': int(time.time()),
+        'files': file_list or []
+    }
+    path = manifest_path(slug)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(path + '.part', path)
+    return manifest
+
+def forget(slug):
+    """
+    Remove the manifest of a package that is being reinstalled or removed so
+    that it's version is probed from the system instead.
+
+    Args:
+        slug - The slug name of the package
+    """
+    _manifests.pop(slug, None)
+    path = manifest_path(slug)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tarfile
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+@contextmanager
+def staging_dir(parent):
+    """
+    Create a temporary directory for an install to place it's files in, such
+    as with "make install DESTDIR=<staging>", and remove it afterwards.
+
+    Args:
+        parent - The directory to create it in, which should be on the same
+            file system as the installed files
+    """
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.sw-install-', dir=parent)
+    try:
+        yield staging
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _is_preserved(path, preserved):
+    for kept in preserved:
+        if path == kept or (kept.endswith('/') and path.startswith(kept)):
+            return True
+    return False
+
+def move_staged(staging, root='/', preserved=False):
+    """
+    Move the files an install placed in a staging directory to where they
+    belong. Only the files the install itself created are moved, so the
+    returned list never contains logs or other files written by the running
+    software.
+
+    Args:
+        staging - A directory from staging_dir()
+        root - (optional) The directory that the staged paths are relative to
+        preserved - (optional) An array of paths that are only installed when
+            they are missing, such as configuration files. A path ending with
+            "/" covers everything below it. These are never in the returned
+            list, so restoring the list does not replace them either.
+
+    Return:
+        A sorted array of the installed files and symlinks
+    """
+    if preserved == False:
+        preserved = []
+    names = []
+    for dirpath, dirnames, filenames in os.walk(staging):
+        target_dir = os.path.normpath(os.path.join(root, os.path.relpath(dirpath, staging)))
+        if not os.path.lexists(target_dir):
+            os.makedirs(target_dir)
+            shutil.copystat(dirpath, target_dir)
+        kept_dirs = []
+        for name in dirnames:
+            if os.path.islink(os.path.join(dirpath, name)):
+                filenames.append(name)
+            else:
+                kept_dirs.append(name)
+        dirnames[:] = kept_dirs
+        for name in filenames:
+            target = os.path.join(target_dir, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                continue
+            if _is_preserved(target, preserved):
+                if not os.path.lexists(target):
+                    _move_into_place(os.path.join(dirpath, name), target)
+                continue
+            _move_into_place(os.path.join(dirpath, name), target)
+            names.append(target)
+    return sorted(names)
+
+def zstd_available():
+    """Returns True if the zstd binary is installed."""
+    return shutil.which('zstd') != None
+
+@contextmanager
+def _open_write(archive_path):
+    """
+    Open a tar file for writing, compressed with zstd if the path ends with
+    ".zst" and with gzip otherwise.
+    """
+    if archive_path.endswith('.zst'):
+        process = subprocess.Popen(['zstd', '-q', '-T0', '-f', '-o', archive_path], stdin=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=process.stdin, mode='w|') as tar:
+                yield tar
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode != 0:
+            raise OSError('zstd exited with code ' + str(process.returncode))
+    else:
+        with tarfile.open(archive_path, 'w:gz') as tar:
+            yield tar
+
+@contextmanager
+def _open_read(archive_path):
+    """
+    Open a tar file written by write_archive() for reading it's members in
+    order.
+    """
+    if archive_path.endswith('.zst'):
+        process = subprocess.Popen(['zstd', '-q', '-d', '-c', archive_path], stdout=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+                yield tar
+        finally:
+            process.stdout.close()
+            process.wait()
+    else:
+        with tarfile.open(archive_path, 'r:*') as tar:
+            yield tar
+
+def write_archive(file_list, archive_path):
+    """
+    Store a list of installed files in a compressed tar file. The files are
+    stored with their absolute path so they can be restored with
+    extract_archive(). Archives ending with ".zst" are compressed with zstd.
+
+    Args:
+        file_list - An array of absolute file paths
+        archive_path - The tar file to create
+    """
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    ext = '.zst' if archive_path.endswith('.zst') else ''
+    temp_path = archive_path + '.part' + ext
+    with _open_write(temp_path) as tar:
+        for path in file_list:
+            if os.path.lexists(path):
+                tar.add(path, arcname=path.lstrip('/'), recursive=False)
+    os.replace(temp_path, archive_path)
+    return os.path.getsize(archive_path)
+
+def _move_into_place(source, target):
+    try:
+        os.replace(source, target)
+    except OSError:
+        # the staging directory is on another file system
+        shutil.move(source, target)
+
+def extract_archive(archive_path, root='/', staging_parent=False):
+    """
+    Restore the files stored with write_archive(). The archive is first
+    extracted to a staging directory so that a damaged archive leaves the
+    installed files untouched. Each file is then renamed over the installed
+    one, which also keeps running binaries intact.
+
+    Args:
+        archive_path - The tar file to extract
+        root - (optional) The directory that the stored paths are relative to
+        staging_parent - (optional) The directory to stage files in, which
+            should be on the same file system as the installed files
+    """
+    names = []
+    if staging_parent:
+        os.makedirs(staging_parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.sw-staging-', dir=staging_parent or None)
+    try:
+        members = []
+        with _open_read(archive_path) as tar:
+            for member in tar:
+                tar.extract(member, staging)
+                members.append(member)
+        for member in members:
+            source = os.path.join(staging, member.name)
+            target = os.path.join(root, member.name)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            if os.path.isdir(target) and not os.path.islink(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _move_into_place(source, target)
+            names.append(target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return names
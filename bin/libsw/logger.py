@@ -1,8 +1,116 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import json
+import time
+import codecs
+import shutil
+import selectors
 import subprocess
 
+# bytes read from a command's output at a time
+chunk_size = 64 * 1024
+
+# every sw invocation gets a new trace id, shared by it's forked builds and
+# passed to the commands it runs. A sw started by one of those commands, such
+# as from a build shell or cron, records the id it inherited as it's parent.
+if 'SW_TRACE_ID' in os.environ:
+    os.environ['SW_PARENT_TRACE_ID'] = os.environ['SW_TRACE_ID']
+else:
+    os.environ.pop('SW_PARENT_TRACE_ID', None)
+os.environ['SW_TRACE_ID'] = os.urandom(8).hex()
+
+# the largest resident set size in kilobytes of a command run by Log.run()
+# since the last call to reset_peak_rss()
+_peak_rss = 0
+
+def reset_peak_rss():
+    """Start measuring the peak memory use of the commands run from now on."""
+    global _peak_rss
+    _peak_rss = 0
+
+def peak_rss():
+    """
+    Get the largest resident set size in kilobytes of the commands run since
+    reset_peak_rss(), including the processes they started.
+    """
+    return _peak_rss
+
+def trace_id():
+    """Get the id that ties together the events of one sw invocation."""
+    return os.environ['SW_TRACE_ID']
+
+def parent_trace_id():
+    """
+    Get the trace id of the sw invocation that started this one, or False if
+    it was not started by sw.
+    """
+    return os.environ.get('SW_PARENT_TRACE_ID', False)
+
+def events_path():
+    """The file that structured events are appended to, one JSON object per line."""
+    from libsw import settings
+    return settings.get('install_path') + 'var/log/events.jsonl'
+
+def write_event(event_type, **fields):
+    """
+    Append a structured event to the events file, if the log_events setting is
+    enabled. Every event has the keys time, trace, pid and type, and the key
+    parent if this sw invocation was started by another one.
+
+    Args:
+        event_type - The kind of event, such as "run"
+        fields - Additional keys for the event
+    """
+    from libsw import settings
+    if not settings.get_bool('log_events'):
+        return
+    event = {'time': round(time.time(), 3), 'trace': trace_id(), 'pid': os.getpid(), 'type': event_type}
+    if parent_trace_id():
+        event['parent'] = parent_trace_id()
+    event.update(fields)
+    path = events_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a single append per event keeps lines from concurrent processes whole
+        with open(path, 'a') as events:
+            events.write(json.dumps(event) + '\n')
+    except OSError:
+        pass
+
+def finish_file(path):
+    """
+    Compress a log file that is no longer being written to with zstd, if the
+    compress_logs setting is enabled and zstd is installed.
+
+    Args:
+        path - The path of the log file
+
+    Return:
+        The path of the log file after compression
+    """
+    from libsw import settings
+    if not settings.get_bool('compress_logs') or shutil.which('zstd') == None:
+        return path
+    if subprocess.run(['zstd', '-q', '-f', '--rm', path, '-o', path + '.zst']).returncode != 0:
+        return path
+    return path + '.zst'
+
+def find_file(path):
+    """
+    Get the path of a log file as it exists on disk, which may have been
+    compressed by finish_file(), or False if there is no such log.
+
+    Args:
+        path - The path the log file was written to
+    """
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + '.zst'):
+        return path + '.zst'
+    return False
+
 class Log():
     """
     Create an output stream that logs both to the CLI and optionally to a file.
@@ -18,29 +126,63 @@ class Log():
         """
         self.open_log_file = open_log_file
 
-    def run(self, command, print_log=True, env=dict(os.environ)):
+    def _write_output(self, text, print_log):
+        if len(text) == 0:
+            return
+        text = text.replace('\r\n', '\n')
+        if print_log:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        if self.open_log_file != False:
+            self.open_log_file.write(text)
+
+    def run(self, command, print_log=True, env=dict(os.environ), pass_fds=()):
         """
         A convenience method to run CLI commands that steam their output to both
-        the screen and to the open log file at the same time.
+        the screen and to the open log file at the same time. The command,
+        it's duration and exit code are recorded as a "run" event.
 
         Args:
             command - An array containing the command and each of it's arguments
             print_log - (optional) You can set this to False to have the output
                 log to the screen but not to the log file
+            env - (optional) The environment variables for the command
+            pass_fds - (optional) File descriptors for the command to inherit
         """
-        process = subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.STDOUT, env=env)
-        while True:
-            line = process.stdout.readline()
-            if not line and process.returncode is not None:
-                break
-            if len(line) == 0:
-                break
-            log_line = line.decode("utf-8").rstrip()
-            if print_log:
-                print(log_line)
-            if self.open_log_file != False:
-                self.open_log_file.write(log_line + '\n')
-        process.communicate()
+        start = time.monotonic()
+        process = subprocess.Popen(command,stdout=subprocess.PIPE,stderr=subprocess.STDOUT, env=env, pass_fds=pass_fds)
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        line_open = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ)
+            while len(selector.get_map()) > 0:
+                for key, events in selector.select():
+                    chunk = os.read(key.fd, chunk_size)
+                    if len(chunk) == 0:
+                        selector.unregister(key.fileobj)
+                        continue
+                    text = decoder.decode(chunk)
+                    self._write_output(text, print_log)
+                    if len(text) > 0:
+                        line_open = not text.endswith('\n')
+        text = decoder.decode(b'', True)
+        if line_open or len(text) > 0:
+            # end the last line so that following output starts on a new one
+            self._write_output(text + '\n', print_log)
+        process.stdout.close()
+        # wait4 reports the peak memory of this command and it's children only
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        global _peak_rss
+        _peak_rss = max(_peak_rss, usage.ru_maxrss)
+        if self.open_log_file != False:
+            self.open_log_file.flush()
+        write_event('run',
+            command=command if isinstance(command, str) else [str(arg) for arg in command],
+            duration=round(time.monotonic() - start, 3),
+            exit_code=process.returncode,
+            log=getattr(self.open_log_file, 'name', False)
+        )
         return process.returncode
 
     def log(self, line, print_log=True):
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+from libsw import settings
+
+# read and write ends of the shared jobserver pipe, if one is running
+_jobserver = False
+
+def cpu_count():
+    """Get the number of processors this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def available_memory():
+    """
+    Get the amount of memory available for new processes in bytes, or False if
+    it can not be determined.
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return False
+
+def job_memory(slug):
+    """
+    Estimate how much memory a single make job of a package needs in bytes.
+    The estimate is the largest process seen while running make in previous
+    builds, falling back to the make_job_memory setting.
+
+    Args:
+        slug - The slug name of the package
+    """
+    from libsw import build_cache, build_stats
+    peak = 0
+    for record in build_stats.get_history(slug)[-10:]:
+        if 'make' in record['phases']:
+            peak = max(peak, record['phases']['make']['rss'] * 1024)
+    if peak > 0:
+        return peak
+    return build_cache.parse_size(settings.get('make_job_memory'))
+
+def plan_jobs(slug):
+    """
+    Pick the number of make jobs to use for a package. The number is limited
+    by the processor count and by how many jobs fit in the available memory.
+    Setting make_jobs to a number overrides the plan.
+
+    Args:
+        slug - The slug name of the package
+    """
+    setting = str(settings.get('make_jobs')).strip().lower()
+    if setting != 'auto':
+        return max(1, int(setting))
+    jobs = cpu_count()
+    memory = available_memory()
+    if memory:
+        jobs = min(jobs, memory // job_memory(slug))
+    return max(1, int(jobs))
+
+def start_jobserver(builds):
+    """
+    Create a GNU make jobserver to be shared by every make started from this
+    process and it's forked children. Each top level make has one implicit job
+    slot of it's own, so the pipe holds one token for every processor beyond
+    the number of builds that run at once.
+
+    Args:
+        builds - The number of builds that will run at the same time
+    """
+    global _jobserver
+    if _jobserver:
+        return
+    read_fd, write_fd = os.pipe()
+    tokens = max(0, cpu_count() - builds)
+    os.write(write_fd, b'+' * tokens)
+    _jobserver = [read_fd, write_fd]
+
+def stop_jobserver():
+    """Close the shared jobserver pipe."""
+    global _jobserver
+    if not _jobserver:
+        return
+    for fd in _jobserver:
+        os.close(fd)
+    _jobserver = False
+
+def jobserver_fds():
+    """
+    Get the file descriptors that child processes must inherit to use the
+    shared jobserver.
+    """
+    if _jobserver:
+        return tuple(_jobserver)
+    return ()
+
+def job_args(slug):
+    """
+    Get the make arguments that set the number of jobs for a package. When the
+    shared jobserver is running no -j argument is given since that would make
+    make start a jobserver of it's own.
+
+    Args:
+        slug - The slug name of the package
+    """
+    if _jobserver:
+        return []
+    return ['-j', str(plan_jobs(slug))]
+
+def apply_jobserver(env):
+    """
+    Get a copy of an environment that points make at the shared jobserver.
+
+    Args:
+        env - A dictionary of environment variables
+    """
+    env = dict(env)
+    if _jobserver:
+        fds = str(_jobserver[0]) + ',' + str(_jobserver[1])
+        # make 4.2 and later read --jobserver-auth, older versions --jobserver-fds
+        flags = ' -j --jobserver-fds=' + fds + ' --jobserver-auth=' + fds
+        env['MAKEFLAGS'] = (env.get('MAKEFLAGS', '') + flags).strip()
+    return env
@@ -12,7 +12,7 @@ def get_enabled_ruleset_builders():
     """
     from libsw import build_index
     builders = []
-    for i in build_index.Index().index:
+    for i in build_index.Index().all():
         if isinstance(i, AbstractRuleset):
             builders.append(i)
     return builders
@@ -46,7 +46,7 @@ def write_logrotate():
     missingok\n\
     compress\n\
     postrotate\n\
-	/bin/kill -USR1 `cat ' + nginx.nginx_dir + 'logs/nginx.pid 2>/dev/null` 2>/dev/null || true\n\
+	/bin/kill -USR1 `cat ' + nginx.nginx_dir() + 'logs/nginx.pid 2>/dev/null` 2>/dev/null || true\n\
     endscript\n\
 }\n\n')
 
@@ -24,8 +24,12 @@ class NagiosBuilder(builder.AbstractGitBuilder):
     def source_dir(self):
         return self.build_dir + 'nagioscore/'
 
+    def deploys_artifact(self):
+        # the additional install targets need the source tree
+        return False
+
     def install(self, log):
-        log.run(['make', 'install-groups-users'])
+        self.run_make(log, ['install-groups-users'])
         super().install(log)
-        log.run(['make', 'install-daemoninit'])
-        log.run(['make', 'install-commandmode'])
\ No newline at end of file
+        self.run_make(log, ['install-daemoninit'])
+        self.run_make(log, ['install-commandmode'])
\ No newline at end of file
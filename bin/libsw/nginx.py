@@ -2,24 +2,33 @@
 
 import os
 import re
-import inquirer
 import glob
 import subprocess
-import requests
 import tarfile
 from libsw import logger, builder, openssl, settings, service, user, input_util, file_filter
 
-modsec_exception_dir = settings.get('install_path') + 'etc/modsec/sites/'
-nginx_dir = settings.get('build_path') + 'nginx/'
-vhost_dir = nginx_dir + 'conf/vhosts/'
-binary_file =  nginx_dir + 'sbin/nginx'
+def modsec_exception_dir():
+    """The directory that holds per domain ModSecurity rule exceptions."""
+    return settings.get('install_path') + 'etc/modsec/sites/'
+
+def nginx_dir():
+    """The directory nginx is installed to."""
+    return settings.get('build_path') + 'nginx/'
+
+def vhost_dir():
+    """The directory that holds the vhost configuration files."""
+    return nginx_dir() + 'conf/vhosts/'
+
+def binary_file():
+    """The path of the nginx binary."""
+    return nginx_dir() + 'sbin/nginx'
 
 def reload():
     """
     Have nginx reload it's configuration from disk.
     """
     service.reload('nginx')
-    #os.system(binary_file + ' -s reload')
+    #os.system(binary_file() + ' -s reload')
 
 def get_modsec_path(domain):
     """
@@ -28,7 +37,7 @@ def get_modsec_path(domain):
     Args:
         domain - The domain associated with the ModSecurity file
     """
-    return modsec_exception_dir + domain
+    return modsec_exception_dir() + domain
 
 def get_vhost_path(domain):
     """
@@ -37,8 +46,8 @@ def get_vhost_path(domain):
     Args:
         domain - The domain associated with the vhost file
     """
-    path = vhost_dir + domain + '.conf'
-    disabled_path = vhost_dir + domain + '.conf.disabled'
+    path = vhost_dir() + domain + '.conf'
+    disabled_path = vhost_dir() + domain + '.conf.disabled'
     if os.path.exists(disabled_path) and not os.path.exists(path):
         return disabled_path
     return path
@@ -51,6 +60,7 @@ def choose_template(query_message, hide_ssl=False):
         query_message - The message to display to the user in the prompt
         hide_ssl - Only show non-SSL templates
     """
+    import inquirer
     templates = template_list()
     questions = [
         inquirer.List('f',
@@ -195,10 +205,10 @@ def populate_default_vhost_variables(username, domain, existing_fields=[]):
         ip6 = '::'
     if not local_ip or local_ip == 'False':
         local_ip = '0.0.0.0'
-    if not os.path.exists(modsec_exception_dir):
-        os.makedirs(modsec_exception_dir)
-    if not os.path.exists(vhost_dir):
-        os.makedirs(vhost_dir)
+    if not os.path.exists(modsec_exception_dir()):
+        os.makedirs(modsec_exception_dir())
+    if not os.path.exists(vhost_dir()):
+        os.makedirs(vhost_dir())
     with open(modsec, 'a+'):
         pass
     existing_fields = append_missing_variable(existing_fields, 'DOMAINNAMEE', domain)
@@ -349,8 +359,8 @@ def enabled_sites():
     Get an array of all domains with enabled vhost files.
     """
     domains = []
-    for file in glob.glob(vhost_dir + '*.conf'):
-        domains.append(file[len(vhost_dir):-5])
+    for file in glob.glob(vhost_dir() + '*.conf'):
+        domains.append(file[len(vhost_dir()):-5])
     return sorted(domains)
 
 def select_conf(query_message):
@@ -360,6 +370,7 @@ def select_conf(query_message):
     Args:
         query_message - The message to display to the user in the prompt
     """
+    import inquirer
     files = enabled_sites()
     questions = [
         inquirer.List('f',
@@ -375,8 +386,8 @@ def disabled_sites():
     Get an array of all domains with disabled vhost files.
     """
     domains = []
-    for file in glob.glob(vhost_dir + '*.conf.disabled'):
-        domains.append(file[len(vhost_dir):-14])
+    for file in glob.glob(vhost_dir() + '*.conf.disabled'):
+        domains.append(file[len(vhost_dir()):-14])
     return sorted(domains)
 
 def select_disabled_conf(query_message):
@@ -386,6 +397,7 @@ def select_disabled_conf(query_message):
     Args:
         query_message - The message to display to the user in the prompt
     """
+    import inquirer
     files = disabled_sites()
     questions = [
         inquirer.List('f',
@@ -404,8 +416,8 @@ def enable_vhost(domain):
     Args:
         domain - The domain to enable
     """
-    source = vhost_dir + domain + '.conf.disabled'
-    target = vhost_dir + domain + '.conf'
+    source = vhost_dir() + domain + '.conf.disabled'
+    target = vhost_dir() + domain + '.conf'
     if os.path.exists(source):
         os.rename(source, target)
         reload()
@@ -421,8 +433,8 @@ def disable_vhost(domain):
     Args:
         domain - The domain to disable
     """
-    source = vhost_dir + domain + '.conf'
-    target = vhost_dir + domain + '.conf.disabled'
+    source = vhost_dir() + domain + '.conf'
+    target = vhost_dir() + domain + '.conf.disabled'
     if os.path.exists(source):
         os.rename(source, target)
         reload()
@@ -438,8 +450,8 @@ def remove_vhost(domain):
         domain - Delete the file associated with this domain
     """
     modsec = get_modsec_path(domain)
-    enabled_path = vhost_dir + domain + '.conf'
-    disabled_path = vhost_dir + domain + '.conf.disabled'
+    enabled_path = vhost_dir() + domain + '.conf'
+    disabled_path = vhost_dir() + domain + '.conf.disabled'
     removed = False
     if os.path.exists(enabled_path):
         os.remove(enabled_path)
@@ -533,7 +545,7 @@ def deploy_environment(log, first_install):
 
     if first_install:
         #TODO add these lines to /opt/sitewrangler/usr/local/nginx/conf/nginx.conf with a FileFilter
-        with open(nginx_dir + 'conf/nginx.conf', 'w+') as out:
+        with open(nginx_dir() + 'conf/nginx.conf', 'w+') as out:
             out.write('''
 user  daemon daemon;
 worker_processes  auto;
@@ -622,7 +634,7 @@ http {
 ''')
         new = "    modsecurity on;\n" + \
             "    modsecurity_rules_file " + settings.get('install_path') + "etc/modsec/rules.conf;\n"
-    blockfile = nginx_dir + 'conf/blocklist.conf'
+    blockfile = nginx_dir() + 'conf/blocklist.conf'
     if not os.path.isfile(blockfile):
         with open(blockfile, 'a+'):
             pass
@@ -638,15 +650,15 @@ http {
             unit_file.write('\n')
             unit_file.write('[Service]\n')
             unit_file.write('Type=forking\n')
-            unit_file.write('PIDFile=' + nginx_dir + 'logs/nginx.pid\n')
-            unit_file.write('ExecStartPre=' + binary_file + ' -t\n')
-            unit_file.write('ExecStart=' + binary_file + '\n')
-            unit_file.write('ExecReload=' + binary_file + ' -s reload\n')
-            unit_file.write('ExecStop=' + binary_file + ' -s stop\n')
+            unit_file.write('PIDFile=' + nginx_dir() + 'logs/nginx.pid\n')
+            unit_file.write('ExecStartPre=' + binary_file() + ' -t\n')
+            unit_file.write('ExecStart=' + binary_file() + '\n')
+            unit_file.write('ExecReload=' + binary_file() + ' -s reload\n')
+            unit_file.write('ExecStop=' + binary_file() + ' -s stop\n')
             unit_file.write('PrivateTmp=true\n')
             unit_file.write('Restart=always\n')
             unit_file.write('RestartSec=3\n')
-            unit_file.write('Environment="LD_LIBRARY_PATH=' + builder.ld_path + '"\n')
+            unit_file.write('Environment="LD_LIBRARY_PATH=' + builder.ld_path() + '"\n')
             unit_file.write('\n')
             unit_file.write('[Install]\n')
             unit_file.write('WantedBy=multi-user.target\n')
@@ -666,7 +678,7 @@ def check_dhparams():
     filename = '/etc/ssl/certs/dhparam.pem'
     build_path = settings.get('build_path');
     if not os.path.exists(filename):
-        subprocess.run([build_path + 'bin/openssl', 'dhparam', '-dsaparam', '-out', filename, '4096'], env=builder.build_env)
+        subprocess.run([build_path + 'bin/openssl', 'dhparam', '-dsaparam', '-out', filename, '4096'], env=builder.build_env())
 
 def get_rule_bypass_line(rule_id):
     """
@@ -732,7 +744,7 @@ def write_logrotate():
     install_path = settings.get('install_path')
     filename = logrotate_file()
     with open(filename, 'w+') as output:
-        output.write(nginx_dir + 'logs/*.log {\n\
+        output.write(nginx_dir() + 'logs/*.log {\n\
     weekly\n\
     rotate 52\n\
     dateext\n\
@@ -740,7 +752,7 @@ def write_logrotate():
     copytruncate\n\
     missingok\n\
     postrotate\n\
-	/bin/kill -USR1 `cat ' + nginx_dir + 'logs/nginx.pid 2>/dev/null` 2>/dev/null || true\n\
+	/bin/kill -USR1 `cat ' + nginx_dir() + 'logs/nginx.pid 2>/dev/null` 2>/dev/null || true\n\
     endscript\n\
 }\n\n')
 
@@ -751,8 +763,8 @@ class NginxBuilder(builder.AbstractArchiveBuilder):
     def __init__(self):
         super().__init__('nginx')
 
-    def get_installed_version(self):
-        about_text = subprocess.getoutput(builder.set_sh_ld + binary_file + ' -v')
+    def probe_installed_version(self):
+        about_text = subprocess.getoutput(builder.set_sh_ld() + binary_file() + ' -v')
         match = re.match(r'nginx version: nginx/([0-9\.]*)', about_text)
         if match == None:
             return '0'
@@ -760,13 +772,14 @@ class NginxBuilder(builder.AbstractArchiveBuilder):
         return version
 
     def get_updated_version(self):
-        request = requests.get('https://nginx.org/en/download.html')
+        from libsw import http_client
+        page = http_client.get_text('https://nginx.org/en/download.html')
         split1 = re.compile(r'.*Stable(.*)')
         split2 = re.compile(r'(<a [^>]*>)')
         regex = re.compile(r'/download/nginx')
         clean = re.compile(r'.*href="/download/nginx\-([0-9\.]*)\.tar\.gz".*')
 
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             line = split1.sub(r'\1', line)
             line = split2.sub('\\1\n', line)
             for sub_line in line.splitlines():
@@ -785,6 +798,9 @@ class NginxBuilder(builder.AbstractArchiveBuilder):
     def get_source_url(self):
         return 'https://nginx.org/download/nginx-' + self.source_version + '.tar.gz'
 
+    def update_check_host(self):
+        return 'nginx.org'
+
     def dependencies(self):
         return ['openssl', 'modsec-nginx', 'cache-nginx']
 
@@ -792,17 +808,24 @@ class NginxBuilder(builder.AbstractArchiveBuilder):
         mod_lib = builder.get_pkg_config_var('modsecurity','libdir')
         nginx_env = dict(super().get_build_env())
         nginx_env['MODSECURITY_LIB'] = mod_lib
-        nginx_env['MODSECURITY_INC'] = builder.build_path + 'include/'
+        nginx_env['MODSECURITY_INC'] = builder.build_path() + 'include/'
         return nginx_env
 
+    def preserved_files(self):
+        # installed only if missing, next to a .default copy
+        files = [nginx_dir() + 'html/']
+        for name in ['nginx.conf', 'mime.types', 'fastcgi_params', 'fastcgi.conf', 'scgi_params', 'uwsgi_params']:
+            files.append(nginx_dir() + 'conf/' + name)
+        return files
+
     def install(self, log):
         first_install = False
-        if not os.path.exists(nginx_dir + 'conf/nginx.conf'):
+        if not os.path.exists(nginx_dir() + 'conf/nginx.conf'):
             first_install = True
         check_dhparams()
         super().install(log)
-        if not os.path.exists(nginx_dir + 'cache/'):
-            os.makedirs(nginx_dir + 'cache/')
+        if not os.path.exists(nginx_dir() + 'cache/'):
+            os.makedirs(nginx_dir() + 'cache/')
         deploy_environment(log, first_install)
 
 class AbstractNginxModuleBuilder(builder.AbstractTagBuilder):
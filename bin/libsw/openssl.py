@@ -2,31 +2,32 @@
 
 import os
 import re
-import requests
 import subprocess
 from libsw import version, file_filter, builder, settings
 
-build_path = settings.get('build_path')
-binary_path = build_path + 'bin/openssl'
+def binary_path():
+    """The path of the openssl binary."""
+    return builder.build_path() + 'bin/openssl'
 
 class OpensslBuilder(builder.AbstractArchiveBuilder):
     """A class to build OpenSSL from source."""
     def __init__(self):
         super().__init__('openssl')
 
-    def get_installed_version(self):
-        about_text = subprocess.getoutput(builder.set_sh_ld + binary_path + ' version')
+    def probe_installed_version(self):
+        about_text = subprocess.getoutput(builder.set_sh_ld() + binary_path() + ' version')
         match = re.match(r'OpenSSL ([0-9a-z\.]*)', about_text)
         if match == None:
             return '0'
         return match.group(1)
 
     def get_updated_version(self):
-        request = requests.get('https://www.openssl.org/source/')
+        from libsw import http_client
+        page = http_client.get_text('https://www.openssl.org/source/')
         regex = re.compile(r'\.tar\.gz')
         antiregex = re.compile(r'alpha|beta')
         newest = '0.0.0a'
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             match = regex.search(line)
             if match == None:
                 continue
@@ -42,9 +43,20 @@ class OpensslBuilder(builder.AbstractArchiveBuilder):
     def get_source_url(self):
         return 'https://github.com/openssl/openssl/releases/download/openssl-' + self.source_version + '/openssl-' + self.source_version + '.tar.gz'
 
+    def update_check_host(self):
+        return 'www.openssl.org'
+
+    def get_source_checksum(self):
+        from libsw import download
+        return download.fetch_checksum(self.get_source_url() + '.sha256')
+
     def populate_config_args(self, log):
         return super().populate_config_args(log, ['./config'])
 
+    def preserved_files(self):
+        # installed to the --openssldir only if missing, next to a .dist copy
+        return [builder.build_path() + 'openssl.cnf', builder.build_path() + 'ct_log_list.cnf']
+
     def cleanup_old_versions(self, log):
         super().cleanup_old_versions(log)
         if(int(self.source_version.split('.')[0]) >= 3):
@@ -53,7 +65,7 @@ class OpensslBuilder(builder.AbstractArchiveBuilder):
 def libs_path():
     path = settings.get('openssl_libs')
     if path == 'unset':
-        paths = [build_path + 'ssl/lib', build_path + 'lib64', build_path + 'lib']
+        paths = [builder.build_path() + 'ssl/lib', builder.build_path() + 'lib64', builder.build_path() + 'lib']
         at = -1
         while path == 'unset' or not os.path.exists(path + '/libssl.so.1.1'):
             at += 1
@@ -73,16 +85,16 @@ def setup_lib32(log):
     files = ['libcrypto.a', 'libcrypto.so', 'libcrypto.so.1.1', 'libssl.a', 'libssl.so', 'libssl.so.1.1']
     links = ['libssl.pc', 'openssl.pc', 'libcrypto.pc']
     for f in files:
-        file = build_path + 'lib/' + f
+        file = builder.build_path() + 'lib/' + f
         if os.path.exists(file):
             os.remove(file)
             log.log('Deleted ' + file)
-    link_dir = build_path + 'lib/pkgconfig/'
+    link_dir = builder.build_path() + 'lib/pkgconfig/'
     if not os.path.isdir(link_dir):
         os.makedirs(link_dir)
     for l in links:
         link = link_dir + l
-        target = build_path + 'lib64/pkgconfig/' + l
+        target = builder.build_path() + 'lib64/pkgconfig/' + l
         if not os.path.islink(link):
             if os.path.exists(link):
                 os.remove(link)
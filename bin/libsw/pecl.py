@@ -2,13 +2,14 @@
 
 import glob
 import re
-import requests
 from abc import abstractmethod
 from libsw import builder, version, settings
 
 class PeclBuilder(builder.AbstractArchiveBuilder):
 
-    def __init__(self, build_dir=settings.get('build_path') + 'src/pecl/'):
+    def __init__(self, build_dir=False):
+        if not build_dir:
+            build_dir = settings.get('build_path') + 'src/pecl/'
         slug = self.get_pecl_slug()
         super().__init__('pecl-' + slug, build_dir)
         self.up_to_date_version = False
@@ -27,9 +28,15 @@ class PeclBuilder(builder.AbstractArchiveBuilder):
         return '--enable-' + self.get_pecl_slug()
 
     def get_source_url(self):
-        return 'https://pecl.php.net/get/' + self.get_pecl_slug() + '-' + self.get_updated_version() + '.tgz'
+        source_version = self.source_version
+        if not source_version:
+            source_version = self.get_updated_version()
+        return 'https://pecl.php.net/get/' + self.get_pecl_slug() + '-' + source_version + '.tgz'
 
-    def get_installed_version(self):
+    def update_check_host(self):
+        return 'pecl.php.net'
+
+    def probe_installed_version(self):
         name = self.build_dir + self.slug[5:] + '-' + '*/'
         current = False
         current_version = '0'
@@ -46,11 +53,11 @@ class PeclBuilder(builder.AbstractArchiveBuilder):
         return current_version
 
     def get_updated_version(self):
+        from libsw import http_client
         if self.up_to_date_version != False :
             return self.up_to_date_version
         url = 'https://pecl.php.net/package/' + self.get_pecl_slug()
-        response = requests.get(url)
-        html = response.text
+        html = http_client.get_text(url)
         oneBack = ''
         twoBack = ''
         link = ''
@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
 
-import inquirer
 import glob
 import os
+import json
 import subprocess
 import re
-import requests
 import shutil
 import pwd
 import time
+import threading
 from shutil import copyfile
-from libsw import logger, file_filter, version, builder, settings, service, system, user, input_util
+from libsw import logger, file_filter, version, builder, settings, service, system, user, input_util, source_mirror, install_manifest
 
 # enable_legacy_versions = settings.get_bool('enable_php_legacy_versions')
 php80version = '8.0.30' # 04 Aug 2023
@@ -60,13 +60,11 @@ super_legacy_versions = [
     php30version
 ]
 
-build_path = settings.get('build_path')
-
 def php_build_path(sub_version):
-    return build_path + 'php-' + sub_version  + '/'
+    return builder.build_path() + 'php-' + sub_version  + '/'
 
 def php_binary_path(sub_version):
-    return build_path + 'php-' + sub_version  + '/bin/php'
+    return builder.build_path() + 'php-' + sub_version  + '/bin/php'
 
 def vhost_path(sub_version):
     return php_build_path(sub_version) + 'etc/php-fpm.d/'
@@ -92,7 +90,7 @@ def get_installed_version(sub_version):
     Args:
         sub_version - The first two numbers in a PHP version
     """
-    return subprocess.getoutput(builder.set_sh_ld + php_binary_path(sub_version) + " -v 2>/dev/null | grep '^PHP " + sub_version + "' | awk '{print $2}'")
+    return subprocess.getoutput(builder.set_sh_ld() + php_binary_path(sub_version) + " -v 2>/dev/null | grep '^PHP " + sub_version + "' | awk '{print $2}'")
 
 def get_versions(excluded_array=False):
     """
@@ -122,6 +120,7 @@ def select_version(excluded_array=False):
     Args:
         excluded_array - (optional) A list of PHP subversions to exclude
     """
+    import inquirer
     if excluded_array == False:
         excluded_array=[]
     versions = get_versions(excluded_array)
@@ -138,6 +137,7 @@ def select_updated_version():
     """
     Prompt the user to select a PHP version from those avaliable at php.net.
     """
+    import inquirer
     global version_cache
     if not version_cache:
         versions = get_updated_versions()
@@ -323,8 +323,8 @@ def set_sys_user_version(username, version):
                 '# START PHP VERSION PATH',
                 '# END PHP VERSION PATH',
                 'export PATH=' + php_build_path(version) + 'bin' + os.pathsep + '$PATH\n' +
-                'alias php=\'LD_LIBRARY_PATH="' + build_path + 'lib64:' + build_path + 'lib" php\'\n' +
-                'alias wp=\'LD_LIBRARY_PATH="' + build_path + 'lib64:' + build_path + 'lib" php ' + build_path + 'wp-cli/wp-cli.phar\'\n'
+                'alias php=\'LD_LIBRARY_PATH="' + builder.build_path() + 'lib64:' + builder.build_path() + 'lib" php\'\n' +
+                'alias wp=\'LD_LIBRARY_PATH="' + builder.build_path() + 'lib64:' + builder.build_path() + 'lib" php ' + builder.build_path() + 'wp-cli/wp-cli.phar\'\n'
             ).run()
         link_dir = '/home/' + username + '/.local/bin/'
         link_path = link_dir + 'php'
@@ -376,6 +376,7 @@ def select_conf(query_message):
     Args:
         query_message - The message to display to the user in the prompt
     """
+    import inquirer
     sites = get_conf_files()
     display_sites = []
     for site in sites:
@@ -396,6 +397,7 @@ def select_disabled_conf(query_message):
     Args:
         query_message - The message to display to the user in the prompt
     """
+    import inquirer
     sites = get_disabled_conf_files()
     display_sites = []
     for site in sites:
@@ -436,6 +438,7 @@ def get_prerelease_user(force_refresh=False):
     Args:
         force_refresh - (optional) When set to True, do not use cached values
     """
+    from libsw import http_client
     cache_dir = settings.get('install_path') + 'var/cache/'
     cache_file = cache_dir + 'php-prerelease-user'
     use_cache = force_refresh == False
@@ -445,7 +448,7 @@ def get_prerelease_user(force_refresh=False):
         max_age = settings.get_num('build_cache_age')
         mod_time = os.stat(cache_file).st_mtime
         age = time.time() - mod_time
-        if age > max_age:
+        if age > max_age and not source_mirror.is_offline():
             use_cache = False
     else:
         if not os.path.exists(cache_dir):
@@ -459,9 +462,9 @@ def get_prerelease_user(force_refresh=False):
         else:
             return ''
     else:
-        request = requests.get('https://www.php.net/')
+        page = http_client.get_text('https://www.php.net/')
         regex = re.compile(r'.*"https://downloads\.php\.net/~([a-zA-Z0-9]*)/".*')
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             match = regex.match(line)
             if match == None:
                 continue
@@ -473,13 +476,21 @@ def get_prerelease_user(force_refresh=False):
             cache_write.write(prerelease_user + "\n")
         return prerelease_user
 
+_versions_lock = threading.Lock()
+
 def get_updated_versions(force_refresh=False):
     """
-    Get the full version numbers of versions avaliable at php.net.
+    Get the full version numbers of versions avaliable at php.net. Only one
+    thread refreshes the version cache at a time.
 
     Args:
         force_refresh - (optional) When set to True, do not use cached values
     """
+    with _versions_lock:
+        return _get_updated_versions(force_refresh)
+
+def _get_updated_versions(force_refresh):
+    from libsw import http_client
     vers = []
     cache_dir = settings.get('install_path') + 'var/cache/'
     cache_file = cache_dir + 'php-versions'
@@ -489,7 +500,7 @@ def get_updated_versions(force_refresh=False):
         max_age = settings.get_num('build_cache_age')
         mod_time = os.stat(cache_file).st_mtime
         age = time.time() - mod_time
-        if age > max_age:
+        if age > max_age and not source_mirror.is_offline():
             use_cache = False
     else:
         if not os.path.exists(cache_dir):
@@ -508,9 +519,9 @@ def get_updated_versions(force_refresh=False):
                     clean_versions.append(version)
             return clean_versions
     else:
-        request = requests.get('https://www.php.net/downloads.php?source=Y')
+        page = http_client.get_text('https://www.php.net/downloads.php?source=Y')
         regex = re.compile(r'.*/distributions/php-([0-9\.]*)\.tar\.bz2.*')
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             match = regex.match(line)
             if match == None:
                 continue
@@ -545,10 +556,11 @@ def get_updated_versions(force_refresh=False):
         return vers
 
 def get_prerelease_version(version_array):
-    request = requests.get('https://downloads.php.net/~' + get_prerelease_user(True) + '/')
+    from libsw import http_client
+    page = http_client.get_text('https://downloads.php.net/~' + get_prerelease_user(True) + '/')
     regex = re.compile(r'.*<a href="php-([0-9\.]*)([a-zA-Z]*)([0-9]+)\.tar\.bz2">.*')
     latest = False
-    for line in request.text.splitlines():
+    for line in page.splitlines():
         match = regex.match(line)
         if match == None:
             continue
@@ -564,6 +576,14 @@ def get_prerelease_version(version_array):
     return version_array
 
 
+def _is_release_data(text):
+    """Check if php.net release JSON lists the source archives of a release."""
+    try:
+        release = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(release, dict) and 'source' in release
+
 class AddPid(file_filter.FileFilter):
     """Append a line to a PHP vhost file to have PHP create a pid file."""
     def filter_stream(self, in_stream, out_stream):
@@ -587,7 +607,7 @@ def deploy_environment(versions, log):
         version - The PHP version to setup
         log - An open log to write to
     """
-    bin_path = build_path + 'bin/php-' + versions['sub']
+    bin_path = builder.build_path() + 'bin/php-' + versions['sub']
     base_path = php_build_path(versions['sub'])
     src_dir = versions['full']
     if '.a.' in src_dir:
@@ -598,7 +618,7 @@ def deploy_environment(versions, log):
         src_dir = src_dir.replace('.r.', 'rc')
     if '.R.' in src_dir:
         src_dir = src_dir.replace('.R.', 'RC')
-    src_dir = build_path + 'src/php-' + src_dir + '/'
+    src_dir = builder.build_path() + 'src/php-' + src_dir + '/'
     bin_link_exists = os.path.islink(bin_path) or os.path.isfile(bin_path)
     if not bin_link_exists:
         os.symlink(php_binary_path(versions['sub']), bin_path)
@@ -607,11 +627,12 @@ def deploy_environment(versions, log):
 
     fpm_conf_name = base_path + 'etc/php-fpm.conf'
     copyfile(fpm_conf_name + '.default', fpm_conf_name)
-    file_filter.ReplaceRegex(fpm_conf_name, re.compile('^;?pid\s+='), 'pid = run/php-fpm.pid\n', 1).run()
     include_line = 'include=' + vhost_path(versions['sub']) + '*.conf'
-    file_filter.AppendUnique(fpm_conf_name, include_line, True).run()
-
-    AddPid(fpm_conf_name).run()
+    file_filter.FilterChain(fpm_conf_name, [
+        file_filter.ReplaceRegex(fpm_conf_name, re.compile('^;?pid\s+='), 'pid = run/php-fpm.pid\n', 1),
+        file_filter.AppendUnique(fpm_conf_name, include_line, True),
+        AddPid(fpm_conf_name)
+    ]).run()
 
     write_primary_logrotate()
 
@@ -632,7 +653,7 @@ def deploy_environment(versions, log):
             unit_file.write('ExecReload=/bin/kill -USR2 $MAINPID\n')
             unit_file.write('Restart=always\n')
             unit_file.write('RestartSec=3\n')
-            unit_file.write('Environment="LD_LIBRARY_PATH=' + builder.ld_path + '"\n')
+            unit_file.write('Environment="LD_LIBRARY_PATH=' + builder.ld_path() + '"\n')
             unit_file.write('\n')
             unit_file.write('[Install]\n')
             unit_file.write('WantedBy=multi-user.target\n')
@@ -653,12 +674,14 @@ def remove_environment(subversion, log):
     Args:
         subversion - The first two numbers in the PHP version
     """
-    fullversion = get_installed_version(subversion)
+    fullversion = install_manifest.get_version('php-' + subversion)
+    if not fullversion:
+        fullversion = get_installed_version(subversion)
     service.stop('php-' + subversion + '-fpm')
     log.log('Stopped php-' + subversion + '-fpm')
     service.disable('php-' + subversion + '-fpm')
     log.log('php-' + subversion + '-fpm disabled')
-    binfile = build_path + 'bin/php-' + subversion
+    binfile = builder.build_path() + 'bin/php-' + subversion
     if os.path.exists(binfile):
         os.unlink(binfile)
         log.log('Removed ' + binfile)
@@ -672,10 +695,11 @@ def remove_environment(subversion, log):
         log.log('Deleted ' + servicefile)
         service.reload_init()
         log.run(['systemctl','reset-failed','php-' + subversion + '-fpm'])
-    sourcepath = build_path + 'src/php-' + fullversion + '/'
+    sourcepath = builder.build_path() + 'src/php-' + fullversion + '/'
     if os.path.exists(sourcepath):
         shutil.rmtree(sourcepath)
         log.log('Deleted ' + sourcepath)
+    install_manifest.forget('php-' + subversion)
 
 def detect_distro_code():
     """
@@ -810,9 +834,9 @@ class ImapBuilder(builder.AbstractGitBuilder):
         return 'https://github.com/uw-imap/imap.git'
 
     def make(self, log):
-        with open(build_path + 'src/imap/ip6', 'w'):
+        with open(builder.build_path() + 'src/imap/ip6', 'w'):
             pass
-        return log.run(['make', '-l', settings.get('max_build_load'), self.get_distro(), 'IP=6'], env=builder.build_env)
+        return self.run_make(log, [self.get_distro(), 'IP=6'])
 
     def get_distro(self):
         distro = settings.get('imap_distro')
@@ -830,7 +854,7 @@ class ImapBuilder(builder.AbstractGitBuilder):
         if self.distros != False:
             return self.distros
         self.distros = []
-        with open(build_path + 'src/imap/Makefile') as makefile:
+        with open(builder.build_path() + 'src/imap/Makefile') as makefile:
             specials = False
             for line in makefile:
                 if specials and len(line.strip()) == 0:
@@ -848,6 +872,7 @@ class ImapBuilder(builder.AbstractGitBuilder):
         return self.distros
 
     def select_distro(self, query_message):
+        import inquirer
         distro_list = []
         code_list = []
         for code, name in self.get_distro_list():
@@ -866,7 +891,7 @@ class ImapBuilder(builder.AbstractGitBuilder):
         pass
 
     def populate_config_args(self, log): # hack: using config methods to call sed in makefile
-        return ['sed', '-i', r's/^\(EXTRAAUTHENTICATORS=\).*$/\1gss/', build_path + 'src/imap/Makefile']
+        return ['sed', '-i', r's/^\(EXTRAAUTHENTICATORS=\).*$/\1gss/', builder.build_path() + 'src/imap/Makefile']
 
     def source_dir(self):
         return self.build_dir + 'imap/'
@@ -876,7 +901,7 @@ class ImapBuilder(builder.AbstractGitBuilder):
         target_dir = self.source_dir()
         ssl_lib_dir = builder.get_pkg_config_var('openssl', 'libdir')
         log.run(['sed', '-i', r's~SSLLIB=/[^ ]* ~SSLLIB=' + ssl_lib_dir + r' ~', target_dir + 'Makefile'])
-        log.run(['sed', '-i', r's~SSLINCLUDE=/[^ ]* ~SSLINCLUDE=' + build_path + r'include ~', target_dir + 'Makefile'])
+        log.run(['sed', '-i', r's~SSLINCLUDE=/[^ ]* ~SSLINCLUDE=' + builder.build_path() + r'include ~', target_dir + 'Makefile'])
 
     def dependencies(self):
         return ['openssl']
@@ -900,13 +925,17 @@ class PhpBuilder(builder.AbstractArchiveBuilder):
             self.versions = version.get_tree(self.get_updated_version())
         super().__init__('php-' + self.versions['sub'])
 
-    def get_installed_version(self):
+    def probe_installed_version(self):
         return get_installed_version(self.versions['sub'])
 
     def get_updated_version_list(self):
         return get_updated_versions()
 
     def get_updated_version(self):
+        if source_mirror.is_offline():
+            mirrored = source_mirror.latest_version('php-' + self.versions['sub'])
+            if mirrored:
+                return mirrored
         update_versions = self.get_updated_version_list()
         regex = re.compile(self.versions['sub'].replace('.', r'\.'))
         new_ver = False
@@ -930,6 +959,28 @@ class PhpBuilder(builder.AbstractArchiveBuilder):
                 source = 'https://downloads.php.net/~' + prerelease_username + '/php-' + full_version.replace('.R.', 'RC') + '.tar.bz2'
         return source
 
+    def get_source_checksum(self):
+        from libsw import http_client
+        full_version = self.versions['full']
+        if not re.match(r'^[0-9\.]*$', full_version):
+            return False # prereleases are not listed in the release data
+        try:
+            # release data never changes so it is cached for as long as possible,
+            # but not an error for a version that has not been published yet
+            release = json.loads(http_client.get_text('https://www.php.net/releases/?json&version=' + full_version, 365 * 86400, _is_release_data))
+        except (http_client.RequestException, ValueError):
+            return False
+        for source in release.get('source', []):
+            if source.get('filename') == 'php-' + full_version + '.tar.bz2' and 'sha256' in source:
+                return source['sha256']
+        return False
+
+    def update_check_host(self):
+        return 'www.php.net'
+
+    def manifest_args(self):
+        return [self.versions['sub']]
+
     def dependencies(self):
         from libsw import build_index
         deps = ['openssl', 'uw-imap', 'curl']
@@ -1010,8 +1061,8 @@ class PhpBuilder(builder.AbstractArchiveBuilder):
         for pecl_builder in get_registered_pecl_builders():
             command.append(pecl_builder.get_php_build_arg())
         if 'postgresql' in build_index.enabled_slugs():
-            command.append('--with-pgsql=' + build_path)
-            command.append('--with-pdo-pgsql=' + build_path)
+            command.append('--with-pgsql=' + builder.build_path())
+            command.append('--with-pdo-pgsql=' + builder.build_path())
         return super().populate_config_args(log, command)
 
     def source_dir(self):
@@ -1044,10 +1095,10 @@ class PhpBuilder(builder.AbstractArchiveBuilder):
     def cleanup_old_versions(self, log):
         found = False
         found_version = False
-        for logname in builder.find_old_build_elements(settings.get('install_path') + 'var/log/build/php-' + self.versions['sub'] + '.', '.log'):
+        for logname in builder.find_old_build_logs(settings.get('install_path') + 'var/log/build/php-' + self.versions['sub'] + '.'):
             os.remove(logname)
             log.log("Removed old log file " + logname)
-        for folder in builder.find_old_build_elements(build_path + 'src/php-' + self.versions['sub'] + '.', '/'):
+        for folder in builder.find_old_build_elements(builder.build_path() + 'src/php-' + self.versions['sub'] + '.', '/'):
             shutil.rmtree(folder)
             log.log("Removed old source directory " + folder)
 
@@ -1064,7 +1115,7 @@ class PhpBuilder(builder.AbstractArchiveBuilder):
         if rebuild_config:
             log.log('Rebuilding PHP configure file to include PECL libraries')
             os.remove(self.source_dir() + 'configure')
-            log.run([self.source_dir() + 'buildconf', '--force'], env=builder.build_env)
+            log.run([self.source_dir() + 'buildconf', '--force'], env=self.get_build_env())
         if version.first_is_higher('8.0.9999', self.versions['full']):
             remove_ssl2(log, self.source_dir() + 'ext/openssl/openssl.c')
 
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import re
-import requests
 import subprocess
 from libsw import builder, settings
 
@@ -10,19 +9,20 @@ class PostgresqlBuilder(builder.AbstractArchiveBuilder):
     def __init__(self):
         super().__init__('postgresql')
 
-    def get_installed_version(self):
-        about_text = subprocess.getoutput(builder.set_sh_ld + settings.get('build_path') + 'bin/postgres -V')
+    def probe_installed_version(self):
+        about_text = subprocess.getoutput(builder.set_sh_ld() + settings.get('build_path') + 'bin/postgres -V')
         match = re.match(r'postgres \(PostgreSQL\) ([0-9\.]*)', about_text)
         if match == None:
             return '0'
         return match.group(1)
 
     def get_updated_version(self):
-        request = requests.get('https://www.postgresql.org/ftp/source/')
+        from libsw import http_client
+        page = http_client.get_text('https://www.postgresql.org/ftp/source/')
         regex = re.compile(r'a href="v')
         wrong_regex = re.compile(r'[Bb][Ee][Tt][Aa]')
         link_line = False
-        for line in request.text.splitlines():
+        for line in page.splitlines():
             match = regex.search(line)
             if match == None:
                 continue
@@ -37,5 +37,12 @@ class PostgresqlBuilder(builder.AbstractArchiveBuilder):
     def get_source_url(self):
         return 'https://ftp.postgresql.org/pub/source/v' + self.source_version + '/postgresql-' + self.source_version + '.tar.bz2'
 
+    def update_check_host(self):
+        return 'www.postgresql.org'
+
+    def get_source_checksum(self):
+        from libsw import download
+        return download.fetch_checksum(self.get_source_url() + '.sha256')
+
     def dependencies(self):
         return ['openssl']
\ No newline at end of file
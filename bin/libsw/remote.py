@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import threading
+import subprocess
+from libsw import settings
+
+# package versions installed on each host, fetched once per run
+_inventories = {}
+_inventory_lock = threading.Lock()
+
+def control_dir():
+    """The directory that holds the shared SSH connection sockets."""
+    return settings.get('install_path') + 'var/run/ssh/'
+
+def ssh_options():
+    """
+    Get the SSH options that make every connection to a host reuse a single
+    multiplexed master connection. The master stays open for the
+    deploy_ssh_persist setting after it's last use.
+    """
+    os.makedirs(control_dir(), mode=0o700, exist_ok=True)
+    return [
+        '-o', 'ControlMaster=auto',
+        '-o', 'ControlPath=' + control_dir() + '%C',
+        '-o', 'ControlPersist=' + str(settings.get('deploy_ssh_persist')),
+        '-o', 'BatchMode=yes'
+    ]
+
+def run(host, command):
+    """
+    Run a command on a remote server as root.
+
+    Args:
+        host - The IP address or host name of the server
+        command - The command string to run with the remote shell
+
+    Return:
+        A subprocess.CompletedProcess with the text output captured
+    """
+    ssh = ['ssh'] + ssh_options() + ['root@' + host, command]
+    return subprocess.run(ssh, capture_output=True, text=True)
+
+def rsync(host, sources, target_dir, extra_args=False):
+    """
+    Copy local files to a directory on a remote server through the shared
+    SSH connection.
+
+    Args:
+        host - The IP address or host name of the server
+        sources - An array of local paths
+        target_dir - The remote directory to copy into
+        extra_args - (optional) An array of extra rsync arguments
+
+    Return:
+        A subprocess.CompletedProcess with the text output captured
+    """
+    command = ['rsync', '-a', '-e', ' '.join(['ssh'] + ssh_options())]
+    if extra_args:
+        command.extend(extra_args)
+    command.extend(sources)
+    command.append('root@' + host + ':' + target_dir)
+    return subprocess.run(command, capture_output=True, text=True)
+
+def get_inventory(host):
+    """
+    Get the version of every package on a remote server with a single
+    "sw build versions --json" call. The result is kept until close() is
+    called for the host.
+
+    Args:
+        host - The IP address or host name of the server
+
+    Return:
+        A dictionary of slugs to version strings, or False if the server's
+        Site Wrangler does not support inventories
+    """
+    with _inventory_lock:
+        if host in _inventories:
+            return _inventories[host]
+    result = run(host, 'sw build versions --json 2>/dev/null')
+    inventory = False
+    if result.returncode == 0:
+        try:
+            inventory = json.loads(result.stdout)
+        except ValueError:
+            inventory = False
+    with _inventory_lock:
+        _inventories[host] = inventory
+    return inventory
+
+def close(host):
+    """
+    Close the shared SSH connection to a host, if one is open, and forget
+    it's package inventory.
+
+    Args:
+        host - The IP address or host name of the server
+    """
+    with _inventory_lock:
+        _inventories.pop(host, None)
+    ssh = ['ssh'] + ssh_options() + ['-O', 'exit', 'root@' + host]
+    subprocess.run(ssh, capture_output=True)
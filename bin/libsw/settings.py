@@ -34,6 +34,20 @@ def set(setting_name, value):
         _settings_dict[setting_name] = value
     UpdateSetting(setting_name, value).run()
 
+def set_many(values):
+    """
+    Set several settings with a single rewrite of the settings file.
+
+    Args:
+        values - A dictionary of setting keys to their new values
+    """
+    chain = file_filter.FilterChain(install_path + 'etc/config')
+    for setting_name, value in values.items():
+        if(_settings_dict != False):
+            _settings_dict[setting_name] = value
+        chain.add(UpdateSetting(setting_name, value))
+    chain.run()
+
 def get_bool(setting_name):
     """
     Same as get(setting_name), but converts the return value to a boolean value.
@@ -106,12 +120,30 @@ def _populate_settings():
     else:
         _autodetect_defaults()
 
+def detect_exim_user():
+    """
+    Get the user and group that Exim runs as, or "Mail" for both if there is no
+    Exim user or group on this system.
+    """
+    import subprocess
+    user = 'Mail'
+    group = 'Mail'
+
+    test_group = subprocess.getoutput("sed -n '/^[^:]*[Ee]xim/ s/:.*//gp' /etc/group")
+    test_user = subprocess.getoutput("sed -n '/^[^:]*[Ee]xim/ s/:.*//gp' /etc/passwd")
+    if len(test_group) > 0:
+        group = test_group
+    if len(test_user) > 0:
+        user = test_user
+
+    return user, group
+
 def _autodetect_defaults():
     # Detect the Exim system user
-    from libsw import email, php
-    user, group = email.get_detected_exim_user()
-    set('exim_user', user)
-    set('exim_group', group)
+    detected = {}
+    user, group = detect_exim_user()
+    detected['exim_user'] = user
+    detected['exim_group'] = group
 
     ## imap distro detection relies on builder which in turn relies on settings
     # detected_distro = php.detect_distro_code()
@@ -125,7 +157,8 @@ def _autodetect_defaults():
     if len(cpu_count):
         cpu_count = int(cpu_count)
         if cpu_count > 0:
-            set('max_build_load', str(cpu_count) + '.0')
+            detected['max_build_load'] = str(cpu_count) + '.0'
+    set_many(detected)
 
 def _get_default_settings():
     """
@@ -155,6 +188,12 @@ def _get_default_settings():
         'deploy_openssl': False,
         'deploy_curl': False,
         'build_cache_age': 43200,
+        'update_check_threads': '8',
+        'update_check_host_limit': '2',
+        'build_cache_size': '4G',
+        'ccache': 'auto',
+        'ccache_dir': '',
+        'ccache_size': '5G',
 
         'enable_php_legacy_versions': False,
         'enable_php_super_legacy_versions': False,
@@ -163,6 +202,17 @@ def _get_default_settings():
         'public_ip': '',
         'ip6': False,
         'max_build_load': '1.0',
+        'build_jobs': '1',
+        'make_jobs': 'auto',
+        'make_job_memory': '512M',
+        'git_clone_depth': '0',
+        'offline_builds': False,
+        'deploy_concurrency': '4',
+        'deploy_ssh_persist': '60',
+        'http_timeout': '30',
+        'http_retries': '3',
+        'log_events': True,
+        'compress_logs': False,
         'db_root_requires_password': False,
         'mysql_socket': '/var/run/mysqld/mysqld.sock',
         'build_server': False,
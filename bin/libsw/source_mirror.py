@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import hashlib
+from libsw import settings, version
+
+# set by the --offline flag of the build commands
+_offline = False
+
+def set_offline(offline=True):
+    """
+    Only build from sources already in the mirror. Version lookups use the
+    mirrored versions instead of asking upstream websites.
+
+    Args:
+        offline - (optional) False to allow downloads again
+    """
+    global _offline
+    _offline = offline
+
+def is_offline():
+    """Returns True if builds may not download anything."""
+    return _offline or settings.get_bool('offline_builds')
+
+def mirror_dir(slug=False):
+    """
+    The directory that holds downloaded source archives.
+
+    Args:
+        slug - (optional) Get the directory of a single package
+    """
+    path = settings.get('install_path') + 'var/cache/sources/'
+    if slug:
+        path += slug + '/'
+    return path
+
+def _index_file(slug):
+    return mirror_dir(slug) + 'index.json'
+
+def _read_index(slug):
+    path = _index_file(slug)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as index_file:
+            return json.load(index_file)
+    except ValueError:
+        return {}
+
+def _write_index(slug, index):
+    path = _index_file(slug)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w') as index_file:
+        json.dump(index, index_file, indent=1)
+    os.replace(path + '.part', path)
+
+def file_name(url):
+    """
+    Get the name a source URL is stored under in the mirror.
+
+    Args:
+        url - The source URL
+    """
+    return url.split('?')[0].rstrip('/').split('/')[-1]
+
+def hash_file(path):
+    """Get the sha256 hex digest of a file."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as data:
+        for chunk in iter(lambda: data.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def lookup(slug, url):
+    """
+    Get the path to the mirrored copy of a source URL, or False if it is not
+    mirrored or the stored file no longer matches it's checksum.
+
+    Args:
+        slug - The slug name of the package
+        url - The source URL
+    """
+    index = _read_index(slug)
+    name = file_name(url)
+    path = mirror_dir(slug) + name
+    if name not in index or not os.path.exists(path):
+        return False
+    if hash_file(path) != index[name]['sha256']:
+        return False
+    return path
+
+def add(slug, source_version, url, path):
+    """
+    Record a file that was downloaded into the mirror.
+
+    Args:
+        slug - The slug name of the package
+        source_version - The version of the package the file belongs to
+        url - The URL the file was downloaded from
+        path - The path of the file inside mirror_dir(slug)
+    """
+    index = _read_index(slug)
+    index[os.path.basename(path)] = {
+        'url': url,
+        'version': str(source_version),
+        'sha256': hash_file(path),
+        'time': int(time.time())
+    }
+    _write_index(slug, index)
+
+def mirrored_versions(slug):
+    """
+    Get an array of the versions of a package in the mirror.
+
+    Args:
+        slug - The slug name of the package
+    """
+    versions = []
+    for name, entry in _read_index(slug).items():
+        if entry['version'] not in versions:
+            versions.append(entry['version'])
+    return versions
+
+def latest_version(slug):
+    """
+    Get the highest version of a package in the mirror or False if none.
+
+    Args:
+        slug - The slug name of the package
+    """
+    versions = mirrored_versions(slug)
+    if len(versions) == 0:
+        return False
+    return max(versions, key=version.sort_key)
+
+def fetch_archive(slug, source_version, url, target_dir, log, checksum=False):
+    """
+    Extract a source archive, downloading it into the mirror first if it is
+    not there yet. The download is extracted as it arrives.
+
+    Args:
+        slug - The slug name of the package
+        source_version - The version of the package the archive belongs to
+        url - The URL of the archive
+        target_dir - The directory to extract into
+        log - An open log file
+        checksum - (optional) The expected checksum of the archive, or a
+            function that returns it, only called if a download is needed
+
+    Return:
+        True on success, otherwise False
+    """
+    from libsw import download
+    path = lookup(slug, url)
+    if path:
+        log.log('Using mirrored source ' + path)
+        return download.extract_archive(path, target_dir, log)
+    if is_offline():
+        log.log('Error: ' + file_name(url) + ' is not in the source mirror and downloads are disabled in offline mode')
+        return False
+    if callable(checksum):
+        checksum = checksum()
+    path = mirror_dir(slug) + file_name(url)
+    if not download.fetch_archive(url, target_dir, log, checksum, keep_path=path):
+        return False
+    add(slug, source_version, url, path)
+    return True
+
+def fetch_file(slug, url, path, log):
+    """
+    Download a file that is kept in it's own cache, such as a patch, unless
+    the build is offline.
+
+    Args:
+        slug - The slug name of the package
+        url - The URL of the file
+        path - The path to save the file to
+        log - An open log file
+    """
+    from libsw import download
+    if is_offline():
+        log.log('Error: ' + url + ' has not been downloaded for ' + slug + ' and downloads are disabled in offline mode')
+        return False
+    return download.fetch_file(url, path, log)
+
+def evict(keep):
+    """
+    Remove mirrored files that are not needed by any package.
+
+    Args:
+        keep - A dictionary of slugs to arrays of versions that are still in use.
+            Packages missing from the dictionary are removed entirely.
+
+    Return:
+        An array of the removed file paths
+    """
+    removed = []
+    base = mirror_dir()
+    if not os.path.isdir(base):
+        return removed
+    for slug in sorted(os.listdir(base)):
+        slug_dir = mirror_dir(slug)
+        if not os.path.isdir(slug_dir):
+            continue
+        index = _read_index(slug)
+        versions = keep.get(slug, [])
+        for name in list(index):
+            if index[name]['version'] in versions:
+                continue
+            if os.path.exists(slug_dir + name):
+                os.remove(slug_dir + name)
+            removed.append(slug_dir + name)
+            del index[name]
+        if len(index) == 0:
+            for name in os.listdir(slug_dir):
+                os.remove(slug_dir + name)
+            os.rmdir(slug_dir)
+        else:
+            _write_index(slug, index)
+    return removed
+
+def prefetch(slug, source_version, url, log, checksum=False):
+    """
+    Download a source archive into the mirror without extracting it.
+
+    Args:
+        slug - The slug name of the package
+        source_version - The version of the package the archive belongs to
+        url - The URL of the archive
+        log - An open log file
+        checksum - (optional) The expected checksum of the archive, or a
+            function that returns it, only called if a download is needed
+
+    Return:
+        True if the archive is in the mirror, otherwise False
+    """
+    from libsw import download
+    if lookup(slug, url):
+        return True
+    if callable(checksum):
+        checksum = checksum()
+    path = mirror_dir(slug) + file_name(url)
+    if not download.fetch_file(url, path, log, checksum):
+        return False
+    add(slug, source_version, url, path)
+    return True
+
+def _archive_builders():
+    from libsw import build_index, builder
+    builders = []
+    # dependencies are built without being enabled, so they are mirrored too
+    slug_list = build_index.get_list_with_dependants(build_index.enabled_slugs() or [])
+    for slug in slug_list:
+        target = build_index.get_builder(slug)
+        if target and isinstance(target, builder.AbstractArchiveBuilder):
+            builders.append(target)
+    return builders
+
+def _installed_version(target):
+    installed = target.get_installed_version()
+    if installed and installed != '0':
+        return [str(installed)]
+    return []
+
+def sync(log):
+    """
+    Download the current source archive of every enabled package and their
+    dependencies into the mirror and remove archives of versions that are neither installed nor
+    current. Packages whose current version can not be looked up keep all of
+    their mirrored archives. Packages built from git are not mirrored.
+
+    Args:
+        log - An open log file
+
+    Return:
+        An array of slugs that could not be mirrored
+    """
+    failed = []
+    keep = {}
+    for target in _archive_builders():
+        source_version = target.updated_version_reference()
+        keep[target.slug] = _installed_version(target)
+        if not source_version:
+            failed.append(target.slug)
+            # the current version is unknown, such as when offline, so none of
+            # the mirrored versions are removed
+            for entry in _read_index(target.slug).values():
+                keep[target.slug].append(entry['version'])
+            continue
+        target.source_version = source_version
+        keep[target.slug].append(str(source_version))
+        url = target.get_source_url()
+        log.log('Mirroring ' + target.slug + ' ' + str(source_version))
+        if not prefetch(target.slug, source_version, url, log, target.get_source_checksum):
+            failed.append(target.slug)
+    for path in evict(keep):
+        log.log('Removed ' + path)
+    return failed
+
+def prune(log):
+    """
+    Remove mirrored archives of versions that are neither installed nor the
+    newest mirrored version of an enabled package or dependency. Nothing is
+    downloaded.
+
+    Args:
+        log - An open log file
+
+    Return:
+        An array of the removed file paths
+    """
+    keep = {}
+    for target in _archive_builders():
+        keep[target.slug] = _installed_version(target)
+        latest = latest_version(target.slug)
+        if latest:
+            keep[target.slug].append(latest)
+    removed = evict(keep)
+    for path in removed:
+        log.log('Removed ' + path)
+    return removed
@@ -2,7 +2,6 @@
 
 import re
 import os
-import inquirer
 from pwd import getpwnam
 from grp import getgrnam
 from libsw import file_filter, user
@@ -184,6 +183,7 @@ def select_key(query_message, username, enabled='any'):
         enabled - (optional) You can set this value to True or False to restrict
             the selection to enabled or disabled keys respectivly.
     """
+    import inquirer
     key_dicts = get_user_keys(username)
     key_array = []
     display_array = []
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import subprocess
+from libsw import settings
+
+unit_name = 'sw-update-status'
+cron_file = '/etc/cron.d/sitewrangler-update-status'
+
+def status_dir():
+    """The directory that holds the update status snapshots."""
+    return settings.get('install_path') + 'var/cache/update-status/'
+
+def snapshot_path(name):
+    """
+    The path of an update status snapshot.
+
+    Args:
+        name - Either "build" or "deploy"
+    """
+    return status_dir() + name + '.json'
+
+def read(name):
+    """
+    Get an update status snapshot or False if none has been written. The
+    snapshot is a dictionary with the keys checked (a timestamp) and entries.
+    Build entries have the keys slug, status, installed and available. Deploy
+    entries have the keys host, slug and status.
+
+    Args:
+        name - Either "build" or "deploy"
+    """
+    path = snapshot_path(name)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except ValueError:
+        return False
+
+def write(name, entries, **extra):
+    """
+    Save an update status snapshot.
+
+    Args:
+        name - Either "build" or "deploy"
+        entries - An array of entry dictionaries, see read()
+        extra - Additional keys to store in the snapshot
+    """
+    snapshot = dict(extra, checked=int(time.time()), entries=entries)
+    path = snapshot_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file, indent=1)
+    os.replace(path + '.part', path)
+    return snapshot
+
+def forget(name):
+    """
+    Remove a snapshot that no longer matches the system, such as after
+    packages were built or deployed.
+
+    Args:
+        name - Either "build" or "deploy"
+    """
+    path = snapshot_path(name)
+    if os.path.exists(path):
+        os.remove(path)
+
+def age(snapshot):
+    """Get the number of seconds since a snapshot was taken."""
+    return max(0, time.time() - snapshot['checked'])
+
+def is_stale(snapshot):
+    """Returns True if a snapshot is older than the build_cache_age setting."""
+    return age(snapshot) > settings.get_num('build_cache_age')
+
+def format_age(snapshot):
+    """Describe the age of a snapshot, such as "5 minutes ago"."""
+    seconds = int(age(snapshot))
+    for unit, size in [['day', 86400], ['hour', 3600], ['minute', 60]]:
+        if seconds >= size:
+            count = seconds // size
+            return str(count) + ' ' + unit + ('s' if count != 1 else '') + ' ago'
+    return 'just now'
+
+def check_builds():
+    """
+    Check every enabled package for updates and save the result as the build
+    snapshot. This contacts the upstream websites of every package.
+
+    Return:
+        The new snapshot
+    """
+    from libsw import build_queue, build_index
+    build_index.Index().refresh()
+    queue = build_queue.new_queue(False)
+    build_index.populate_enabled(queue)
+    build_index.populate_dependant_builders(queue)
+    statuses = {}
+    for slug, status in queue.run_check():
+        statuses[slug] = status
+    entries = []
+    for builder, status in queue.queue:
+        try:
+            installed = str(builder.version_reference()).strip()
+        except Exception:
+            installed = ''
+        entries.append({
+            'slug': builder.slug,
+            'status': statuses.get(builder.slug, 'current'),
+            'installed': installed,
+            'available': str(builder.available_version) if builder.available_version else ''
+        })
+    return write('build', entries)
+
+def check_deploys():
+    """
+    Compare the locally built packages with every production server and save
+    the result as the deploy snapshot. Servers are not checked while local
+    packages need updating.
+
+    Return:
+        The new snapshot
+    """
+    from libsw import build_queue, build_index, deploy, logger
+    queue = build_queue.new_queue()
+    build_index.Index().populate_builders(queue)
+    if len(queue.run_check()) > 0:
+        return write('deploy', [], local_updates=True)
+    entries = []
+    def check_host(ip):
+        host = deploy.HostDeployment(ip, queue, False, logger.Log(False))
+        return host.status_list()
+    for host_entries in deploy._for_each_host(check_host):
+        entries.extend(host_entries)
+    return write('deploy', entries, local_updates=False)
+
+def refresh():
+    """
+    Rewrite the build snapshot, and the deploy snapshot on build servers with
+    registered production servers. Only one refresh runs at a time.
+
+    Return:
+        False if another refresh was already running, otherwise True
+    """
+    from libsw import deploy
+    os.makedirs(status_dir(), exist_ok=True)
+    with open(status_dir() + 'refresh.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        check_builds()
+        if settings.get_bool('build_server') and len(deploy.get_registered_ips()) > 0:
+            check_deploys()
+    return True
+
+def refresh_in_background():
+    """
+    Start a refresh in a detached process so that a stale snapshot can be
+    shown right away.
+    """
+    script = os.path.join(settings.get('install_path'), 'bin/sitewrangler.py')
+    subprocess.Popen([sys.executable, script, 'build', 'refreshstatus'],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True)
+
+def _refresh_interval():
+    # refresh twice per cache age so that snapshots are never stale
+    return max(300, settings.get_num('build_cache_age') // 2)
+
+def _refresh_command():
+    # cron's PATH does not include /usr/local/bin, where sw is linked
+    import shlex
+    script = os.path.join(settings.get('install_path'), 'bin/sitewrangler.py')
+    return shlex.quote(sys.executable) + ' ' + shlex.quote(script) + ' build refreshstatus'
+
+def enable_refresher(log):
+    """
+    Refresh the snapshots on a schedule with a systemd timer, or with a cron
+    entry on systems without systemd.
+
+    Args:
+        log - An open logger
+    """
+    from libsw import builder, service
+    if shutil.which('systemctl') == None:
+        hours = max(1, _refresh_interval() // 3600)
+        with open(cron_file, 'w') as cron:
+            cron.write('# Managed by Site Wrangler, see "sw build refreshstatus"\n')
+            cron.write('17 */' + str(hours) + ' * * * root ' + _refresh_command() + ' >/dev/null 2>&1\n')
+        log.log('Wrote ' + cron_file)
+        return
+    unit_path = builder.get_systemd_config_path() + unit_name
+    with open(unit_path + '.service', 'w') as unit_file:
+        unit_file.write('[Unit]\n')
+        unit_file.write('Description=Site Wrangler update status refresh\n')
+        unit_file.write('After=network-online.target\n\n')
+        unit_file.write('[Service]\n')
+        unit_file.write('Type=oneshot\n')
+        unit_file.write('Nice=10\n')
+        unit_file.write('ExecStart=' + _refresh_command() + '\n')
+    with open(unit_path + '.timer', 'w') as unit_file:
+        unit_file.write('[Unit]\n')
+        unit_file.write('Description=Refresh the Site Wrangler update status\n\n')
+        unit_file.write('[Timer]\n')
+        unit_file.write('OnBootSec=10min\n')
+        unit_file.write('OnUnitActiveSec=' + str(_refresh_interval()) + 's\n')
+        unit_file.write('RandomizedDelaySec=5min\n')
+        unit_file.write('Persistent=true\n\n')
+        unit_file.write('[Install]\n')
+        unit_file.write('WantedBy=timers.target\n')
+    service.reload_init(log)
+    log.run(['systemctl', 'enable', '--now', unit_name + '.timer'])
+    log.log('Enabled ' + unit_name + '.timer')
+
+def disable_refresher(log):
+    """
+    Stop refreshing the snapshots on a schedule.
+
+    Args:
+        log - An open logger
+    """
+    from libsw import builder, service
+    if os.path.exists(cron_file):
+        os.remove(cron_file)
+        log.log('Removed ' + cron_file)
+    unit_path = builder.get_systemd_config_path() + unit_name
+    if os.path.exists(unit_path + '.timer'):
+        log.run(['systemctl', 'disable', '--now', unit_name + '.timer'])
+        os.remove(unit_path + '.timer')
+        os.remove(unit_path + '.service')
+        service.reload_init(log)
+        log.log('Disabled ' + unit_name + '.timer')
+
+def pending_slugs():
+    """
+    Get the slugs that needed an update or rebuild at the last check, without
+    checking again. Used for autocompletion.
+    """
+    snapshot = read('build')
+    if not snapshot:
+        return []
+    slugs = []
+    for entry in snapshot['entries']:
+        if entry['status'] in ['update', 'depend']:
+            slugs.append(entry['slug'])
+    return slugs
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
 import subprocess
-import inquirer
 import pwd
 import os
 from pwd import getpwnam
 from grp import getgrnam
+from libsw import completion_cache
 
 def get_user_list(include_root=False):
     """
@@ -45,6 +45,7 @@ def select_user(allow_root=False):
     Args:
         allow_root - (optional) Include the root user in the list (True or False)
     """
+    import inquirer
     user_list = get_user_list(allow_root)
     questions = [
         inquirer.List('u',
@@ -139,6 +140,7 @@ def make_user(username):
     make_user_dir(home_directory + 'logs/', uid, gid)
     make_user_dir(home_directory + 'etc/', uid, gid)
     make_user_file(bash_profile, uid, gid)
+    completion_cache.invalidate('users')
     with open(bash_profile, 'a+') as profile:
         profile.write('''
 if [ -f ~/.bashrc ]; then
@@ -166,6 +168,7 @@ def remove_user(username, deletefiles):
         userdel.append('-r')
     userdel.append(username)
     output = subprocess.run(userdel)
+    completion_cache.invalidate('users')
     return output.returncode == 0
 
 def select_new_username():
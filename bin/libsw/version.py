@@ -36,6 +36,32 @@ def first_is_higher(v1: str, v2: str, case_insensitive=True):
         i += 1
     return higher
 
+def sort_key(v: str, case_insensitive=True):
+    """
+    Get a key for sorting version strings that orders them the same way as
+    first_is_higher(), so a list can be sorted once instead of being compared
+    pair by pair. As with first_is_higher(), a version ranks above longer
+    versions that start with the same segments. Segments that mix numbers and
+    letters, such as "2rc1", are ordered by their leading number.
+
+    Args:
+        v - The version string
+    """
+    if v.startswith('v'): v = v[1:]
+    key = []
+    for node in v.split('.'):
+        if case_insensitive:
+            node = node.lower()
+        number = re.match(r'[0-9]*', node).group(0)
+        if len(number) > 0:
+            # segments such as "2rc1" sort by their number first
+            key.append((0, int(number), node[len(number):]))
+        else:
+            key.append((1, 0, node))
+    # the end of a version sorts above any further segment
+    key.append((2, 0, ''))
+    return tuple(key)
+
 def get_tree(version):
     """
     Break a version number up and create a dictionary that contains the version
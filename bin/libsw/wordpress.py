@@ -4,9 +4,7 @@ import os
 import time
 import subprocess
 import random
-import inquirer
 import stat
-import requests
 from libsw import builder, php, nginx, user, bind, cert, db, settings, input_util
 from getpass import getpass
 from mysql import connector
@@ -30,6 +28,7 @@ def select_installation(query_message):
     Args:
         query_message - The message to display to the user in the prompt
     """
+    import inquirer
     domain_list = list_installations()
     questions = [
         inquirer.List('f',
@@ -327,7 +326,7 @@ def add_cron(sys_user):
             break
     if not found:
         minute = random.randint(0,59)
-        cron = str(minute) + ' 0 * * * ' + builder.set_sh_ld + '~/.local/bin/php ~/public_html/wp-cron.php'
+        cron = str(minute) + ' 0 * * * ' + builder.set_sh_ld() + '~/.local/bin/php ~/public_html/wp-cron.php'
         command = "su - " + sys_user + " -c \"crontab -l 2>/dev/null | { cat; echo '" + cron + "'; } | crontab -\" "
         #print(command)
         subprocess.getoutput(command)
@@ -369,7 +368,7 @@ def get_outdated(domain):
     wp_path = settings.get('build_path') + 'wp-cli/wp-cli.phar'
     docroot = nginx.docroot_from_domain(domain)
     sys_user = nginx.user_from_domain(domain)
-    command_start = "su - " + sys_user + " -c '" + builder.set_sh_ld + 'php ' + wp_path + " "
+    command_start = "su - " + sys_user + " -c '" + builder.set_sh_ld() + 'php ' + wp_path + " "
     command_end = " --format=csv 2>/dev/null | tail -n +2'"
     core = subprocess.getoutput(command_start + "core check-update --path=\"" + docroot + "\" --fields=update_type" + command_end)
     themes = subprocess.getoutput(command_start + "theme list --path=\"" + docroot + "\" --update=available --fields=name" + command_end)
@@ -393,12 +392,14 @@ def get_site_home(sys_user, docroot):
     return home
 
 def install_wp_cli():
+    from libsw import http_client
     install_directory = settings.get('build_path') + 'wp-cli/'
     download_url = 'https://raw.githubusercontent.com/wp-cli/builds/gh-pages/phar/wp-cli.phar'
     save_file = install_directory + 'wp-cli.phar'
     if not os.path.exists(install_directory):
         os.makedirs(install_directory)
-    response = requests.get(download_url)
+    response = http_client.get(download_url)
+    response.raise_for_status()
     with open(save_file, "wb") as f:
         f.write(response.content)
     old_mode = os.stat(save_file)
@@ -410,5 +411,5 @@ def run_cli(user, docroot, cli_args):
     """
     wp_path = settings.get('build_path') + 'wp-cli/wp-cli.phar'
     cli_args = cli_args.replace('\\', '\\\\').replace("'", "\\'").replace('$', '\\$').replace('`', '\\`')
-    command = "su - " + user + " -c '" + builder.set_sh_ld + 'php ' + wp_path + ' --path="' + docroot + '" ' + cli_args + "'"
+    command = "su - " + user + " -c '" + builder.set_sh_ld() + 'php ' + wp_path + ' --path="' + docroot + '" ' + cli_args + "'"
     return subprocess.getoutput(command, errors=os.devnull)